@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""Micro-benchmark of JobQueue scheduling decisions
+
+   Drives a JobQueue with fake jobs that finish in the order they were
+   started, so only the cost of the scheduling bookkeeping is measured.
+
+   Usage: python -m benchmarks.jobqueuebench [size ...]
+"""
+
+import sys
+import time
+import logging
+
+from deployerlib import log
+
+log.set_level(logging.WARNING)
+
+from deployerlib.jobqueue import JobQueue
+from deployerlib.tests._fakejob import FakeJob
+
+
+def build_queue(size, max_running=30, per_host=1, jobs_per_host=10):
+    """A queue of size jobs in two stages, with chains of two jobs per host"""
+
+    results = {}
+    queue = JobQueue(results, max_running, per_host, event_driven=True)
+    queue.set_group_limits(0, max_running, per_host)
+    queue.set_group_limits(1, max_running / 2)
+    jobs = []
+
+    for idx in range(size):
+        host = 'host{0}'.format(idx / jobs_per_host)
+        depends = None
+
+        if idx % 2:
+            depends = jobs[-1].name
+
+        jobs.append(FakeJob('job{0}'.format(idx), host, idx % 4 / 2, depends))
+
+    queue.append(jobs)
+    queue.close()
+
+    return queue, results
+
+
+def run(size):
+    """Schedule size jobs to completion, returns the number of decisions and seconds taken"""
+
+    queue, results = build_queue(size)
+    decisions = 0
+    start = time.time()
+
+    queue._prepare()
+
+    while queue._queued or queue._running:
+        before = len(queue._running)
+        queue._fill()
+        decisions += len(queue._running) - before
+
+        job = queue._running[0]
+        job.exitcode = 0
+        results[job.name] = True
+        queue._reap([job])
+
+    return decisions, time.time() - start
+
+
+def main(sizes):
+    print '{0:>8} {1:>10} {2:>10} {3:>14}'.format('jobs', 'decisions', 'seconds', 'us/decision')
+
+    for size in sizes:
+        decisions, elapsed = run(size)
+        print '{0:>8} {1:>10} {2:>10.3f} {3:>14.1f}'.format(size, decisions, elapsed, elapsed * 1000000 / decisions)
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [100, 1000, 10000, 50000])
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""Benchmark of the deployer's own overhead on large platforms
+
+   Generates a synthetic platform config and release directory of
+   services x hostgroups x hosts, then times each step of a deployment:
+   loading the Config, generating the task list with GeneratorHelper,
+   parsing it with Executor, and executing it with JobQueue against the
+   simulated transport, so no remote hosts are needed. For each step the
+   throughput and the peak memory used so far are reported.
+
+   Usage: python -m benchmarks.scalebench [--services N] [--hostgroups M] [--hosts K]
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+
+import yaml
+
+from deployerlib import log
+
+log.set_level(logging.WARNING)
+
+from deployerlib.config import Config
+from deployerlib.commandline import CommandLine
+from deployerlib.generatorhelper import GeneratorHelper
+from deployerlib.executor import Executor
+
+
+def service_name(idx):
+    return 'service{0:04d}-server'.format(idx)
+
+
+def build_config(services, hostgroups, hosts):
+    """A platform config with each service deployed to one hostgroup of hosts"""
+
+    hostgroup = {}
+    service = {}
+
+    for hg in range(hostgroups):
+        hostgroup['group{0:03d}'.format(hg)] = {
+          'hosts': ['host{0:03d}-{1:03d}.bench'.format(hg, x) for x in range(hosts)],
+        }
+
+    for idx in range(services):
+        service[service_name(idx)] = {
+          'port': 8000 + idx,
+          'hostgroups': ['group{0:03d}'.format(idx % hostgroups)],
+        }
+
+    return {
+      'platform': 'aurora',
+      'environment': 'bench',
+      'user': 'deploy',
+      'hostgroup': hostgroup,
+      'service': service,
+      'service_defaults': {
+        'destination': '/opt/tarballs',
+        'control_type': 'daemontools',
+        'install_location': '/opt/webapps',
+        'unpack_dir': '_unpack',
+        'enabled_on_hosts': 'all',
+        'min_nodes_up': hosts / 2,
+      },
+      'deployment_order': [[service_name(x) for x in range(services)]],
+      'deploy_concurrency': 50,
+      'deploy_concurrency_per_host': 2,
+      'non_deploy_concurrency': 50,
+      'non_deploy_concurrency_per_host': 2,
+      'keep_versions': 5,
+      # Load balancers cannot be simulated
+      'skip_lb_control': True,
+    }
+
+
+def build_release(directory, services):
+    """A release directory with an empty package for each service"""
+
+    release = os.path.join(directory, 'aurora-bench-20160101000000')
+    os.mkdir(release)
+
+    for idx in range(services):
+        filename = '{0}_{1:040x}-20160101000000.tar.gz'.format(service_name(idx), idx)
+
+        with open(os.path.join(release, filename), 'w') as f:
+            f.close()
+
+    return release
+
+
+def peak_memory():
+    """Peak resident memory in MB of this process and of its finished children"""
+
+    usage = [resource.getrusage(x).ru_maxrss for x in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+
+    # ru_maxrss is in bytes on OS X, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return [x / 1024.0 / 1024 for x in usage]
+
+    return [x / 1024.0 for x in usage]
+
+
+def timed(name, items, unit, function, *args, **kwargs):
+    """Call function, print the time it took and its throughput, return its result"""
+
+    start = time.time()
+    result = function(*args, **kwargs)
+    elapsed = time.time() - start
+    rss, children = peak_memory()
+
+    print '{0:<12} {1:>8} {2:<6} {3:>9.3f} {4:>12.1f} {5:>10.1f} {6:>10.1f}'.format(
+      name, items, unit, elapsed, items / elapsed if elapsed else 0, rss, children)
+
+    return result
+
+
+def count_tasks(tasklist):
+    return sum([len(x.get('tasks', [])) for x in tasklist['stages']])
+
+
+def run(services, hostgroups, hosts, latency=0.0, workers=0, execute=True, probe_cache=False):
+    """Run each step of a deployment of services to hostgroups of hosts"""
+
+    directory = tempfile.mkdtemp(prefix='scalebench')
+
+    try:
+        config_file = os.path.join(directory, 'bench.yaml')
+
+        with open(config_file, 'w') as f:
+            yaml.safe_dump(build_config(services, hostgroups, hosts), f)
+
+        release = build_release(directory, services)
+        commandline = CommandLine(require_config=False, command_line_args=['--config', config_file, '--redeploy', '--logdir', ''])
+        mapping = dict(vars(commandline), release=[release], component=None)
+
+        print '{0} services, {1} hostgroups, {2} hosts per hostgroup'.format(services, hostgroups, hosts)
+        print '{0:<12} {1:>8} {2:<6} {3:>9} {4:>12} {5:>10} {6:>10}'.format(
+          'step', 'items', '', 'seconds', 'items/sec', 'peak MB', 'jobs MB')
+
+        config = timed('config', services, 'svc', Config, mapping)
+        helper = timed('generate', services * hosts, 'deploy', GeneratorHelper, config, config.platform)
+        tasks = count_tasks(helper.tasklist)
+        executor = timed('parse', tasks, 'tasks', Executor, tasklist=helper.tasklist, transport='simulated',
+          transport_settings={'latency': latency}, workers=workers, event_driven=True, probe_cache=probe_cache)
+
+        if execute:
+            timed('execute', tasks, 'tasks', executor.run)
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the overhead of generating and executing a deployment')
+    parser.add_argument('--services', type=int, default=50, help='Number of services')
+    parser.add_argument('--hostgroups', type=int, default=5, help='Number of hostgroups, services are spread across them')
+    parser.add_argument('--hosts', type=int, default=10, help='Number of hosts in each hostgroup')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each operation takes on a simulated host')
+    parser.add_argument('--workers', type=int, default=0, help='Execute tasks in a pool of this many worker processes')
+    parser.add_argument('--probe-cache', action='store_true', help='Share the results of probes of hosts between tasks')
+    parser.add_argument('--no-execute', action='store_true', help='Only generate and parse the task list')
+    args = parser.parse_args()
+
+    run(args.services, args.hostgroups, args.hosts, args.latency, args.workers, not args.no_execute, args.probe_cache)
+
+
+if __name__ == '__main__':
+    main()
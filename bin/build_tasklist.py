@@ -11,6 +11,9 @@ from deployerlib.log import Log
 from deployerlib.commandline import CommandLine
 from deployerlib.config import Config
 from deployerlib.generatorhelper import GeneratorHelper
+from deployerlib.executor import Executor
+from deployerlib.durations import DurationStore
+from deployerlib.simulator import Simulator
 
 
 json_opts = {'indent': 4, 'sort_keys': True}
@@ -21,11 +24,29 @@ parser.add_argument('--save', help='Save the resulting task list to a file')
 component_group = parser.add_mutually_exclusive_group(required=True)
 component_group.add_argument('--component', nargs='+', help='Specify a list of components to deploy')
 component_group.add_argument('--release', '--directory', nargs='+', help='Specify a directory of components to deploy')
+simulate_group = parser.add_argument_group('simulation')
+simulate_group.add_argument('--simulate', action='store_true', help='Predict how long the task list will take to execute')
+simulate_group.add_argument('--simulate-set', action='append', default=[], metavar='KEY=VALUE',
+  help='Override a config setting before generating the task list, e.g. deploy_concurrency=5 or service_defaults.min_nodes_up=2')
+simulate_group.add_argument('--simulate-duration', action='append', default=[], metavar='COMMAND=SECONDS',
+  help='Assume that every task running COMMAND takes SECONDS')
+simulate_group.add_argument('--default-duration', type=float, default=10.0, help='Seconds taken by tasks without history')
+simulate_group.add_argument('--durations', help='Task duration database (default: durations.sqlite in the log directory)')
+simulate_group.add_argument('--dag', action='store_true', help='Simulate running all stages as one dependency graph')
+simulate_group.add_argument('--longest-first', action='store_true', help='Simulate starting the longest tasks first')
 
 args = CommandLine(parents=parser)
 config = Config(args)
 log = Log(os.path.basename(__file__))
 
+try:
+    for setting in config.simulate_set:
+        log.info('Overriding config setting: {0}'.format(setting))
+        config.override(setting)
+except DeployerException as e:
+    log.critical(str(e))
+    sys.exit(1)
+
 try:
     tasklist_builder = GeneratorHelper(config, config.platform)
 except DeployerException as e:
@@ -40,4 +61,36 @@ if tasklist_builder.verify_tasklist() and config.save:
         json.dump(tasklist_builder.tasklist, f, **json_opts)
         log.info('Saved task list to {0}'.format(config.save))
 
+if config.simulate:
+    assumed = {}
+
+    for setting in config.simulate_duration:
+        command, sep, seconds = setting.partition('=')
+
+        try:
+            assumed[command] = float(seconds)
+        except ValueError:
+            log.critical('Invalid duration {0}, expected COMMAND=SECONDS'.format(repr(setting)))
+            sys.exit(1)
+
+    if config.durations:
+        durations = DurationStore(config.durations)
+    elif config.logdir and os.path.isfile(os.path.join(config.logdir, 'durations.sqlite')):
+        durations = DurationStore(os.path.join(config.logdir, 'durations.sqlite'))
+    else:
+        log.info('No task duration history found, using assumed and default durations')
+        durations = None
+
+    try:
+        executor = Executor(tasklist=tasklist_builder.tasklist, dag=config.dag)
+        simulator = Simulator(executor, durations=durations, assumed=assumed,
+          default_duration=config.default_duration, longest_first=config.longest_first)
+        report = simulator.run()
+    except DeployerException as e:
+        log.critical('Simulation failed: {0}'.format(e))
+        sys.exit(1)
+
+    for line in Simulator.format_report(report):
+        print line
+
 log.info('Build tasklist completed. More details in {0}'.format(log.get_logfile()))
@@ -16,14 +16,70 @@ component_group = parser.add_mutually_exclusive_group(required=True)
 component_group.add_argument('--component', nargs='+', help='Specify a list of components to deploy')
 component_group.add_argument('--release', '--directory', nargs='+', help='Specify a directory of components to deploy')
 component_group.add_argument('--tasklist', help='A list of pre-generated tasks')
+parser.add_argument('--event-driven', action='store_true', help='Start queued tasks as soon as a running task exits instead of polling')
+parser.add_argument('--dag', action='store_true', help='Run all stages as one dependency graph instead of one stage at a time')
+parser.add_argument('--workers', type=int, default=0, help='Run tasks in a pool of this many long-lived worker processes')
+parser.add_argument('--journal', help='Record finished tasks in this file (default: the log file with a .journal extension)')
+parser.add_argument('--resume', metavar='JOURNAL', help='Skip tasks recorded as successful in a journal, and record finished tasks in it')
+parser.add_argument('--durations', help='Store the durations of tasks in this SQLite database (default: durations.sqlite in the log directory)')
+parser.add_argument('--inventory', help='Keep the versions on remote hosts in this SQLite database, and only scan hosts whose versions are older than inventory_ttl')
+parser.add_argument('--refresh-inventory', action='store_true', help='Scan all remote hosts for their versions, ignoring the inventory')
+parser.add_argument('--longest-first', action='store_true', help='Start the tasks with the longest expected duration first')
+parser.add_argument('--agent', action='store_true', help='Execute commands on remote hosts through an agent started on each host (requires --workers)')
+parser.add_argument('--probe-cache', action='store_true', help='Reuse the results of file checks on remote hosts until the files are changed')
+parser.add_argument('--transport', choices=['ssh', 'local', 'simulated'], default='ssh',
+  help='How to reach remote hosts: over SSH, by running commands locally, or on simulated in-memory hosts')
+parser.add_argument('--simulated-latency', type=float, default=0.0, help='Seconds each operation takes on a simulated host')
 
 args = CommandLine(parents=parser, require_config=False)
 log = Log(os.path.basename(__file__))
 more_details_msg = 'More details in {0}'.format(log.get_logfile())
 
+if args.agent and not args.workers:
+    log.critical('--agent requires --workers, so that agents are kept between tasks')
+    sys.exit(1)
+
+if args.resume:
+
+    if not os.path.isfile(args.resume):
+        log.critical('Journal not found: {0}'.format(args.resume))
+        sys.exit(1)
+
+    journal = args.resume
+elif args.journal:
+    journal = args.journal
+elif log.get_logfile():
+    journal = '{0}.journal'.format(os.path.splitext(log.get_logfile())[0])
+else:
+    journal = None
+
+if args.durations:
+    durations = args.durations
+elif args.logdir:
+    durations = os.path.join(args.logdir, 'durations.sqlite')
+else:
+    durations = None
+
+executor_args = {
+  'event_driven': args.event_driven,
+  'dag': args.dag,
+  'workers': args.workers,
+  'journal': journal,
+  'resume': bool(args.resume),
+  'durations': durations,
+  'longest_first': args.longest_first,
+  'agent': args.agent,
+  'probe_cache': args.probe_cache,
+  'transport': args.transport,
+  'inventory': args.inventory,
+}
+
+if args.transport == 'simulated':
+    executor_args['transport_settings'] = {'latency': args.simulated_latency}
+
 if args.tasklist:
     log.debug('Executing based on tasklist: {0}'.format(args.tasklist))
-    executor = Executor(filename=args.tasklist)
+    executor = Executor(filename=args.tasklist, **executor_args)
 elif args.config:
     log.debug('Executing based on config file: {0}'.format(args.config))
     config = Config(args)
@@ -38,7 +94,7 @@ elif args.config:
         log.warning('Nothing to deploy. {0}'.format(more_details_msg))
         sys.exit(0)
 
-    executor = Executor(tasklist=tasklist_builder.tasklist)
+    executor = Executor(tasklist=tasklist_builder.tasklist, **executor_args)
 else:
     log.critical('Please specify either --config or --tasklist')
     sys.exit(1)
@@ -51,6 +107,10 @@ try:
     executor.run()
 except DeployerException as e:
     log.critical('Execution failed: {0}. {1}'.format(e, more_details_msg))
+
+    if journal:
+        log.info('To retry the failed tasks, run again with --resume {0}'.format(journal))
+
     sys.exit(1)
 
 log.info('Deployment completed. {0}'.format(more_details_msg))
@@ -0,0 +1,188 @@
+"""Deployer agent
+
+   Executes batches of deployer operations on the host it runs on. A batch
+   is read from stdin as a json line:
+
+       {"id": 1, "operations": [{"op": "run", "command": "uptime"}, ...], "stop_on_failure": true}
+
+   The result of each operation is written to stdout as a json line as soon
+   as the operation has finished, followed by a line marking the end of the
+   batch:
+
+       {"id": 1, "index": 0, "ok": true, "return_code": 0, "output": "..."}
+       {"id": 1, "done": true}
+
+   The agent is sent to the host by AgentClient over an existing SSH
+   connection, so it must only use the standard library, and run on any
+   Python from 2.6.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+
+
+def run(command):
+    """Run a shell command, return its exit code and output
+
+       Unlike fabric, which runs commands in a login shell (bash -l -c), the
+       agent does not read the profile of the user, so commands run with the
+       environment of the agent's SSH session.
+    """
+
+    if not isinstance(command, str):
+        # json gives unicode on Python 2
+        command = command.encode('utf-8')
+
+    process = subprocess.Popen(['/bin/bash', '-c', command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+
+    # Output that is not valid UTF-8 must not stop json from writing the result
+    output = output.decode('utf-8', 'replace')
+
+    return process.returncode, output.strip()
+
+
+def result(ok, return_code=None, output=''):
+
+    if return_code is None:
+        return_code = 0 if ok else 1
+
+    return {'ok': ok, 'return_code': return_code, 'output': output}
+
+
+def op_run(command):
+    return_code, output = run(command)
+
+    return result(return_code == 0, return_code, output)
+
+
+def op_exists(path):
+    """Same test as fabric.contrib.files.exists, variables and wildcards are expanded"""
+
+    return_code, output = run('test -e "$(echo {0})"'.format(path))
+
+    return result(return_code == 0, return_code)
+
+
+def op_move(source, destination, clobber=True):
+
+    if os.path.lexists(destination):
+
+        if not clobber:
+            return result(False, output='Target already exists: {0}'.format(destination))
+
+        op_remove(destination)
+
+    shutil.move(source, destination)
+
+    return result(True)
+
+
+def op_symlink(source, destination):
+
+    if os.path.islink(destination):
+
+        if os.readlink(destination) == source:
+            return result(True, output='Symlink {0} already points to {1}'.format(destination, source))
+
+        os.remove(destination)
+
+    os.symlink(source, destination)
+
+    return result(True)
+
+
+def op_remove(path):
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+    return result(not os.path.lexists(path))
+
+
+def op_wait(command, want_state=0, timeout=60, interval=1, fail_above=None):
+    """Run command until it exits with want_state, or until timeout
+
+       Gives up as soon as the exit code is above fail_above, if it is set.
+    """
+
+    max_time = time.time() + timeout
+
+    while True:
+        return_code, output = run(command)
+
+        if return_code == want_state:
+            return result(True, return_code, output)
+
+        if fail_above is not None and return_code > fail_above:
+            break
+
+        if time.time() + interval > max_time:
+            break
+
+        time.sleep(interval)
+
+    return result(False, return_code, output)
+
+
+operations = {
+  'run': op_run,
+  'exists': op_exists,
+  'move': op_move,
+  'symlink': op_symlink,
+  'remove': op_remove,
+  'wait': op_wait,
+}
+
+
+def execute(operation):
+    """Execute a single operation, never raising an exception"""
+
+    args = dict([(str(x), y) for x, y in operation.items() if x != 'op'])
+
+    if not operation.get('op') in operations:
+        return result(False, output='Unknown operation: {0}'.format(operation.get('op')))
+
+    try:
+        return operations[operation['op']](**args)
+    except Exception as e:
+        return result(False, output='{0}: {1}'.format(e.__class__.__name__, e))
+
+
+def main(stdin=sys.stdin, stdout=sys.stdout):
+
+    def write(message):
+        stdout.write(json.dumps(message) + '\n')
+        stdout.flush()
+
+    while True:
+        line = stdin.readline()
+
+        if not line:
+            break
+
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({'id': None, 'done': True, 'error': 'Invalid request: {0}'.format(e)})
+            continue
+
+        for index, operation in enumerate(request.get('operations', [])):
+            res = execute(operation)
+            res.update({'id': request.get('id'), 'index': index})
+            write(res)
+
+            if not res['ok'] and request.get('stop_on_failure'):
+                break
+
+        write({'id': request.get('id'), 'done': True})
+
+
+if __name__ == '__main__':
+    main()
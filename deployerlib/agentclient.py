@@ -0,0 +1,145 @@
+import sys
+import json
+import inspect
+import subprocess
+
+from fabric.api import env
+from fabric.state import connections
+from fabric.context_managers import settings
+
+from deployerlib import agent
+from deployerlib.log import Log
+from deployerlib.exceptions import DeployerException
+
+
+class AgentResult(str):
+    """The output of an agent operation, with the attributes of a fabric result"""
+
+    def __new__(cls, result):
+        output = result.get('output', '')
+
+        if isinstance(output, unicode):
+            output = output.encode('utf-8')
+
+        res = str.__new__(cls, output)
+        res.return_code = result.get('return_code')
+        res.succeeded = bool(result.get('ok'))
+        res.failed = not res.succeeded
+
+        return res
+
+
+class AgentClient(object):
+    """Send batches of operations to a deployer agent (see deployerlib.agent)
+
+       The agent is started with a short bootstrap command that reads the
+       agent's source from the first line of its input, so nothing needs to be
+       installed on the host. stdin and stdout are the agent's input and
+       output streams, for example the pipes of a subprocess or the files of
+       an SSH channel.
+    """
+
+    bootstrap = 'import sys, json; exec(json.loads(sys.stdin.readline()))'
+
+    def __init__(self, stdin, stdout, name='agent'):
+        self.log = Log(self.__class__.__name__, tag=name)
+        self.stdin = stdin
+        self.stdout = stdout
+        self._request_id = 0
+
+        self._write(inspect.getsource(agent))
+
+    @classmethod
+    def command(cls, python='python'):
+        """The command that starts an agent"""
+
+        return "{0} -u -c '{1}'".format(python, cls.bootstrap)
+
+    @classmethod
+    def local(cls, python=sys.executable):
+        """Start an agent in a local subprocess"""
+
+        process = subprocess.Popen(cls.command(python), shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        client = cls(process.stdin, process.stdout, name='local')
+        client.process = process
+
+        return client
+
+    @classmethod
+    def ssh(cls, hostname, python='python'):
+        """Start an agent on a remote host, over fabric's connection to the host"""
+
+        with settings(host_string=hostname):
+            transport = connections[env.host_string].get_transport()
+
+        channel = transport.open_session()
+        channel.exec_command(cls.command(python))
+
+        client = cls(channel.makefile('wb'), channel.makefile('rb'), name=hostname)
+        client.channel = channel
+
+        return client
+
+    def _write(self, message):
+
+        try:
+            self.stdin.write(json.dumps(message) + '\n')
+            self.stdin.flush()
+        except (IOError, OSError) as e:
+            raise DeployerException('Unable to send to agent: {0}'.format(e))
+
+    def batch(self, operations, stop_on_failure=True):
+        """Send a batch of operations, yielding the result of each as it arrives
+           If stop_on_failure is True, the agent skips the operations after
+           the first one that fails
+        """
+
+        self._request_id += 1
+        request_id = self._request_id
+
+        self.log.hidebug('Sending {0} operations to agent'.format(len(operations)))
+        self._write({'id': request_id, 'operations': operations, 'stop_on_failure': stop_on_failure})
+
+        while True:
+            line = self.stdout.readline()
+
+            if not line:
+                raise DeployerException('Agent exited while executing operations')
+
+            try:
+                result = json.loads(line)
+            except ValueError:
+                raise DeployerException('Invalid output from agent: {0}'.format(line.rstrip()))
+
+            if result.get('id') != request_id:
+                self.log.debug('Discarding agent output for another request: {0}'.format(line.rstrip()))
+                continue
+
+            if result.get('done'):
+                break
+
+            yield result
+
+    def call(self, op, **args):
+        """Execute a single operation and return its result as an AgentResult"""
+
+        operation = dict(args, op=op)
+        results = list(self.batch([operation]))
+
+        if not results:
+            raise DeployerException('No result from agent for operation {0}'.format(op))
+
+        return AgentResult(results[0])
+
+    def close(self):
+
+        try:
+            self.stdin.close()
+        except (IOError, OSError):
+            pass
+
+        if hasattr(self, 'process'):
+            self.process.wait()
+
+        if hasattr(self, 'channel'):
+            self.channel.close()
@@ -0,0 +1,75 @@
+import os
+import hashlib
+
+from deployerlib.log import Log
+from deployerlib.exceptions import DeployerException
+
+
+class ChecksumCache(object):
+    """Checksums of local files, computed once for each version of a file
+
+       Files are identified by their path, size and modification time, so a
+       file that is replaced is checksummed again. Files are read in chunks,
+       so memory use does not depend on the size of a package.
+    """
+
+    def __init__(self, chunk_size=1024 * 1024):
+        self.log = Log(self.__class__.__name__)
+        self.chunk_size = chunk_size
+        self._checksums = {}
+
+    def __len__(self):
+        return len(self._checksums)
+
+    def get(self, path, algorithm='md5'):
+        """Return the hex digest of a file"""
+
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise DeployerException('Unable to checksum {0}: {1}'.format(path, e))
+
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime, algorithm)
+
+        if not key in self._checksums:
+            self._checksums[key] = self.compute(path, algorithm)
+        else:
+            self.log.hidebug('Using cached {0} checksum of {1}'.format(algorithm, path))
+
+        return self._checksums[key]
+
+    def compute(self, path, algorithm='md5'):
+        """Read a file in chunks and return its hex digest"""
+
+        self.log.debug('Computing {0} checksum of {1}'.format(algorithm, path))
+
+        try:
+            digest = hashlib.new(algorithm)
+        except ValueError:
+            raise DeployerException('Unsupported checksum algorithm: {0}'.format(algorithm))
+
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), ''):
+                    digest.update(chunk)
+        except IOError as e:
+            raise DeployerException('Unable to checksum {0}: {1}'.format(path, e))
+
+        return digest.hexdigest()
+
+
+def command_algorithm(checksum_command):
+    """Return the hashlib algorithm matching a checksum command such as
+       /usr/bin/md5sum or sha1sum, or None if there is none
+    """
+
+    name = os.path.basename(checksum_command or '')
+
+    if name.endswith('sum') and name[:-3] in hashlib.algorithms:
+        return name[:-3]
+
+
+# Shared by all commands of a process. Generators put the checksum of each
+# package in its upload tasks, so the commands only need this for task lists
+# written without them
+checksums = ChecksumCache()
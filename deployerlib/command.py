@@ -13,8 +13,13 @@ class Command(object):
 
        Commands can optionally override the initialize() method in order to verify
        input or provide further initialization.
+
+       Commands which send data to hosts set transferred to the number of bytes
+       execute() actually sent, which the executor uses to report throughput.
     """
 
+    transferred = None
+
     def __init__(self, **kwargs):
         self.tag = kwargs.pop('tag', None)
         self.log = Log(instance=self.__class__.__name__, tag=self.tag)
@@ -61,5 +66,11 @@ class Command(object):
         duration = int(time.time() - start_time)
         self.log.verbose('Task execution finished, duration {0} seconds'.format(duration))
 
+        # Details are sent before the result, so they have arrived when it has
+        record = getattr(remote_results, 'record', None)
+
+        if record and self.transferred is not None:
+            record(procname, 'transferred', self.transferred)
+
         remote_results[procname] = res
         return res
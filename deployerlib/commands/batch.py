@@ -0,0 +1,104 @@
+from deployerlib.command import Command
+from deployerlib.commands import copyfile, createdirectory, movefile, removefile, symlink
+
+
+class Batch(Command):
+    """Run a list of remote commands on one host as a single shell program
+
+       Each step is a task for one of the commands in batchable, which can
+       express their execute() method as a shell script. Steps are run in
+       order in one remote call, and the exit code of each step is read back
+       from a marker line. As in a list of tasks, the first step that fails
+       stops the batch.
+    """
+
+    batchable = {
+      'copyfile': copyfile.CopyFile,
+      'createdirectory': createdirectory.CreateDirectory,
+      'movefile': movefile.MoveFile,
+      'removefile': removefile.RemoveFile,
+      'symlink': symlink.SymLink,
+    }
+
+    marker = '__DEPLOYER_STEP__'
+
+    def initialize(self, remote_host, steps):
+
+        if not steps:
+            self.log.critical('No steps specified')
+            return False
+
+        for step in steps:
+            if not step.get('command') in self.batchable:
+                self.log.critical('Command can not be batched: {0}'.format(step.get('command')))
+                return False
+
+        return True
+
+    def build_steps(self):
+        """Instantiate the Command of each step"""
+
+        commands = []
+
+        for step in self.steps:
+            args = step.copy()
+            callable = self.batchable[args.pop('command')]
+            commands.append(callable(remote_host=self.remote_host, **args))
+
+        return commands
+
+    def script(self, commands):
+        """Build a shell program that runs each command in a subshell and reports its exit code"""
+
+        lines = []
+
+        for idx, command in enumerate(commands):
+            lines.append('(\n{0}\n)'.format(command.script()))
+            lines.append('rc=$?; echo "{0} {1} $rc"; [ $rc -eq 0 ] || exit $rc'.format(self.marker, idx))
+
+        return '\n'.join(lines)
+
+    def parse_output(self, output):
+        """Return the output and exit code of each step that has finished, and the output of a step that did not"""
+
+        results = []
+        lines = []
+
+        for line in output.splitlines():
+            if line.startswith(self.marker + ' '):
+                results.append((lines, int(line.split()[2])))
+                lines = []
+            else:
+                lines.append(line)
+
+        return results, lines
+
+    def log_failure(self, command, lines, message):
+        """Log the output of a failed step, the last line being the reason it failed"""
+
+        for line in lines[:-1]:
+            command.log.info(line)
+
+        command.log.critical(lines[-1] if lines else message)
+
+    def execute(self):
+        commands = self.build_steps()
+
+        self.log.info('Running {0} steps in one remote call'.format(len(commands)))
+        res = self.remote_host.execute_remote(self.script(commands))
+        results, remaining = self.parse_output(res)
+
+        for command, (lines, exit_code) in zip(commands, results):
+
+            if exit_code:
+                self.log_failure(command, lines, 'Step failed with exit code {0}'.format(exit_code))
+                return False
+
+            for line in lines:
+                command.log.info(line)
+
+        if len(results) < len(commands):
+            self.log_failure(commands[len(results)], remaining, 'Step did not complete: {0}'.format(res))
+            return False
+
+        return res.succeeded
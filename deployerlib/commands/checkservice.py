@@ -14,21 +14,38 @@ class CheckService(Command):
     def execute(self):
         """Probe a service to make sure it's in the correct state"""
 
+        # An agent polls on the host itself, saving a round trip per check
+        if self.remote_host.use_agent:
+            res = self.wait()
+        else:
+            res = self.poll()
+
+        if res.return_code != self.want_state and res.return_code > 3:
+            self.log.critical('Failed to execute {0}: {1}'.format(self.check_command, res))
+            return False
+
+        msg = str(res).split('|', 1)[0].rstrip()
+
+        if res.return_code == self.want_state:
+            self.log.debug('Check result: {0}'.format(msg))
+            self.log.info('Service is in the correct state')
+            return True
+        else:
+            self.log.critical('Service is not in the correct state within configured timeout of {0} seconds: {1}'.format(self.timeout, msg))
+            return False
+
+    def poll(self):
+        """Execute the check until the service is in the correct state, the check fails, or timeout expires"""
+
         last_notify = time.time()
         max_time = time.time() + self.timeout
-        success = False
 
         while time.time() < max_time:
             res = self.remote_host.execute_remote(self.check_command)
 
-            if res.return_code == self.want_state:
-                success = True
+            if res.return_code == self.want_state or res.return_code > 3:
                 break
 
-            if res.return_code > 3:
-                self.log.critical('Failed to execute {0}: {1}'.format(self.check_command, res))
-                return False
-
             if self.notify_interval and (time.time() - last_notify) > self.notify_interval:
                 time_left = int(5 * round(max_time - time.time()) / 5)
                 self.log.info('Will wait up to {0} more seconds for service to enter correct state'.format(
@@ -37,12 +54,29 @@ class CheckService(Command):
 
             time.sleep(1)
 
-        msg = str(res).split('|', 1)[0].rstrip()
+        return res
 
-        if success:
-            self.log.debug('Check result: {0}'.format(msg))
-            self.log.info('Service is in the correct state')
-            return True
-        else:
-            self.log.critical('Service is not in the correct state within configured timeout of {0} seconds: {1}'.format(self.timeout, msg))
-            return False
+    def wait(self):
+        """Have the agent execute the check on the host, in rounds of
+           notify_interval seconds so that the progress is still logged
+        """
+
+        max_time = time.time() + self.timeout
+
+        while True:
+            time_left = max_time - time.time()
+
+            if self.notify_interval:
+                timeout = min(self.notify_interval, time_left)
+            else:
+                timeout = time_left
+
+            res = self.remote_host.wait_for_state(self.check_command, self.want_state, max(timeout, 0), fail_above=3)
+
+            if res.return_code == self.want_state or res.return_code > 3 or max_time - time.time() < 1:
+                break
+
+            time_left = int(5 * round(max_time - time.time()) / 5)
+            self.log.info('Will wait up to {0} more seconds for service to enter correct state'.format(time_left))
+
+        return res
@@ -51,3 +51,22 @@ class CopyFile(Command):
             self.log.critical('Failed to copy {0} to {1}: {2}'.format(self.source, self.destination, res))
 
         return res.succeeded
+
+    def script(self):
+        """The equivalent of execute() as a shell script, for use in a Batch"""
+
+        if self.source == self.destination:
+            return 'echo "Copy {0}: source and destination are the same"'.format(self.source)
+
+        if self.remove_if_exists:
+            exists = 'echo "Removing {1}"; /bin/rm -rf {1} && ! test -e {1} || {{ echo "Failed to remove {1}"; exit 1; }}'
+        elif not self.continue_if_exists:
+            exists = 'echo "Failed to copy {0} to {1}: Destination already exists"; exit 1'
+        else:
+            exists = 'true'
+
+        return '\n'.join([
+          'if test -e {1}; then ' + exists + '; fi',
+          'echo "Copying {0} to {1}"',
+          '{2} {0} {1} || {{ echo "Failed to copy {0} to {1}"; exit 1; }}',
+        ]).format(self.source, self.destination, ' '.join(self.args))
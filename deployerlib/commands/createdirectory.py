@@ -33,3 +33,17 @@ class CreateDirectory(Command):
             self.log.critical('Failed to create directory {0}: {1}'.format(self.source, res))
 
         return res.succeeded
+
+    def script(self):
+        """The equivalent of execute() as a shell script, for use in a Batch"""
+
+        if self.clobber:
+            exists = 'echo "Removing directory {0}"; rm -rf {0} || {{ echo "Failed to remove {0}"; exit 1; }}'
+        else:
+            exists = 'echo "Directory already exists: {0}"; exit 0'
+
+        return '\n'.join([
+          'if test -e {0}; then ' + exists + '; fi',
+          'echo "Creating directory {0}"',
+          'mkdir -p {0} || {{ echo "Failed to create directory {0}"; exit 1; }}',
+        ]).format(self.source)
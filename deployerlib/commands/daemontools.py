@@ -94,7 +94,7 @@ class DaemonTools(Command):
             return True
 
         command = '/usr/sbin/update-service --add /var/lib/supervise/{0} {0}'.format(self.servicename)
-        res = self.remote_host.execute_remote(command, use_sudo=True)
+        res = self.remote_host.execute_remote(command, use_sudo=True, changes=[self.service_path()])
 
         if not self._check_enabled():
             self.log.critical('Failed to register daemontools service {0}: {1}'.format(self.servicename, res))
@@ -115,7 +115,7 @@ class DaemonTools(Command):
             return True
 
         command = '/usr/sbin/update-service --remove /var/lib/supervise/{0} {0}'.format(self.servicename)
-        res = self.remote_host.execute_remote(command, use_sudo=True)
+        res = self.remote_host.execute_remote(command, use_sudo=True, changes=[self.service_path()])
 
         if self._check_enabled():
             self.log.critical('Failed to unregister daemontools service {0}: {1}'.format(self.servicename, res))
@@ -141,13 +141,19 @@ class DaemonTools(Command):
     def _check_enabled(self):
         """Check whether or not a daemontools service is registered"""
 
-        res = self.remote_host.execute_remote('/usr/sbin/update-service --list {0}'.format(self.servicename))
+        res = self.remote_host.execute_probe('/usr/sbin/update-service --list {0}'.format(self.servicename),
+          paths=[self.service_path()])
 
         state = {True: 'registered', False: 'unregistered'}
         self.log.hidebug('Service {0} is currently {1}'.format(self.servicename, state.get(res.succeeded)))
 
         return res.succeeded
 
+    def service_path(self):
+        """The path update-service registers the service at"""
+
+        return '/etc/service/{0}'.format(self.servicename)
+
     def _wait(self, want_state, timeout):
         """Wait for a service to enter a given state"""
 
@@ -0,0 +1,95 @@
+import os
+import fnmatch
+
+from deployerlib.commands.upload import Upload
+
+
+class DeltaUpload(Upload):
+    """Upload a file by sending only what differs from a previous version
+
+       The newest file in destination matching basis_filespec is copied to
+       the name of the new file, and the new file is then synced over it with
+       rsync, which only sends the blocks that changed. The result is verified
+       with checksum_command, and if there is no previous version or the
+       delta transfer fails, the whole file is uploaded instead.
+    """
+
+    def initialize(self, remote_host, source, destination, basis_filespec, checksum_command='/usr/bin/md5sum',
+      checksum=None, artifacts=None):
+
+        self.remote_file = os.path.join(destination, os.path.basename(source))
+
+        return super(DeltaUpload, self).initialize(remote_host, source, destination, checksum_command, checksum,
+          artifacts)
+
+    def execute(self, procname=None, remote_results={}):
+
+        if self.checksum_command and self.already_uploaded():
+            self.log.info('Package has already been uploaded')
+            return True
+
+        basis = self.find_basis()
+
+        if basis:
+
+            if self.sync_from(basis) and self.verify():
+                return True
+
+            self.log.warning('Delta transfer of {0} failed, uploading the whole file'.format(
+              os.path.basename(self.source)))
+
+        if not self.upload():
+            return False
+
+        if not self.verify():
+            self.log.critical('Uploaded file {0} is corrupt'.format(os.path.basename(self.source)))
+            return False
+
+        return True
+
+    def find_basis(self):
+        """Return the newest previous version of the file in destination"""
+
+        if self.artifacts is not None:
+            files = [os.path.join(self.destination, x) for x in self.artifacts]
+            files = [x for x in files if x != self.remote_file and fnmatch.fnmatch(os.path.basename(x), self.basis_filespec)]
+            return files[0] if files else None
+
+        res = self.remote_host.execute_remote('/bin/ls -1Atd {0}/{1}'.format(self.destination, self.basis_filespec),
+          output_hidebug=True)
+
+        if res.failed:
+            self.log.debug('No previous versions found: {0}'.format(res))
+            return None
+
+        files = [os.path.join(self.destination, x) for x in res.split()]
+        files = [x for x in files if x != self.remote_file and fnmatch.fnmatch(os.path.basename(x), self.basis_filespec)]
+
+        if not files:
+            self.log.debug('No previous versions found in {0}'.format(self.destination))
+            return None
+
+        return files[0]
+
+    def sync_from(self, basis):
+        """Transfer the file as a delta against basis"""
+
+        self.log.info('Uploading {0} as a delta against {1}'.format(os.path.basename(self.source),
+          os.path.basename(basis)))
+
+        res = self.remote_host.execute_remote('/bin/cp -p {0} {1}'.format(basis, self.remote_file))
+
+        if res.failed:
+            self.log.debug('Failed to copy {0}: {1}'.format(basis, res))
+            return False
+
+        res = self.remote_host.sync_remote(self.source, self.remote_file)
+
+        if res.succeeded:
+            # Count the whole file if the transport cannot tell what rsync sent
+            if res.transferred is None:
+                self.transferred += os.path.getsize(self.source)
+            else:
+                self.transferred += res.transferred
+
+        return res.succeeded
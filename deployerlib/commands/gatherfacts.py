@@ -0,0 +1,121 @@
+import os
+import pipes
+
+from deployerlib.command import Command
+
+
+class GatherFacts(Command):
+    """Gather facts about a host in a single remote command
+
+       The facts are stored in host_facts[hostname] as a dict of:
+         links: {link path: link target} of the services in install_locations
+         properties: {properties name: version} from properties_version files
+         daemontools: {service: {'supervised': bool, 'registered': bool, 'status': str}}
+         free_kb: {path: free kilobytes} of the filesystems of disk_paths
+         artifacts: {directory: [filename, ...]} of the files matching each
+           artifact filespec, newest first
+    """
+
+    def initialize(self, remote_host, host_facts, install_locations={}, properties_defs=[], daemontools=[],
+      disk_paths=[], artifacts=[], supervise_path='/var/lib/supervise'):
+        """install_locations is a dict of {install_location: [service, ...]}
+           properties_defs is a list of (properties name, properties_location)
+           daemontools is a list of services to check in daemontools
+           artifacts is a list of (directory, filespec)
+        """
+
+        self.install_locations = install_locations
+        self.properties_defs = properties_defs
+        self.daemontools = daemontools
+        self.disk_paths = disk_paths
+        self.artifacts = artifacts
+        self.supervise_path = supervise_path
+
+        return True
+
+    def execute(self):
+
+        res = self.remote_host.execute_remote(self.get_script(), output_hidebug=True, changes=[])
+
+        if res.failed:
+            self.log.critical('Failed to gather facts: {0}'.format(res))
+            return False
+
+        facts = self.parse(res)
+        self.host_facts[self.remote_host.hostname] = facts
+        self.log.debug('Gathered {0} links, {1} properties versions, {2} daemontools services and {3} artifacts'.format(
+          len(facts['links']), len(facts['properties']), len(facts['daemontools']),
+          sum([len(x) for x in facts['artifacts'].values()])))
+
+        return True
+
+    def get_script(self):
+        """Return a shell script which prints one tab separated fact per line"""
+
+        script = []
+
+        for install_location, services in sorted(self.install_locations.items()):
+            names = ' -o '.join(['-name {0}'.format(pipes.quote(x)) for x in services])
+            script.append("/usr/bin/find {0} -maxdepth 1 -type l \\( {1} \\) -printf 'link\\t%p\\t%l\\n' 2>/dev/null".format(
+              pipes.quote(install_location), names))
+
+        for prop_name, prop_path in self.properties_defs:
+            version_file = pipes.quote(os.path.join(prop_path, 'properties_version'))
+            script.append("[ -r {0} ] && printf 'properties\\t%s\\t%s\\n' {1} \"$(/bin/cat {0})\"".format(
+              version_file, pipes.quote(prop_name)))
+
+        for servicename in self.daemontools:
+            name = pipes.quote(servicename)
+            service_path = pipes.quote(os.path.join('/etc/service', servicename))
+            script.append("[ -e {0} ] && printf 'supervised\\t%s\\n' {1}".format(
+              pipes.quote(os.path.join(self.supervise_path, servicename)), name))
+            script.append("[ -e {0} ] && printf 'svstat\\t%s\\t%s\\n' {1} \"$(/usr/bin/svstat {0} 2>&1)\"".format(
+              service_path, name))
+
+        for path in self.disk_paths:
+            script.append("/bin/df -Pk {0} 2>/dev/null | awk -v p={0} 'NR == 2 {{ printf \"free\\t%s\\t%s\\n\", p, $4 }}'".format(
+              pipes.quote(path)))
+
+        for directory, filespec in self.artifacts:
+            script.append("for f in $(cd {0} 2>/dev/null && /bin/ls -1At {1} 2>/dev/null); do printf 'artifact\\t%s\\t%s\\n' {0} \"$f\"; done".format(
+              pipes.quote(directory), filespec))
+
+        # Facts which are not found are left out, they do not fail the script
+        script.append('true')
+
+        return '; '.join(script)
+
+    def parse(self, output):
+        """Parse the output of the script into a dict of facts"""
+
+        facts = {
+          'links': {},
+          'properties': {},
+          'daemontools': {},
+          'free_kb': {},
+          'artifacts': dict([(x, []) for x, y in self.artifacts]),
+        }
+
+        for servicename in self.daemontools:
+            facts['daemontools'][servicename] = {'supervised': False, 'registered': False, 'status': None}
+
+        for line in output.splitlines():
+            fields = line.rstrip('\r').split('\t')
+
+            if fields[0] == 'link' and len(fields) == 3:
+                facts['links'][fields[1]] = fields[2]
+            elif fields[0] == 'properties' and len(fields) == 3:
+                facts['properties'][fields[1]] = fields[2]
+            elif fields[0] == 'supervised' and fields[1:] and fields[1] in facts['daemontools']:
+                facts['daemontools'][fields[1]]['supervised'] = True
+            elif fields[0] == 'svstat' and len(fields) == 3 and fields[1] in facts['daemontools']:
+                # e.g. "/etc/service/name: up (pid 123) 45 seconds"
+                status = fields[2].split(': ', 1)[-1].split()
+                facts['daemontools'][fields[1]]['registered'] = True
+                facts['daemontools'][fields[1]]['status'] = status[0] if status else None
+            elif fields[0] == 'free' and len(fields) == 3 and fields[2].isdigit():
+                facts['free_kb'][fields[1]] = int(fields[2])
+            elif fields[0] == 'artifact' and len(fields) == 3:
+                facts['artifacts'].setdefault(fields[1], []).append(fields[2])
+
+        return facts
@@ -15,6 +15,16 @@ class MoveFile(Command):
             self.log.info('Move {0}: source and destination are the same'.format(self.source))
             return True
 
+        if self.remote_host.use_agent:
+            self.log.info('Renaming {0} to {1}'.format(self.source, self.destination))
+            res = self.remote_host.call_agent('move', changes=[self.source, self.destination], source=self.source,
+              destination=self.destination, clobber=self.clobber)
+
+            if res.failed:
+                self.log.critical('Failed to rename {0} to {1}: {2}'.format(self.source, self.destination, res))
+
+            return res.succeeded
+
         if self.remote_host.file_exists(self.destination):
 
             if self.clobber:
@@ -38,3 +48,20 @@ class MoveFile(Command):
             self.log.critical('Failed to rename {0} to {1}'.format(self.source, self.destination))
 
         return res.succeeded
+
+    def script(self):
+        """The equivalent of execute() as a shell script, for use in a Batch"""
+
+        if self.source == self.destination:
+            return 'echo "Move {0}: source and destination are the same"'.format(self.source)
+
+        if self.clobber:
+            exists = 'echo "Removing {0}"; /bin/rm -rf {0} && ! test -e {0} || {{ echo "Failed to remove {0}"; exit 1; }}'
+        else:
+            exists = 'echo "Unable to rename {1} to {0}: target already exists"; exit 1'
+
+        return '\n'.join([
+          'if test -e {0}; then ' + exists + '; fi',
+          'echo "Renaming {1} to {0}"',
+          'mv {1} {0} || {{ echo "Failed to rename {1} to {0}"; exit 1; }}',
+        ]).format(self.destination, self.source)
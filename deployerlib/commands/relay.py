@@ -0,0 +1,77 @@
+import os
+
+from deployerlib.commands.upload import Upload
+
+
+class Relay(Upload):
+    """Copy a file to a host from a peer that already has it
+
+       The host copies the file from source_host with copy_command. The copy
+       is verified with checksum_command, and if it fails or does not match,
+       the file is uploaded from the deployer instead. Without source_host
+       the file is uploaded from the deployer and verified, as the first hop
+       of a relay.
+    """
+
+    def initialize(self, remote_host, source, destination, source_host=None, checksum_command='/usr/bin/md5sum',
+      checksum=None, copy_command='scp -B', artifacts=None, strict_host_keys=True, forward_agent=False):
+        """If strict_host_keys is False, the host accepts the host key of its
+           peer without checking it against its known_hosts
+           If forward_agent is True, the deployer's SSH agent is forwarded to
+           the host to log in to its peer, which lets the host use the keys
+           of the agent while the copy runs
+        """
+
+        self.source_host = source_host
+        self.copy_command = copy_command
+        self.strict_host_keys = strict_host_keys
+        self.forward_agent = forward_agent
+
+        return super(Relay, self).initialize(remote_host, source, destination, checksum_command, checksum, artifacts)
+
+    def execute(self, procname=None, remote_results={}):
+
+        if self.checksum_command and self.already_uploaded():
+            self.log.info('Package has already been uploaded')
+            return True
+
+        if self.source_host:
+
+            if self.copy_from_peer() and self.verify():
+                return True
+
+            self.log.warning('Unable to copy {0} from {1}, uploading it instead'.format(
+              os.path.basename(self.source), self.source_host))
+
+        if not self.upload():
+            return False
+
+        if not self.verify():
+            self.log.critical('Uploaded file {0} is corrupt'.format(os.path.basename(self.source)))
+            return False
+
+        return True
+
+    def copy_from_peer(self):
+        """Copy the file from source_host, return True if the copy succeeded"""
+
+        remote_file = os.path.join(self.destination, os.path.basename(self.source))
+
+        if self.remote_host.username:
+            peer = '{0}@{1}'.format(self.remote_host.username, self.source_host)
+        else:
+            peer = self.source_host
+
+        if self.strict_host_keys:
+            host_key_checking = 'yes'
+        else:
+            host_key_checking = 'no'
+
+        self.log.info('Copying {0} from {1}'.format(os.path.basename(self.source), self.source_host))
+        res = self.remote_host.execute_remote('{0} -o StrictHostKeyChecking={1} {2}:{3} {4}'.format(self.copy_command,
+          host_key_checking, peer, remote_file, remote_file), forward_agent=self.forward_agent)
+
+        if res.failed:
+            self.log.debug('Failed to copy {0} from {1}: {2}'.format(remote_file, self.source_host, res))
+
+        return res.succeeded
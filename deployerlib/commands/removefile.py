@@ -11,6 +11,16 @@ class RemoveFile(Command):
         """Remove the file or directory"""
 
         self.log.info('Removing file: {0}'.format(self.source))
+
+        if self.remote_host.use_agent:
+            # The agent checks that the file is gone as part of the operation
+            res = self.remote_host.call_agent('remove', changes=[self.source], path=self.source)
+
+            if res.failed:
+                self.log.critical('Failed to remove {0}: {1}'.format(self.source, res))
+
+            return res.succeeded
+
         res = self.remote_host.execute_remote('/bin/rm -rf {0}'.format(self.source))
 
         if res.succeeded:
@@ -24,3 +34,12 @@ class RemoveFile(Command):
             return False
 
         return res.succeeded
+
+    def script(self):
+        """The equivalent of execute() as a shell script, for use in a Batch"""
+
+        return '\n'.join([
+          'echo "Removing file: {0}"',
+          '/bin/rm -rf {0} || {{ echo "Failed to remove {0}"; exit 1; }}',
+          '! test -e {0} || {{ echo "Failed to remove {0}: File still exists after removal"; exit 1; }}',
+        ]).format(self.source)
@@ -8,7 +8,9 @@ class SymLink(Command):
     def initialize(self, remote_host, source, destination):
         return True
 
-    def execute(self):
+    def link_source(self):
+        """Return the target of the link and the path of the target on the remote host"""
+
         # make sure link target is relative if dest_dir and src_dir are the same
         dest_dir = os.path.dirname(self.destination)
         src_dir  = os.path.dirname(self.source)
@@ -22,9 +24,14 @@ class SymLink(Command):
         else:
             src_path = os.path.join(dest_dir, source)
 
+        return source, src_path
+
+    def execute(self):
+        source, src_path = self.link_source()
+
         # check if src_path exists on remote_host
         self.log.debug('Checking if link target {0} exists'.format(src_path))
-        res = self.remote_host.execute_remote('/bin/ls -d {0}'.format(src_path))
+        res = self.remote_host.execute_probe('/bin/ls -d {0}'.format(src_path))
 
         if res.succeeded:
             if res == src_path:
@@ -36,9 +43,20 @@ class SymLink(Command):
             self.log.critical('Failed to find link target {0}: {1}'.format(src_path, res))
             return False
 
+        if self.remote_host.use_agent:
+            self.log.info('Creating symlink {0} pointing to {1}'.format(self.destination, source))
+            res = self.remote_host.call_agent('symlink', changes=[self.destination], source=source,
+              destination=self.destination)
+
+            if res.failed:
+                self.log.critical('Failed to symlink {0} to {1}: {2}'.format(source, self.destination, res))
+            elif res:
+                self.log.info(res)
+
+            return res.succeeded
 
         self.log.debug('Checking for an existing link {0}'.format(self.destination))
-        res = self.remote_host.execute_remote('/bin/readlink {0}'.format(self.destination))
+        res = self.remote_host.execute_probe('/bin/readlink {0}'.format(self.destination))
 
         if res.succeeded:
             if res == source:
@@ -70,3 +88,19 @@ class SymLink(Command):
             return False
 
         return res.succeeded
+
+    def script(self):
+        """The equivalent of execute() as a shell script, for use in a Batch"""
+
+        source, src_path = self.link_source()
+
+        return '\n'.join([
+          '/bin/ls -d {2} >/dev/null || {{ echo "Failed to find link target {2}"; exit 1; }}',
+          'if current=$(/bin/readlink {1}); then',
+          '  if [ "$current" = "{0}" ]; then echo "Symlink {1} already points to {0}"; exit 0; fi',
+          '  rm {1} || {{ echo "Unable to remove old symlink {1}"; exit 1; }}',
+          'fi',
+          'echo "Creating symlink {1} pointing to {0}"',
+          'ln -s {0} {1} || {{ echo "Failed to symlink {0} to {1}"; exit 1; }}',
+          'test -e {1} || {{ echo "Symlink to {0} failed: {1} was not created"; exit 1; }}',
+        ]).format(source, self.destination, src_path)
@@ -1,17 +1,34 @@
 import os
 
-from subprocess import check_output
+from subprocess import check_output, CalledProcessError
 
 from deployerlib.command import Command
+from deployerlib.checksum import checksums, command_algorithm
+from deployerlib.exceptions import DeployerException
 
 
 class Upload(Command):
     """Upload files to a server"""
 
-    def initialize(self, remote_host, source, destination, checksum_command='/usr/bin/md5sum'):
-        """Pass checksum_command=None to skip checksum"""
+    # Nothing is sent when the file is already on the host
+    transferred = 0
+
+    def initialize(self, remote_host, source, destination, checksum_command='/usr/bin/md5sum', checksum=None,
+      artifacts=None):
+        """Pass checksum_command=None to skip checksum
+           checksum is the checksum of source as given by checksum_command.
+           Generators give it in the task, so the file is read once when the
+           task list is generated. Otherwise it is computed when it is first
+           needed by execute() (see local_checksum)
+           artifacts is the list of files in destination from the host's facts
+           (see GatherFacts). If source is not among them, it is not looked for
+           on the host before uploading
+        """
 
         self.checksum_command = checksum_command
+        self.checksum = checksum
+        self.artifacts = artifacts
+
         return True
 
     def execute(self, procname=None, remote_results={}):
@@ -20,11 +37,16 @@ class Upload(Command):
         # Skip upload if remote file is already in place
         if self.checksum_command:
 
-            if self.match_checksum():
+            if self.already_uploaded():
                 self.log.debug('File {0} already exists in {1}'.format(self.source, self.destination))
                 self.log.info('Package has already been uploaded'.format(self.source))
                 return True
 
+        return self.upload()
+
+    def upload(self):
+        """Upload the whole file from the deployer"""
+
         self.log.info('Uploading {0}'.format(self.source))
 
         res = self.remote_host.put_remote(self.source, self.destination)
@@ -37,18 +59,65 @@ class Upload(Command):
         self.log.debug('Uploaded {0} to {1} on {2}'.format(self.source,
           self.destination, self.remote_host.hostname))
 
+        self.transferred += os.path.getsize(self.source)
+
         return res.succeeded
 
+    def verify(self):
+        """Check the checksum of the file on the host after a transfer"""
+
+        if not self.checksum_command:
+            return True
+
+        if self.match_checksum():
+            self.log.debug('Verified {0}'.format(os.path.basename(self.source)))
+            return True
+
+        self.log.warning('Checksum of {0} on {1} does not match'.format(os.path.basename(self.source),
+          self.remote_host.hostname))
+
+        return False
+
+    def already_uploaded(self):
+        """Check whether the file is already on the host"""
+
+        if self.artifacts is not None and not os.path.basename(self.source) in self.artifacts:
+            self.log.hidebug('{0} is not in {1}'.format(os.path.basename(self.source), self.destination))
+            return False
+
+        return self.match_checksum()
+
+    def local_checksum(self):
+        """Return the checksum of source, or None if checksum_command is not
+           named after a hashlib algorithm
+           Checksums are cached by the process, see ChecksumCache
+        """
+
+        if not self.checksum and self.checksum_command:
+            algorithm = command_algorithm(self.checksum_command)
+
+            if algorithm:
+                try:
+                    self.checksum = checksums.get(self.source, algorithm)
+                except DeployerException as e:
+                    self.log.debug(str(e))
+
+        return self.checksum
+
     def match_checksum(self):
         """Compare source and destination file checksums"""
 
-        try:
-            out = check_output([self.checksum_command, self.source])
-        except OSError as e:
-            self.log.debug('Failed to checksum local file {0}: {1}'.format(self.source, e))
-            return False
+        if self.local_checksum():
+            local_checksum = self.checksum
+        else:
+
+            try:
+                out = check_output([self.checksum_command, self.source])
+            except (OSError, CalledProcessError) as e:
+                self.log.debug('Failed to checksum local file {0}: {1}'.format(self.source, e))
+                return False
 
-        local_checksum = out.split()[0]
+            local_checksum = out.split()[0]
 
         remote_file = os.path.join(self.destination, os.path.basename(self.source))
         res = self.remote_host.execute_remote('{0} {1}'.format(self.checksum_command, remote_file))
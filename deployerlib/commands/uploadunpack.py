@@ -0,0 +1,129 @@
+import os
+import pipes
+
+from deployerlib.commands.upload import Upload
+
+
+class UploadUnpack(Upload):
+    """Upload a package and unpack it in one pass
+
+       The local package is streamed over the connection to the host straight
+       into tar in unpack_dir, so it is not written to disk and read back. The
+       stream is checksummed on the host with checksum_command as it is
+       unpacked and compared with the checksum of the local package. With
+       keep_copy, the stream is also written to destination, where it is found
+       by cleanup and rollback as if it had been uploaded; when that copy is
+       already in place it is unpacked without uploading it again.
+    """
+
+    def initialize(self, remote_host, source, destination, unpack_dir, keep_copy=True,
+      checksum_command='/usr/bin/md5sum', checksum=None, artifacts=None):
+
+        self.keep_copy = keep_copy
+        self.remote_file = os.path.join(destination, os.path.basename(source))
+        self.extract_command = self.get_extract_command()
+
+        if not self.extract_command:
+            self.log.critical('{0} class doesn\'t know how to unpack file: {1}'.format(
+              self.__class__.__name__, self.source))
+            return False
+
+        return super(UploadUnpack, self).initialize(remote_host, source, destination, checksum_command, checksum,
+          artifacts)
+
+    def get_extract_command(self):
+        """Based on the file extension, determine the command line to unpack
+           the package from standard input
+        """
+
+        if self.source.endswith('.tar.gz') or self.source.endswith('.tgz'):
+            command = '/bin/tar xzf - -C {0}'.format(self.unpack_dir)
+        elif self.source.endswith('.tar'):
+            command = '/bin/tar xf - -C {0}'.format(self.unpack_dir)
+        elif self.source.endswith('.war'):
+            command = '/bin/cat > {0}'.format(os.path.join(self.unpack_dir, os.path.basename(self.source)))
+        else:
+            return False
+
+        self.log.debug('Using extract command: {0}'.format(command))
+
+        return command
+
+    def get_stream_command(self):
+        """The command on the host that receives the stream"""
+
+        directories = [self.unpack_dir]
+        tee = []
+
+        if self.keep_copy:
+            directories.append(self.destination)
+            tee.append(self.remote_file)
+
+        if self.checksum_command:
+            # The stream is copied to fd 3, which goes to the checksum
+            # command, while the output of tar goes to stderr
+            tee.append('/dev/fd/3')
+            extract = '{{ /usr/bin/tee {0} | {1} 1>&2; }} 3>&1 | {2}'.format(' '.join(tee),
+              self.extract_command, self.checksum_command)
+        elif tee:
+            extract = '/usr/bin/tee {0} | {1}'.format(' '.join(tee), self.extract_command)
+        else:
+            extract = self.extract_command
+
+        command = 'set -o pipefail; /bin/mkdir -p {0} && {1}'.format(' '.join(directories), extract)
+
+        return '/bin/bash -c {0}'.format(pipes.quote(command))
+
+    def execute(self, procname=None, remote_results={}):
+        """Stream the package into its unpack directory"""
+
+        if self.keep_copy and self.checksum_command and self.already_uploaded():
+            self.log.info('Package has already been uploaded, unpacking {0}'.format(self.remote_file))
+            return self.unpack_copy()
+
+        self.log.info('Uploading and unpacking {0}'.format(self.source))
+        res = self.remote_host.stream_remote(self.source, self.get_stream_command())
+
+        if res.failed:
+            self.log.critical('Failed to unpack {0} on {1}:{2}: {3}'.format(
+              self.source, self.remote_host.hostname, self.unpack_dir, res))
+            self.remove_copy()
+            return False
+
+        self.transferred += os.path.getsize(self.source)
+
+        if self.checksum_command and self.local_checksum():
+            # Anything tar wrote to stderr comes before the checksum
+            lines = res.splitlines()
+            remote_checksum = lines[-1].split()[0] if lines and lines[-1].split() else None
+
+            if remote_checksum != self.checksum:
+                self.log.critical('Streamed file {0} is corrupt: checksum {1}, expected {2}'.format(
+                  os.path.basename(self.source), remote_checksum, self.checksum))
+                self.remove_copy()
+                return False
+
+            self.log.debug('Verified {0}'.format(os.path.basename(self.source)))
+
+        return True
+
+    def unpack_copy(self):
+        """Unpack the copy of the package kept in destination"""
+
+        extract = self.extract_command.replace(' - ', ' {0} '.format(self.remote_file), 1)
+
+        if self.source.endswith('.war'):
+            extract = '/bin/cp {0} {1}'.format(self.remote_file, self.unpack_dir)
+
+        res = self.remote_host.execute_remote('/bin/mkdir -p {0} && {1}'.format(self.unpack_dir, extract))
+
+        if res.failed:
+            self.log.critical('Unpack failed: {0}'.format(res))
+
+        return res.succeeded
+
+    def remove_copy(self):
+        """Remove a partial or corrupt copy of the package from destination"""
+
+        if self.keep_copy:
+            self.remote_host.execute_remote('/bin/rm -f {0}'.format(self.remote_file))
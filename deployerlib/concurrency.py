@@ -0,0 +1,67 @@
+from deployerlib.log import Log
+
+
+class AdaptiveConcurrency(object):
+    """Adjust the number of jobs allowed to run at once based on how they perform
+
+       The limit starts at minimum. Each time a window of jobs has finished,
+       the window is compared with the best window seen so far:
+       - if the share of failed jobs is above error_threshold, or the average
+         duration has grown by more than latency_tolerance, the limit is
+         multiplied by backoff (but not below minimum)
+       - otherwise the limit is doubled until the first back-off, and
+         increased by one after that (but not above maximum)
+    """
+
+    def __init__(self, minimum, maximum, latency_tolerance=1.5, error_threshold=0.1, backoff=0.5, name=''):
+        self.log = Log(self.__class__.__name__, tag=name)
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.backoff = backoff
+        self.limit = self.minimum
+        self.baseline = None
+        self._threshold = self.maximum
+        self._durations = []
+        self._failures = 0
+
+    def window(self):
+        """Number of finished jobs to base a decision on"""
+
+        return max(2, self.limit / 2)
+
+    def update(self, duration, success=True):
+        """Add a finished job, returns the new limit"""
+
+        self._durations.append(duration)
+
+        if not success:
+            self._failures += 1
+
+        if len(self._durations) < self.window():
+            return self.limit
+
+        latency = sum(self._durations) / len(self._durations)
+        error_rate = float(self._failures) / len(self._durations)
+        self._durations = []
+        self._failures = 0
+
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+
+        previous = self.limit
+
+        if error_rate > self.error_threshold or latency > self.baseline * self.latency_tolerance:
+            self.limit = max(self.minimum, int(self.limit * self.backoff))
+            self._threshold = self.limit
+        elif self.limit < self._threshold:
+            self.limit = min(self.maximum, self._threshold, self.limit * 2)
+        else:
+            self.limit = min(self.maximum, self.limit + 1)
+
+        if self.limit != previous:
+            self.log.debug('Concurrency {0} -> {1} (average duration {2:.1f}s, baseline {3:.1f}s, {4:.0%} failed)'.format(
+              previous, self.limit, latency, self.baseline, error_rate))
+
+        return self.limit
@@ -121,6 +121,29 @@ class Config(AttrDict):
             raise DeployerException('No key "{0}" found in config'.format(configtype))
         return None
 
+    def override(self, setting):
+        """Change a setting given as 'key=value', where key is a dot-separated path
+           e.g. 'deploy_concurrency=5' or 'service_defaults.min_nodes_up=2'
+        """
+
+        if not '=' in setting:
+            raise DeployerException('Invalid setting {0}, expected key=value'.format(repr(setting)))
+
+        path, value = setting.split('=', 1)
+        keys = path.split('.')
+        section = self
+
+        for key in keys[:-1]:
+            if not key in section or not isinstance(section[key], dict):
+                raise DeployerException('No section "{0}" found in config for setting {1}'.format(key, path))
+
+            section = section[key]
+
+        section[keys[-1]] = yaml.safe_load(value)
+
+        # Attribute access uses copies made when the item was set, refresh them
+        self[keys[0]] = self[keys[0]]
+
     def get_lb(self, servicename, hostname):
         """Return the load balancer that controls supplied service on supplied host"""
 
@@ -579,6 +602,14 @@ class Config(AttrDict):
                     'type': bool,
                     'options': ['allow_none'],
                     },
+                'inventory': {
+                    'type': str,
+                    'options': ['allow_none'],
+                    },
+                'refresh_inventory': {
+                    'type': bool,
+                    'options': ['allow_none'],
+                    },
                 'verbose': {
                     'type': bool,
                     'options': ['allow_none'],
@@ -633,6 +664,69 @@ class Config(AttrDict):
                     'allowed_range': (0,30),
                     'options': ['mandatory'],
                     },
+                'deploy_concurrency_max': {
+                    'type': int,
+                    'allowed_range': (0,100),
+                    },
+                'non_deploy_concurrency_max': {
+                    'type': int,
+                    'allowed_range': (0,100),
+                    },
+                'resource_limits': {
+                    'type': dict,
+                    'allowed_struct': {
+                        're/^[a-zA-Z0-9_.:-]+$/': {
+                            'type': int,
+                            'allowed_range': (1,100),
+                            },
+                        },
+                    },
+                'batch_commands': {
+                    'type': bool,
+                    },
+                'upload_unpack': {
+                    'type': bool,
+                    },
+                'upload_unpack_keep_copy': {
+                    'type': bool,
+                    },
+                'upload_delta': {
+                    'type': bool,
+                    },
+                'inventory_ttl': {
+                    'type': int,
+                    'allowed_range': (0,604800),
+                    },
+                'upload_window': {
+                    'type': dict,
+                    'allowed_struct': {
+                        'megabytes': {
+                            'type': int,
+                            'allowed_range': (1,1000000),
+                            },
+                        'subnet_megabytes': {
+                            'type': int,
+                            'allowed_range': (1,1000000),
+                            },
+                        'subnet_prefix': {
+                            'type': int,
+                            'allowed_range': (8,32),
+                            },
+                        },
+                    },
+                'upload_relay': {
+                    'type': dict,
+                    'allowed_struct': {
+                        'seeds': {
+                            'type': int,
+                            'allowed_range': (1,100),
+                            },
+                        'fanout': {
+                            'type': int,
+                            'allowed_range': (1,20),
+                            },
+                        },
+                    },
                 'prep_concurrency': {
                     'type': int,
                     'allowed_range': (0,30),
@@ -0,0 +1,103 @@
+import time
+import sqlite3
+
+from deployerlib.log import Log
+from deployerlib.exceptions import DeployerException
+
+
+class DurationStore(object):
+    """Historical task durations, kept in a local SQLite database
+
+       Durations are stored per command, service and host as a moving
+       average, so recent runs weigh more than old ones. Estimates fall back
+       to the average over all hosts, then over all services, when a task
+       has not been seen before.
+    """
+
+    # Weight of a new sample in the moving average
+    weight = 0.3
+
+    def __init__(self, filename):
+        self.log = Log(self.__class__.__name__)
+        self.filename = filename
+
+        try:
+            self.db = sqlite3.connect(filename)
+            self.db.execute('CREATE TABLE IF NOT EXISTS durations ('
+              'command TEXT NOT NULL, service TEXT NOT NULL, host TEXT NOT NULL, '
+              'duration REAL NOT NULL, samples INTEGER NOT NULL, updated REAL NOT NULL, '
+              'PRIMARY KEY (command, service, host))')
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise DeployerException('Unable to open duration store {0}: {1}'.format(filename, e))
+
+        self._durations = {}
+
+        for command, service, host, duration in self.db.execute('SELECT command, service, host, duration FROM durations'):
+            self._durations[(command, service, host)] = duration
+
+        self._averages = None
+        self.log.debug('Loaded {0} durations from {1}'.format(len(self._durations), filename))
+
+    @staticmethod
+    def task_key(task, host=None):
+        """Return the (command, service, host) key of a task"""
+
+        service = task.get('tag') or task.get('servicename') or ''
+
+        return (task.get('command', ''), service, host or '')
+
+    def record(self, key, duration):
+        """Add a sample to the moving average of a task"""
+
+        command, service, host = key
+        previous = self._durations.get(key)
+
+        if previous is None:
+            average = duration
+        else:
+            average = previous + self.weight * (duration - previous)
+
+        try:
+            self.db.execute('INSERT OR IGNORE INTO durations VALUES (?, ?, ?, ?, 0, ?)',
+              (command, service, host, average, time.time()))
+            self.db.execute('UPDATE durations SET duration = ?, samples = samples + 1, updated = ? '
+              'WHERE command = ? AND service = ? AND host = ?', (average, time.time(), command, service, host))
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise DeployerException('Unable to write to duration store {0}: {1}'.format(self.filename, e))
+
+        self._durations[key] = average
+        self._averages = None
+
+    def estimate(self, key):
+        """Return the expected duration of a task, or None if it is unknown"""
+
+        if key in self._durations:
+            return self._durations[key]
+
+        if self._averages is None:
+            self._averages = self._build_averages()
+
+        command, service, host = key
+
+        for fallback in ((command, service), (command,)):
+            if fallback in self._averages:
+                return self._averages[fallback]
+
+        return None
+
+    def _build_averages(self):
+        """Average durations per command and service, and per command"""
+
+        totals = {}
+
+        for (command, service, host), duration in self._durations.items():
+            for fallback in ((command, service), (command,)):
+                count, total = totals.get(fallback, (0, 0.0))
+                totals[fallback] = (count + 1, total + duration)
+
+        return dict([(x, total / count) for x, (count, total) in totals.items()])
+
+    def close(self):
+        self.db.close()
@@ -1,26 +1,94 @@
 import os
 import json
 import time
-import signal
+import inspect
 
 from fabric.colors import green
 from fabric.network import disconnect_all
 from multiprocessing import Process
-from multiprocessing.managers import SyncManager
 
 from deployerlib.commands import *
 
 from deployerlib.log import Log
 from deployerlib.remotehost import RemoteHost
 from deployerlib.jobqueue import JobQueue
+from deployerlib.resultchannel import ResultChannel
+from deployerlib.journal import Journal
+from deployerlib.durations import DurationStore
+from deployerlib.inventory import Inventory
+from deployerlib.probecache import ProbeCache
+from deployerlib.concurrency import AdaptiveConcurrency
+from deployerlib.workerpool import WorkerPool, PoolJob
 from deployerlib.exceptions import DeployerException
 
 
 class Executor(object):
     """Build deployer objects for each component to be deployed"""
 
-    def __init__(self, filename=None, tasklist=None):
+    def __init__(self, filename=None, tasklist=None, event_driven=False, dag=False, workers=0,
+      journal=None, resume=False, durations=None, longest_first=False, agent=False, transport='ssh',
+      transport_settings=None, inventory=None, probe_cache=False):
+        """If event_driven is True, job queues wake up when a job exits rather than polling
+           If dag is True, all stages are run as a single dependency graph (see run_dag)
+           If workers is set, tasks are executed by a pool of that many long-lived
+           worker processes rather than a new process per task
+           If journal is set, finished tasks are recorded in that file. If resume
+           is also True, tasks which the journal records as successful are skipped
+           If durations is set, the durations of successful tasks are stored in that
+           file. If longest_first is also True, the tasks with the longest expected
+           path of remaining work are started first (see prioritize)
+           If agent is True, commands on remote hosts are executed by an agent
+           started on each host (see AgentClient). This needs workers, as each
+           worker keeps its agents for the tasks it executes
+           transport is the name of the Transport used to reach remote hosts
+           (see get_transport), transport_settings are passed to it
+           If inventory is set, the versions deployed by successful tasks are
+           recorded in that Inventory file
+           If probe_cache is True, the results of probes of remote hosts are
+           shared by all tasks until the paths they probed are changed (see
+           ProbeCache)
+        """
+
         self.log = Log(self.__class__.__name__)
+        self.event_driven = event_driven
+        self.dag = dag
+
+        if journal:
+            self.journal = Journal(journal)
+        elif resume:
+            raise DeployerException('Unable to resume without a journal')
+        else:
+            self.journal = None
+
+        if durations:
+            self.durations = DurationStore(durations)
+        elif longest_first:
+            raise DeployerException('Unable to order tasks by duration without a duration store')
+        else:
+            self.durations = None
+
+        if inventory:
+            self.inventory = Inventory(inventory)
+        else:
+            self.inventory = None
+
+        if probe_cache:
+            self.probe_cache = ProbeCache()
+        else:
+            self.probe_cache = None
+
+        if agent and not workers:
+            raise DeployerException('Unable to use agents without a worker pool')
+
+        self.longest_first = longest_first
+        self.agent = agent
+        self.transport = transport
+        self.transport_settings = dict(transport_settings or {})
+
+        if workers:
+            self.pool = WorkerPool(workers, self.execute_task)
+        else:
+            self.pool = None
 
         # translate external command names into class names
         self.callables = {
@@ -52,6 +120,7 @@ class Executor(object):
           'test_command': testcommand.TestCommand,
           'listdirectory': listdirectory.ListDirectory,
           'getremoteversions': getremoteversions.GetRemoteVersions,
+          'gatherfacts': gatherfacts.GatherFacts,
           'daemontools': daemontools.DaemonTools,
           'apache': apache.Apache,
           'createdeploypackage': createdeploypackage.CreateDeployPackage,
@@ -63,15 +132,16 @@ class Executor(object):
           'consul_service': consulservice.ConsulService,
           'init_script': initscript.InitScript,
           'write_local_file': writelocalfile.WriteLocalFile,
+          'batch': batch.Batch,
+          'relay': relay.Relay,
+          'upload_unpack': uploadunpack.UploadUnpack,
+          'delta_upload': deltaupload.DeltaUpload,
         }
 
-        # Start manager manually in order to have the child processes ignore
-        # SIGINT, allowing KeyboardInterrupt to be handled by the parent
-        manager = SyncManager()
-        manager.start(lambda *args: signal.signal(signal.SIGINT, signal.SIG_IGN))
-
         self.remote_hosts = []
-        self.remote_results = manager.dict()
+        self.remote_results = ResultChannel()
+        self._transfers = {}
+        self._procnames = set()
 
         if not tasklist:
 
@@ -80,7 +150,12 @@ class Executor(object):
 
             tasklist = self.read_tasklist(filename)
 
+        self.resources = self.parse_resources(tasklist.get('resources', {}))
         self.stages = self.parse_stages(tasklist)
+
+        if resume:
+            self.skip_completed()
+
         self.log.info('Tasklist loaded successfully')
 
     def read_tasklist(self, filename):
@@ -102,6 +177,51 @@ class Executor(object):
 
         return j
 
+    def parse_resources(self, resources):
+        """Parse the limits of named resources
+           Resources are a dictionary in the form:
+           {
+               '<resource name>': <Maximum total weight of jobs using the resource at once>,
+               ...
+           }
+        """
+
+        limits = {}
+
+        for name, limit in resources.items():
+
+            if type(limit) is not int or limit < 1:
+                raise DeployerException('Limit of resource {0} must be a positive integer: {1}'.format(name, limit))
+
+            limits[name] = limit
+
+        if limits:
+            self.log.debug('Resource limits: {0}'.format(', '.join(
+              ['{0}={1}'.format(x, limits[x]) for x in sorted(limits.keys())])))
+
+        return limits
+
+    def task_resources(self, task):
+        """Return the resources used by a task as a dict of names and weights
+           'resources' may be a list of names (each with a weight of 1) or a
+           dict of names and weights
+        """
+
+        resources = task.get('resources', {})
+
+        if type(resources) is list:
+            resources = dict([(x, 1) for x in resources])
+
+        if type(resources) is not dict:
+            raise DeployerException('Resources must be a list or a dict: {0}'.format(task))
+
+        for name, weight in resources.items():
+
+            if type(weight) is not int or weight < 1:
+                raise DeployerException('Weight of resource {0} must be a positive integer: {1}'.format(name, task))
+
+        return resources
+
     def parse_stages(self, tasklist):
         """Parse each stage and create a list of runnable jobs
            A stage is a dictionary in the form:
@@ -109,8 +229,13 @@ class Executor(object):
                'name': '<Arbitrary name for this stage>',
                'concurrency': '<Number of jobs to run in parallel>',
                'concurrency_per_host': '<Maximum number of jobs per host to run in parallel>',
+               'pipelined': <True if tasks only need to wait for earlier tasks on the same host>,
+               'max_concurrency': '<Maximum number of jobs to run in parallel when concurrency is adaptive>',
                'tasks': [<list of task dicts>]
            }
+           'pipelined' is optional and only affects execution with run_dag()
+           'max_concurrency' is optional, if it is higher than 'concurrency' the
+           number of parallel jobs is adapted to how well they perform
         """
 
         stages = []
@@ -130,7 +255,7 @@ class Executor(object):
                     else:
                         msg = 'Found stage with no name: {0}'.format(ext_stage)
 
-            for optional_key in ['concurrency_per_host']:
+            for optional_key in ['concurrency_per_host', 'pipelined', 'max_concurrency']:
 
                 try:
                     stage[optional_key] = ext_stage.pop(optional_key)
@@ -144,16 +269,17 @@ class Executor(object):
             self.log.debug('Parsing stage {0}'.format(stage['name']))
 
             stage['tasks'] = self.parse_tasks(stage['tasks'])
+            self.identify_tasks(stage)
             stages.append(stage)
 
-            self.log.debug('Added {0} jobs for stage {1}'.format(len(stage['tasks']), stage['name']))
+            self.log.debug('Added {0} tasks for stage {1}'.format(len(stage['tasks']), stage['name']))
 
         self.log.debug('Parsed {0} stages'.format(len(stages)))
 
         return stages
 
     def parse_tasks(self, tasks):
-        """Build executable jobs from a list of tasks
+        """Validate a list of tasks and return it as a flat list of task entries
            A task is a dictionary in the form:
            {
                'command':     '<pre-defined internal command>'
@@ -165,71 +291,331 @@ class Executor(object):
            'command' is required, and must be defined in the Orchestrator
            'remote_host' is optional, and will be replaced by a RemoteHost object
            'remote_user' is optional, and will be passed to the RemoteHost object (and not to the internal command)
+           'resources' is optional, and names the shared resources used by the task (see task_resources)
+           'source_host' is optional, and names another host the command copies from (see link_stages)
+           'transfer_size' is ignored, it was written by earlier generators
+           'inventory' is optional, and gives the host, name and version the task deploys (see Inventory)
+
+           A task entry is a dictionary with the task and the position in tasks
+           it was found at ('entry'), tasks of a list share the same position.
+           Jobs are only created from task entries when their stage is about
+           to run (see stage_jobs).
         """
-        def queue_task(_task, parent_task=None):
-            """Create a job and add it to the job queue"""
 
-            task = _task.copy()
+        task_entries = []
 
-            if not 'command' in task:
-                raise DeployerException('No command specified in task: {0}'.format(task))
+        for entry, _task in enumerate(tasks):
+            # Handle a list of tasks that must be executed in order
+            if type(_task) == list:
+                items = _task
 
-            if not task['command'] in self.callables:
-                raise DeployerException('Command "{0}" is not implemented'.format(task['command']))
+            # Handle a single task
+            else:
+                items = [_task]
 
-            callable = self.callables[task.pop('command')]
+            for item in items:
+                self.validate_task(item)
+                task_entries.append({'task': item, 'entry': entry})
 
-            if 'remote_host' in task:
+        return task_entries
 
-                if 'remote_user' in task:
-                    username = task.pop('remote_user')
-                else:
-                    username = None
+    def validate_task(self, task):
+        """Check the arguments of a task against its command without instantiating it"""
 
-                if 'ssh_private_key' in task:
-                    ssh_private_key = task.pop('ssh_private_key')
-                else:
-                    ssh_private_key = None
+        if type(task) is not dict:
+            raise DeployerException('Task is not a dictionary: {0}'.format(task))
 
-                task['remote_host'] = self.get_remote_host(task['remote_host'], username, ssh_private_key)
-                job_id = task['remote_host'].hostname
-            elif 'lb_hostname' in task:
-                job_id = task['lb_hostname']
-            else:
-                job_id = 'local'
+        if not 'command' in task:
+            raise DeployerException('No command specified in task: {0}'.format(task))
 
-            try:
-                remote_task = callable(**task)
-            except TypeError as e:
-                raise DeployerException('Error initializing {0}: {1}'.format(
-                  callable.__name__, e))
+        if not task['command'] in self.callables:
+            raise DeployerException('Command "{0}" is not implemented'.format(task['command']))
 
-            procname = repr(remote_task)
+        self.task_resources(task)
 
-            job = Process(target=remote_task.thread_execute, name=procname, args=[procname, self.remote_results])
-            job._host = job_id
-            job.depends = parent_task
+        callable = self.callables[task['command']]
+        args, varargs, keywords, defaults = inspect.getargspec(callable.initialize)
 
-            job_list.append(job)
+        if keywords:
+            return True
+
+        ignored = ['command', 'tag', 'resources', 'transfer_size', 'inventory']
 
-            return procname
+        if 'remote_host' in task:
+            ignored += ['remote_user', 'ssh_private_key']
+
+        args = args[1:]
+        required = args[:len(args) - len(defaults or [])]
+        given = [x for x in task.keys() if not x in ignored]
+
+        missing = [x for x in required if not x in given]
+        unknown = [x for x in given if not x in args]
+
+        if missing:
+            raise DeployerException('Task for {0} is missing arguments {1}: {2}'.format(
+              callable.__name__, ', '.join(missing), task))
+
+        if unknown:
+            raise DeployerException('Task for {0} has unknown arguments {1}: {2}'.format(
+              callable.__name__, ', '.join(sorted(unknown)), task))
+
+        return True
+
+    def stage_jobs(self, stage):
+        """Return the jobs of a stage, creating them the first time they are needed"""
+
+        if stage.get('jobs') is None:
+            stage['jobs'] = self.create_jobs(stage)
+            self.log.debug('Created {0} jobs for stage {1}'.format(len(stage['jobs']), stage['name']))
+
+        return stage['jobs']
+
+    def create_jobs(self, stage):
+        """Build executable jobs from the task entries of a stage
+           Each job of a list of tasks depends on the job before it
+        """
 
         job_list = []
+        parents = {}
 
-        for _task in tasks:
-            # Handle a list of tasks that must be executed in order
-            if type(_task) == list:
-                parent_task = None
+        for task_entry in stage['tasks']:
+            _task = task_entry['task']
+            entry = task_entry['entry']
 
-                for item in _task:
-                    parent_task = queue_task(item, parent_task)
+            remote_task, job_id, remote_host = self.build_command(_task)
 
-            # Handle a single task
+            procname = self._unique_procname(repr(remote_task))
+
+            if self.pool:
+                job = PoolJob(self.pool, procname, _task)
             else:
-                queue_task(_task)
+                job = Process(target=remote_task.thread_execute, name=procname, args=[procname, self.remote_results.writer])
+
+            job._host = job_id
+            job._remote_host = remote_host
+            job._source_host = _task.get('source_host')
+            job._entry = entry
+            job._task = _task
+            job._resources = self.task_resources(_task)
+            job._stage = stage['name']
+            job._task_id = task_entry['id']
+            job.depends = parents.get(entry)
+            job.after = []
+
+            parents[entry] = procname
+            job_list.append(job)
 
         return job_list
 
+    def build_command(self, _task):
+        """Instantiate the Command for a task
+           Returns the command, the host the job is scheduled against and the
+           name of the remote host the command runs on (or None)
+        """
+
+        task = _task.copy()
+
+        if not 'command' in task:
+            raise DeployerException('No command specified in task: {0}'.format(task))
+
+        if not task['command'] in self.callables:
+            raise DeployerException('Command "{0}" is not implemented'.format(task['command']))
+
+        callable = self.callables[task.pop('command')]
+        task.pop('resources', None)
+        task.pop('transfer_size', None)
+        task.pop('inventory', None)
+
+        if 'remote_host' in task:
+
+            if 'remote_user' in task:
+                username = task.pop('remote_user')
+            else:
+                username = None
+
+            if 'ssh_private_key' in task:
+                ssh_private_key = task.pop('ssh_private_key')
+            else:
+                ssh_private_key = None
+
+            task['remote_host'] = self.get_remote_host(task['remote_host'], username, ssh_private_key)
+            job_id = task['remote_host'].hostname
+            remote_host = job_id
+        elif 'lb_hostname' in task:
+            job_id = task['lb_hostname']
+            remote_host = None
+        else:
+            job_id = 'local'
+            remote_host = None
+
+        try:
+            remote_task = callable(**task)
+        except TypeError as e:
+            raise DeployerException('Error initializing {0}: {1}'.format(
+              callable.__name__, e))
+
+        return remote_task, job_id, remote_host
+
+    def execute_task(self, procname, task):
+        """Build and execute a task inside a pool worker"""
+
+        remote_task = self.build_command(task)[0]
+
+        return remote_task.thread_execute(procname, self.remote_results.writer)
+
+    def _unique_procname(self, procname):
+        """Job names are used as keys for results, make sure they are unique"""
+
+        unique_name = procname
+        count = 1
+
+        while unique_name in self._procnames:
+            count += 1
+            unique_name = '{0} #{1}'.format(procname, count)
+
+        self._procnames.add(unique_name)
+
+        return unique_name
+
+    def identify_tasks(self, stage):
+        """Add the task id (see Journal) to the task entries of a stage"""
+
+        occurrences = {}
+
+        for task_entry in stage['tasks']:
+            task_id = Journal.task_id(stage['name'], task_entry['task'])
+            occurrences[task_id] = occurrences.get(task_id, 0) + 1
+
+            if occurrences[task_id] > 1:
+                task_id = Journal.task_id(stage['name'], task_entry['task'], occurrences[task_id])
+
+            task_entry['id'] = task_id
+
+    def skip_completed(self):
+        """Remove tasks which the journal records as successful
+
+           The remaining jobs of a list of tasks depend on the last of the
+           preceding jobs that has not been removed. Stages of which every
+           task was successful are removed entirely.
+        """
+
+        succeeded = self.journal.succeeded()
+        stages = []
+        skipped = 0
+
+        self.log.info('Resuming from journal {0}'.format(self.journal.filename))
+
+        for stage in self.stages:
+            remaining = [x for x in stage['tasks'] if not x['id'] in succeeded]
+            skipped += len(stage['tasks']) - len(remaining)
+
+            if stage['tasks'] and not remaining:
+                self.log.info('Skipping stage {0}, all tasks completed'.format(stage['name']))
+                continue
+
+            stage['tasks'] = remaining
+            stages.append(stage)
+
+        self.stages = stages
+        self.log.info('Skipping {0} tasks which completed successfully'.format(skipped))
+
+    def job_finished(self, job, success, start_time, end_time):
+        """Record a finished job in the journal, the duration store and the inventory"""
+
+        try:
+            if self.journal:
+                self.journal.record(id=job._task_id, stage=job._stage, task=job.name, host=job._host,
+                  success=success, start=start_time, end=end_time, duration=round(end_time - start_time, 3))
+
+            if self.durations and success:
+                self.durations.record(DurationStore.task_key(job._task, job._host), end_time - start_time)
+
+            if self.inventory and success and job._task.get('inventory'):
+                self.inventory.record(**job._task['inventory'])
+
+            # Only the bytes the command reports it sent are counted, uploads
+            # which were skipped or sent as a delta count for less
+            transferred = self.remote_results.details.pop(job.name, {}).get('transferred')
+
+            if success and transferred:
+                size, start, end = self._transfers.get(job._stage, (0, start_time, end_time))
+                self._transfers[job._stage] = (size + transferred, min(start, start_time), max(end, end_time))
+
+        except DeployerException as e:
+            self.log.error(str(e))
+
+    def log_throughput(self, stage_name):
+        """Log the rate at which the tasks of a stage transferred data, from
+           the first of them starting to the last finishing
+        """
+
+        if not stage_name in self._transfers:
+            return
+
+        size, start_time, end_time = self._transfers.pop(stage_name)
+        megabytes = size / 1048576.0
+        duration = max(end_time - start_time, 0.001)
+
+        self.log.info('Stage {0} transferred {1:.1f} MB in {2:.1f} seconds, {3:.1f} MB/s'.format(
+          stage_name, megabytes, duration, megabytes / duration))
+
+    def prioritize(self, jobs, estimate=None):
+        """Start the jobs with the longest expected path of remaining work first
+
+           The rank of a job is its expected duration plus the highest rank of
+           the jobs that wait for it, so the slowest tasks and the heads of the
+           longest chains are started first. Tasks without history are assumed
+           to take the average of the tasks with history.
+
+           estimate(job) returns the expected duration of a job or None, the
+           default is to look it up in the duration store.
+        """
+
+        if not estimate:
+            estimate = lambda job: self.durations.estimate(DurationStore.task_key(job._task, job._host))
+
+        estimates = {}
+
+        for job in jobs:
+            estimates[job.name] = estimate(job)
+
+        known = [x for x in estimates.values() if x is not None]
+
+        if known:
+            default = sum(known) / len(known)
+        else:
+            default = 1.0
+
+        dependents = {}
+
+        for job in jobs:
+            for name in ([job.depends] if job.depends else []) + job.after:
+                dependents.setdefault(name, []).append(job.name)
+
+        ranks = {}
+
+        # Jobs only wait for jobs that come before them
+        for job in reversed(jobs):
+            duration = estimates[job.name]
+
+            if duration is None:
+                duration = default
+
+            ranks[job.name] = duration + max([ranks.get(x, 0) for x in dependents.get(job.name, [])] or [0])
+            job._priority = -ranks[job.name]
+
+        self.log.debug('Prioritized {0} jobs, {1} with known durations'.format(len(jobs), len(known)))
+
+        return ranks
+
+    def adaptive_concurrency(self, stage):
+        """Return an AdaptiveConcurrency for a stage whose max_concurrency is above its concurrency"""
+
+        if stage.get('max_concurrency') > stage['concurrency']:
+            return AdaptiveConcurrency(stage['concurrency'], stage['max_concurrency'], name=stage['name'])
+
+        return None
+
     def get_remote_host(self, hostname, username='', ssh_private_key=None):
         """Return a host object from a hostname"""
 
@@ -240,16 +626,101 @@ class Executor(object):
         elif len(match) > 1:
             raise DeployerException('More than one host found with hostname{0}'.format(hostname))
         else:
-            host = RemoteHost(hostname, username, ssh_private_key=ssh_private_key)
+            host = RemoteHost(hostname, username, ssh_private_key=ssh_private_key, use_agent=self.agent,
+              transport=self.transport, transport_settings=self.transport_settings, probe_cache=self.probe_cache)
             self.remote_hosts.append(host)
             return host
 
+    def link_stages(self):
+        """Replace the barriers between stages with per-job dependencies
+
+           A task (or list of tasks) waits for:
+           - all tasks of the most recent stage that is not pipelined
+           - the tasks of the most recent earlier stage which ran on the same remote host(s)
+           - the tasks of the most recent earlier stage which ran on the host it
+             copies from (source_host)
+           A task which does not run on a remote host waits for everything
+           that was queued before it.
+
+           Jobs are also tagged with their stage index, so the concurrency
+           settings of each stage can be enforced.
+        """
+
+        barrier = []
+        last_on_host = {}
+        floating = []
+
+        for idx, stage in enumerate(self.stages):
+            entries = {}
+            stage_on_host = {}
+            stage_names = []
+            stage_floating = []
+
+            for job in self.stage_jobs(stage):
+                job._group = idx
+                entries.setdefault(job._entry, []).append(job)
+
+            for entry in [entries[x] for x in sorted(entries.keys())]:
+                names = [x.name for x in entry]
+                hosts = set([x._remote_host for x in entry if x._remote_host])
+                sources = set([x._source_host for x in entry if x._source_host])
+
+                after = set(barrier)
+
+                if hosts:
+                    for host in hosts:
+                        after.update(last_on_host.get(host, []))
+                        stage_on_host.setdefault(host, []).extend(names)
+
+                    for host in sources - hosts:
+                        after.update(last_on_host.get(host, []))
+                else:
+                    for host_names in last_on_host.values():
+                        after.update(host_names)
+
+                    after.update(floating)
+                    stage_floating += names
+
+                # Only the first job of a chain waits, the rest of the chain depends on it
+                for job in entry:
+                    if not job.depends:
+                        job.after = sorted(after)
+
+                stage_names += names
+
+            last_on_host.update(stage_on_host)
+
+            if stage.get('pipelined'):
+                floating += stage_floating
+            else:
+                barrier = stage_names + floating
+                floating = []
+
+            self.log.hidebug('Linked {0} jobs for stage {1}'.format(len(stage_names), stage['name']))
+
     def run(self):
-        """Run each stage"""
+        """Run the tasklist, either stage by stage or as a dependency graph"""
 
         self.log.debug('Discarding unused remote connections')
         disconnect_all()
 
+        if self.pool:
+            self.pool.start()
+
+        try:
+            if self.dag:
+                return self.run_dag()
+            else:
+                return self.run_stages()
+        finally:
+            if self.pool:
+                self.pool.close()
+
+    def run_stages(self):
+        """Run each stage, waiting for a stage to finish before starting the next
+           The jobs of a stage are created when the stage starts
+        """
+
         tasklist_start_time = time.time()
 
         for idx, stage in enumerate(self.stages):
@@ -262,10 +733,17 @@ class Executor(object):
             start_time = time.time()
             self.log.info(green('Starting stage: {0}'.format(stage['name'])))
 
-            job_queue = JobQueue(self.remote_results, stage['concurrency'], stage['concurrency_per_host'])
+            jobs = self.stage_jobs(stage)
+
+            if self.longest_first:
+                self.prioritize(jobs)
+
+            job_queue = JobQueue(self.remote_results, stage['concurrency'], stage['concurrency_per_host'],
+              event_driven=self.event_driven, on_finish=self.job_finished, adaptive=self.adaptive_concurrency(stage))
+            job_queue.set_resource_limits(self.resources)
 
-            for task in stage['tasks']:
-                job_queue.append(task)
+            for job in jobs:
+                job_queue.append(job)
 
             job_queue.close()
             queue_success = job_queue.run()
@@ -286,6 +764,10 @@ class Executor(object):
 
             else:
                 self.log.info(green('Finished stage: {0}'.format(stage['name'])))
+                self.log_throughput(stage['name'])
+
+            # The jobs of a finished stage are not needed any more
+            stage['jobs'] = None
 
             self.log.verbose('Stage {0} execution duration: {1} seconds ({2})'.format(
               idx, duration, stage['name']))
@@ -294,3 +776,62 @@ class Executor(object):
         self.log.verbose('GeneratorHelper execution duration: {0} seconds'.format(tasklist_duration))
 
         return True
+
+    def run_dag(self):
+        """Run all stages as a single dependency graph
+
+           Rather than waiting for every task in a stage to finish, a task is
+           started as soon as the tasks it depends on have finished (see
+           link_stages). The concurrency settings of each stage still apply
+           to the tasks of that stage, and resource limits apply to the tasks
+           of all stages.
+        """
+
+        tasklist_start_time = time.time()
+        self.remote_results.clear()
+        self.link_stages()
+
+        if self.longest_first:
+            self.prioritize([x for stage in self.stages for x in self.stage_jobs(stage)])
+
+        max_running = sum([max(x['concurrency'], x.get('max_concurrency')) for x in self.stages]) or 1
+        job_queue = JobQueue(self.remote_results, max_running, event_driven=self.event_driven,
+          on_finish=self.job_finished)
+        job_queue.set_resource_limits(self.resources)
+
+        for idx, stage in enumerate(self.stages):
+            job_queue.set_group_limits(idx, stage['concurrency'], stage['concurrency_per_host'],
+              adaptive=self.adaptive_concurrency(stage))
+            job_queue.append(self.stage_jobs(stage))
+
+        self.log.info(green('Starting {0} stages as a dependency graph: {1}'.format(
+          len(self.stages), ', '.join([x['name'] for x in self.stages]))))
+
+        job_queue.close()
+        queue_success = job_queue.run()
+
+        failed = [x for x in self.remote_results.keys() if not self.remote_results[x]]
+
+        if failed or not queue_success:
+
+            for stage in self.stages:
+                if [x for x in self.stage_jobs(stage) if x.name in failed]:
+                    self.log.error('Failed stage: {0}'.format(stage['name']))
+
+            for failed_job in failed:
+                self.log.error('Failed job: {0}'.format(failed_job))
+
+            for not_run in [x for x in self.remote_results.keys() if self.remote_results[x] == job_queue.not_run]:
+                self.log.debug('Job not run due to aborted queue: {0}'.format(not_run))
+
+            raise DeployerException('Failed jobs')
+
+        self.log.info(green('Finished all stages'))
+
+        for stage in self.stages:
+            self.log_throughput(stage['name'])
+
+        tasklist_duration = int(time.time() - tasklist_start_time)
+        self.log.verbose('GeneratorHelper execution duration: {0} seconds'.format(tasklist_duration))
+
+        return True
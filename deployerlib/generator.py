@@ -1,4 +1,7 @@
 import os
+import math
+import socket
+import struct
 
 from itertools import izip_longest
 from multiprocessing import Process, Manager
@@ -6,10 +9,13 @@ from multiprocessing import Process, Manager
 from deployerlib.log import Log
 from deployerlib.jobqueue import JobQueue
 from deployerlib.package import Package
+from deployerlib.checksum import checksums
 from deployerlib.tasklist import Tasklist
+from deployerlib.commands.batch import Batch
 from deployerlib.remotehost import RemoteHost
 from deployerlib.exceptions import DeployerException
 from deployerlib.executor import Executor
+from deployerlib.inventory import Inventory
 
 
 class Generator(object):
@@ -27,8 +33,11 @@ class Generator(object):
         self.remote_versions = {}
         self.release_version = self.get_release_version()
         self.release_description = self.get_release_description()
-        self.tasklist = Tasklist(self.release_description)
+        self.tasklist = Tasklist(self.release_description, resources=self.config.get('resource_limits'))
         self.deployment_matrix = {}
+        self._relay_hosts = {}
+        self._host_subnets = {}
+        self.host_facts = {}
 
     def generate(self):
         """Generators that re-use this class can provide their own generate() method"""
@@ -106,13 +115,97 @@ class Generator(object):
 
         return self._filter_ignored_packages(packages)
 
+    def concurrency_settings(self, deploy=False):
+        """Return the concurrency settings for a deploy or non-deploy stage
+           max_concurrency is only set if a maximum has been configured, which
+           makes the concurrency of the stage adaptive (see AdaptiveConcurrency)
+        """
+
+        prefix = 'deploy' if deploy else 'non_deploy'
+
+        settings = {
+          'concurrency': self.config.get('{0}_concurrency'.format(prefix)),
+          'concurrency_per_host': self.config.get('{0}_concurrency_per_host'.format(prefix)),
+        }
+
+        maximum = self.config.get('{0}_concurrency_max'.format(prefix))
+
+        if maximum:
+            settings['max_concurrency'] = maximum
+
+        return settings
+
+    def resource_settings(self, *names):
+        """Return the resources setting for a task which uses the named resources
+           Only resources with a configured limit are included
+        """
+
+        limits = self.config.get('resource_limits') or {}
+        resources = [x for x in names if x in limits]
+
+        if resources:
+            return {'resources': resources}
+
+        return {}
+
+    def upload_resource_settings(self, package, hostname):
+        """Return the resources setting for a task which uploads a package
+           from the deployer to a host
+           With the upload_window setting, the task also weighs the size of
+           the package in megabytes against the megabytes that may be in
+           flight at once, in total and to each subnet of hosts
+        """
+
+        settings = self.resource_settings('upload')
+        window = self.config.get('upload_window')
+
+        if not window:
+            return settings
+
+        resources = dict([(x, 1) for x in settings.get('resources', [])])
+        weight = max(1, int(math.ceil(package.size / 1048576.0)))
+
+        if window.get('megabytes'):
+            resources['upload_megabytes'] = weight
+            self.tasklist.resources['upload_megabytes'] = window['megabytes']
+
+        if window.get('subnet_megabytes'):
+            subnet = self.host_subnet(hostname, window.get('subnet_prefix', 24))
+
+            if subnet:
+                name = 'upload_subnet:{0}'.format(subnet)
+                resources[name] = weight
+                self.tasklist.resources[name] = window['subnet_megabytes']
+
+        if resources:
+            return {'resources': resources}
+
+        return {}
+
+    def host_subnet(self, hostname, prefix):
+        """Return the IPv4 subnet of a host as address/prefix, or None if
+           the host can not be resolved
+        """
+
+        if not (hostname, prefix) in self._host_subnets:
+
+            try:
+                address = struct.unpack('!I', socket.inet_aton(socket.gethostbyname(hostname)))[0]
+            except (socket.error, UnicodeError) as e:
+                self.log.debug('Unable to find the subnet of {0}: {1}'.format(hostname, e))
+                subnet = None
+            else:
+                network = address & (0xffffffff << (32 - prefix)) & 0xffffffff
+                subnet = '{0}/{1}'.format(socket.inet_ntoa(struct.pack('!I', network)), prefix)
+
+            self._host_subnets[(hostname, prefix)] = subnet
+
+        return self._host_subnets[(hostname, prefix)]
+
     def create_base_stages(self):
         """Create common stages in the correct order"""
 
-        non_deploy_settings = {
-          'concurrency': self.config.non_deploy_concurrency,
-          'concurrency_per_host': self.config.non_deploy_concurrency_per_host,
-        }
+        non_deploy_settings = self.concurrency_settings()
 
         for stage in ['Pipeline notify deploying', 'Create temp directories', 'Upload', 'Unpack', 'Send graphite start', 'Properties', 'Database migrations', 'Elasticsearch templates', 'Set daemontools state']:
             self.tasklist.create_stage(stage, pre=True)
@@ -124,6 +217,11 @@ class Generator(object):
             self.tasklist.create_stage(stage, post=True)
             self.tasklist.set(stage, **non_deploy_settings)
 
+        # Tasks in these stages only depend on earlier tasks on the same host,
+        # which allows them to be pipelined when the tasklist is run as a graph
+        for stage in ['Create temp directories', 'Upload', 'Unpack', 'Cleanup', 'Remove temp directories']:
+            self.tasklist.set(stage, pipelined=True)
+
     def queue_base_tasks(self, package, hostname, is_properties):
         """Add preparation and cleanup stages required for package deployment"""
 
@@ -140,7 +238,7 @@ class Generator(object):
           'clobber': self.config.get('remove_temp_dirs', False),
         })
 
-        self.tasklist.add('Upload', {
+        upload_task = {
           'command': 'upload',
           'remote_host': hostname,
           'remote_user': self.config.user,
@@ -148,17 +246,49 @@ class Generator(object):
           'source': package.fullpath,
           'destination': service_config.destination,
           'tag': package.servicename,
-        })
+          'checksum': checksums.get(package.fullpath),
+        }
 
-        self.tasklist.add('Unpack', {
-          'command': 'unpack',
-          'remote_host': hostname,
-          'remote_user': self.config.user,
-          'ssh_private_key': self.config.get('ssh_private_key'),
-          'source': os.path.join(service_config.destination, package.filename),
-          'destination': os.path.join(service_config.install_location, service_config.unpack_dir),
-          'tag': package.servicename,
-        })
+        artifacts = self.host_fact(hostname, 'artifacts', service_config.destination)
+
+        if artifacts is not None:
+            upload_task['artifacts'] = artifacts
+
+        self.check_free_space(package, hostname, [service_config.destination, service_config.install_location])
+
+        if self.config.get('upload_relay'):
+            self.queue_relay_task(upload_task, package, hostname)
+        elif self.config.get('upload_unpack'):
+            # The package is streamed into the unpack directory by the upload
+            upload_task.update(self.upload_resource_settings(package, hostname))
+            upload_task.update({
+              'command': 'upload_unpack',
+              'unpack_dir': os.path.join(service_config.install_location, service_config.unpack_dir),
+              'keep_copy': self.config.get('upload_unpack_keep_copy', True),
+            })
+            self.tasklist.add('Upload', upload_task)
+        elif self.config.get('upload_delta'):
+            # Previous versions kept in destination are the basis of the delta
+            upload_task.update(self.upload_resource_settings(package, hostname))
+            upload_task.update({
+              'command': 'delta_upload',
+              'basis_filespec': '{0}_*'.format(package.servicename),
+            })
+            self.tasklist.add('Upload', upload_task)
+        else:
+            upload_task.update(self.upload_resource_settings(package, hostname))
+            self.tasklist.add('Upload', upload_task)
+
+        if upload_task['command'] != 'upload_unpack':
+            self.tasklist.add('Unpack', {
+              'command': 'unpack',
+              'remote_host': hostname,
+              'remote_user': self.config.user,
+              'ssh_private_key': self.config.get('ssh_private_key'),
+              'source': os.path.join(service_config.destination, package.filename),
+              'destination': os.path.join(service_config.install_location, service_config.unpack_dir),
+              'tag': package.servicename,
+            })
 
         # Post-deploy tasks
         if self.config.get('remove_temp_dirs'):
@@ -209,6 +339,86 @@ class Generator(object):
               'tag': package.servicename,
             })
 
+    def check_free_space(self, package, hostname, paths):
+        """Warn if the host's facts show less free space than the size of
+           the package in any of paths
+        """
+
+        for path in sorted(set(paths)):
+            free_kb = self.host_fact(hostname, 'free_kb', path)
+
+            if free_kb is not None and free_kb * 1024 < package.size:
+                self.log.warning('Only {0} KB free in {1} on {2}, the package is {3} KB'.format(
+                  free_kb, path, hostname, package.size / 1024), tag=package.servicename)
+
+    def queue_relay_task(self, upload_task, package, hostname):
+        """Add a task to copy a package to a host from a peer, or from the
+           deployer if the host is one of the seeds of the relay
+        """
+
+        level, source_host = self.relay_source(package, hostname)
+        relay_task = dict(upload_task, command='relay')
+
+        # A copy from a peer which fails is uploaded from the deployer, so
+        # every relay is limited like an upload
+        relay_task.update(self.upload_resource_settings(package, hostname))
+
+        if source_host:
+            relay_task['source_host'] = source_host
+            relay_task['strict_host_keys'] = self.config.upload_relay.get('strict_host_keys', True)
+            relay_task['forward_agent'] = self.config.upload_relay.get('forward_agent', False)
+            stage_name = 'Upload relay {0}'.format(level)
+
+            if self.tasklist.create_stage(stage_name, pre=True, pipelined=True, **self.concurrency_settings()):
+                previous = 'Upload relay {0}'.format(level - 1) if level > 1 else 'Upload'
+                self.tasklist.set_position(stage_name, self.tasklist.get_position(previous) + 1)
+        else:
+            stage_name = 'Upload'
+
+        self.tasklist.add(stage_name, relay_task)
+
+    def relay_source(self, package, hostname):
+        """Place a host in the relay tree of a package
+           Hosts are grouped by hostgroup. The deployer uploads to the first
+           'seeds' hosts of a group, then at each level of the tree every host
+           which has the package copies it to 'fanout' more hosts of its group.
+           Returns the level of the host in the tree, and the host it copies
+           from (None for the deployer)
+        """
+
+        settings = self.config.upload_relay
+        seeds = settings.get('seeds', 1)
+        fanout = settings.get('fanout', 2)
+
+        hosts = self._relay_hosts.setdefault((package.servicename, self._relay_group(package, hostname)), [])
+
+        if not hostname in hosts:
+            hosts.append(hostname)
+
+        index = hosts.index(hostname)
+
+        if index < seeds:
+            return 0, None
+
+        # Number of hosts which have the package before each level
+        holders = seeds
+        level = 1
+
+        while index >= holders * (1 + fanout):
+            holders *= 1 + fanout
+            level += 1
+
+        return level, hosts[(index - holders) / fanout]
+
+    def _relay_group(self, package, hostname):
+        """The hostgroup of a service which contains a host, hosts relay to peers in the same group"""
+
+        service_config = self.config.get_with_defaults('service', package.servicename)
+
+        for hostgroup in service_config.get('hostgroups', []):
+            if hostname in [self.config.get_full_hostname(x) for x in self.config.hostgroup[hostgroup]['hosts']]:
+                return hostgroup
+
     def deploy_ordered_packages(self, packages, order, queue_base_tasks=True):
         """Create deploy stages for packages based on the specified order
            packages: A list of package objects
@@ -276,7 +486,7 @@ class Generator(object):
                     self.log.debug('No deployment tasks for stage {0}, substage {1}'.format(this_stage_name, stage_num))
                     continue
 
-                self.tasklist.create_stage(this_stage_name, concurrency=self.config.deploy_concurrency, concurrency_per_host=self.config.deploy_concurrency_per_host)
+                self.tasklist.create_stage(this_stage_name, **self.concurrency_settings(deploy=True))
 
                 # Add the tasks for this package in this stage
                 for task in this_tasks:
@@ -329,7 +539,7 @@ class Generator(object):
             migration_location = os.path.join(unpack_location, migration_path_suffix).rstrip('/')
             self.log.info('Adding db migration for {0} on {1}'.format(package.servicename, hostname))
 
-            self.tasklist.add('Database migrations', {
+            migration_task = {
               'command': 'migration_script',
               'remote_host': hostname,
               'remote_user': self.config.user,
@@ -342,7 +552,10 @@ class Generator(object):
               ),
               'tag': package.servicename,
               'if_exists': migration_location,
-            })
+            }
+
+            migration_task.update(self.resource_settings('database'))
+            self.tasklist.add('Database migrations', migration_task)
 
     def templates_stage(self, packages, template_path_suffix=''):
         """Execute Elasticsearch templates on a single host from each
@@ -432,8 +645,15 @@ class Generator(object):
                 continue
 
             for hostname in self.config.get_service_hosts(package.servicename):
+                daemontools = self.host_fact(hostname, 'daemontools', package.servicename)
+
                 # Check whether the service is disabled on this host
                 if self.get_control_type(package.servicename, hostname):
+
+                    if daemontools and daemontools['registered']:
+                        self.log.debug('Service {0} is already enabled on {1}'.format(package.servicename, hostname))
+                        continue
+
                     self.log.debug('Service {0} will be enabled on {1}'.format(package.servicename, hostname))
 
                     self.tasklist.add('Set daemontools state', {
@@ -447,6 +667,11 @@ class Generator(object):
                     })
 
                 else:
+
+                    if daemontools and not daemontools['registered']:
+                        self.log.debug('Service {0} is already disabled on {1}'.format(package.servicename, hostname))
+                        continue
+
                     self.log.info('Service {0} will be disabled on {1}'.format(package.servicename, hostname))
 
                     self.tasklist.add('Set daemontools state', {
@@ -478,7 +703,7 @@ class Generator(object):
             raise DeployerException('Archive stage requires "history" section in deployer config')
 
         stage_name = 'Archive'
-        self.tasklist.create_stage(stage_name, post=True, concurrency=self.config.non_deploy_concurrency, concurrency_per_host=self.config.non_deploy_concurrency_per_host)
+        self.tasklist.create_stage(stage_name, post=True, **self.concurrency_settings())
 
         # Archive command doesn't support multipled release directories
         for release in self.config.release:
@@ -500,49 +725,190 @@ class Generator(object):
               'components': self.config.component,
             })
 
-    def get_remote_versions(self, *args, **kwargs):
-        """Get the versions of all services running on remote hosts"""
+    def get_remote_versions(self, packages=None, *args, **kwargs):
+        """Get the versions of the packages' services and properties on the
+           hosts they will be deployed to (of all services if packages is
+           not specified)
+           With an inventory, a host is only scanned for the versions that
+           have not been scanned for within its ttl (all of them with
+           refresh_inventory), and the other versions are taken from the
+           inventory
+        """
+
+        if packages is None:
+            servicenames = self.config.service.keys()
+        else:
+            servicenames = set([x.servicename for x in packages])
+
+        targets = self.version_targets(servicenames)
+        hosts = targets.keys()
+
+        if self.config.get('inventory'):
+            inventory = Inventory(self.config.inventory, self.config.get('inventory_ttl', 3600))
+        else:
+            inventory = None
+
+        if inventory and not self.config.get('refresh_inventory'):
+            scan_targets = inventory.stale(targets)
+            self.log.info('Using inventory versions of {0} hosts, scanning {1} hosts'.format(
+              len(hosts) - len(scan_targets), len(scan_targets)))
+        else:
+            scan_targets = targets
+
+        results = {}
+        # pre populate the results with empty sets
+        for service in self.config.service:
+            results[service] = {}
+
+        # Facts from an earlier scan are replaced, so the hosts which are in
+        # host_facts afterwards are those that were reached by this scan
+        for host in scan_targets:
+            self.host_facts.pop(host, None)
+
+        scanned = self.scan_remote_versions(scan_targets)
+
+        if inventory:
+
+            for host, names in scan_targets.items():
+
+                if not host in self.host_facts:
+                    # Keep what is known about a host that could not be scanned
+                    self.log.warning('Unable to scan {0}, keeping its inventory versions'.format(host))
+                    continue
+
+                inventory.update_host(host, names, dict([(x, y[host]) for x, y in scanned.items() if host in y]))
+
+            scanned = inventory.versions(hosts, servicenames)
+            inventory.close()
+
+        for service_string, versions in scanned.items():
+            if service_string in results.keys():
+                results[service_string].update(versions)
+
+        return results
+
+    def version_targets(self, servicenames):
+        """Return the services and properties to get the versions of on each
+           host, as a dict of {host: [name, ...]}
+           The hosts of a service are those it will be deployed to, limited by
+           the hosts, hostgroups and categories given on the command line
+        """
+
+        targets = {}
+
+        for servicename in sorted(servicenames):
+
+            if not servicename in self.config.service:
+                continue
+
+            for host in self.config.get_service_hosts(servicename):
+                targets.setdefault(host, []).append(servicename)
+
+        return targets
+
+    def scan_remote_versions(self, targets):
+        """Gather the facts of each host in targets (see version_targets),
+           return the versions they give as a dict of {name: {host: version}}
+           The facts are kept in self.host_facts, see host_fact()
+           Services are found by their links in install_location, and
+           properties by their properties_version file
+        """
+
+        results = {}
+        host_facts = self.gather_host_facts(targets)
+        self.host_facts.update(host_facts)
+
+        for host, facts in host_facts.items():
+
+            for target in facts['links'].values():
+                item = os.path.basename(target)
+
+                if not '_' in item:
+                    continue
+
+                name_vers = item.split('_')
+                results.setdefault(name_vers[0], {})[host] = name_vers[1]
+
+            for name, version in facts['properties'].items():
+                results.setdefault(name, {})[host] = version
+
+        return results
+
+    def gather_host_facts(self, targets):
+        """Run gatherfacts for the names of each host in targets, which gets
+           everything the generator and the upload commands would otherwise
+           probe the host for in one remote command
+           Returns a dict of {host: facts}, see GatherFacts
+        """
+
+        if not targets:
+            return {}
 
         tasks = []
         manager = Manager()
-        remote_versions = manager.dict()
+        host_facts = manager.dict()
+        properties_defs = dict(self.config.get_all_properties())
+
+        for host, names in sorted(targets.items()):
+            install_locations = {}
+            daemontools = []
+            disk_paths = set()
+            artifacts = []
+
+            for name in names:
+                service_config = self.config.get_with_defaults('service', name)
+
+                if not name in properties_defs:
+                    install_locations.setdefault(service_config.install_location, []).append(name)
+                    disk_paths.add(service_config.install_location)
+
+                if service_config.get('control_type') == 'daemontools':
+                    daemontools.append(name)
+
+                disk_paths.add(service_config.destination)
+                artifacts.append((service_config.destination, '{0}_*'.format(name)))
 
-        for host in self.config.get_all_hosts():
             tasks.append({
-              'command': 'getremoteversions',
+              'command': 'gatherfacts',
               'remote_host': host,
               'remote_user': self.config.user,
               'ssh_private_key': self.config.get('ssh_private_key'),
-              'install_location': self.config.service_defaults.install_location,
-              'remote_versions': remote_versions,
-              'properties_defs': self.config.get_all_properties(),
+              'host_facts': host_facts,
+              'install_locations': install_locations,
+              'properties_defs': [(x, properties_defs[x]) for x in names if x in properties_defs],
+              'daemontools': daemontools,
+              'disk_paths': sorted(disk_paths),
+              'artifacts': artifacts,
             })
 
         stage = {
-          'name': 'GetRemoteVersions',
+          'name': 'GatherFacts',
           'concurrency': self.config.non_deploy_concurrency,
           'tasks': tasks,
         }
 
         tasklist = {
-          'name': 'Get Remote Versions',
+          'name': 'Gather Host Facts',
           'stages': [stage],
         }
 
         executor = Executor(tasklist=tasklist)
         executor.run()
-        results = {}
-        # pre populate the results with empty sets
-        for service in self.config.service:
-            results[service] = {}
-        for item in remote_versions.keys():
-            ver = remote_versions[item]
-            host_service = item.split('/')
-            host_string = host_service[0]
-            service_string = host_service[1]
-            if service_string in results.keys():
-                results[service_string][host_string]= ver
-        return results
+
+        return dict(host_facts.items())
+
+    def host_fact(self, hostname, kind, key):
+        """Return a fact gathered from a host, e.g. host_fact(host, 'free_kb', path)
+           Returns None if the host's facts were not gathered, in which case
+           the caller should behave as if there were no facts at all
+        """
+
+        facts = self.host_facts.get(hostname)
+
+        if not facts:
+            return None
+
+        return facts[kind].get(key)
 
     def get_remote_host(self, hostname, username=''):
         """Return a host object from a hostname"""
@@ -591,6 +957,54 @@ class Generator(object):
         return subtasks
 
 
+    def batch_tasks(self, tasks):
+        """Combine consecutive tasks of a list of tasks into batch tasks
+           Only done if batch_commands is enabled. Tasks can be combined if
+           their command can be batched (see Batch) and they run on the same
+           remote host
+        """
+
+        if not self.config.get('batch_commands'):
+            return tasks
+
+        def can_batch(task):
+            return task.get('command') in Batch.batchable and 'remote_host' in task and not 'resources' in task
+
+        batched = []
+        steps = []
+
+        for task in tasks + [None]:
+
+            if task and can_batch(task) and (not steps or steps[0]['remote_host'] == task['remote_host']):
+                steps.append(task)
+                continue
+
+            if len(steps) > 1:
+                batched.append({
+                  'command': 'batch',
+                  'remote_host': steps[0]['remote_host'],
+                  'remote_user': steps[0].get('remote_user'),
+                  'ssh_private_key': steps[0].get('ssh_private_key'),
+                  'tag': steps[0].get('tag'),
+                  'steps': [self._batch_step(x) for x in steps],
+                })
+            else:
+                batched += steps
+
+            steps = []
+
+            if task and can_batch(task):
+                steps.append(task)
+            elif task:
+                batched.append(task)
+
+        return batched
+
+    def _batch_step(self, task):
+        """A task without the settings that belong to its batch"""
+
+        return dict([(x, y) for x, y in task.items() if not x in ['remote_host', 'remote_user', 'ssh_private_key']])
+
     def _filter_ignored_packages(self, packages):
         """Strip packages which is in ignore_packages list/str if it exist"""
 
@@ -781,7 +1195,11 @@ class Generator(object):
             if queue_base_tasks:
                 self.queue_base_tasks(package, hostname, is_properties)
 
-            tasks.append(self.get_deploy_task(package, hostname, control_type, is_properties))
+            deploy_task = self.batch_tasks(self.get_deploy_task(package, hostname, control_type, is_properties))
+
+            # The version is in place once the last task has succeeded
+            deploy_task[-1]['inventory'] = {'host': hostname, 'name': package.servicename, 'version': package.version}
+            tasks.append(deploy_task)
 
             # Update deployment matrix
             self.deployment_matrix[package.servicename].append(hostname)
@@ -955,6 +1373,8 @@ class Generator(object):
         if hasattr(service_config, 'lb_timeout'):
             lb_task['timeout'] = service_config['lb_timeout']
 
+        lb_task.update(self.resource_settings('loadbalancer'))
+
         enable_tasks = [dict(lb_task.items() + [('command', 'disable_loadbalancer')])]
         disable_tasks = [dict(lb_task.items() + [('command', 'enable_loadbalancer')])]
 
@@ -71,6 +71,6 @@ class ServiceControl(Generator):
                     else:
                         raise DeployerException('Unknown action for control_services: {0}'.format(action))
 
-                    self.tasklist.create_stage(this_stage_name, concurrency=self.config.deploy_concurrency, concurrency_per_host=self.config.deploy_concurrency_per_host)
+                    self.tasklist.create_stage(this_stage_name, **self.concurrency_settings(deploy=True))
                     self.tasklist.add_hosts(this_stage_name, hostname)
                     self.tasklist.add(this_stage_name, task)
@@ -0,0 +1,92 @@
+import time
+import sqlite3
+
+from deployerlib.log import Log
+from deployerlib.exceptions import DeployerException
+
+
+class Inventory(object):
+    """Versions of services and properties on remote hosts, kept in a local
+       SQLite database
+
+       Versions are stored per host and name (of a service or properties).
+       They are replaced when a host is scanned for them, and updated when
+       the deployer deploys them. A name is only scanned for again on a host
+       once its last scan there is older than ttl seconds.
+    """
+
+    def __init__(self, filename, ttl=3600):
+        self.log = Log(self.__class__.__name__)
+        self.filename = filename
+        self.ttl = ttl
+
+        try:
+            self.db = sqlite3.connect(filename)
+            self.db.execute('CREATE TABLE IF NOT EXISTS versions ('
+              'host TEXT NOT NULL, name TEXT NOT NULL, version TEXT NOT NULL, updated REAL NOT NULL, '
+              'PRIMARY KEY (host, name))')
+            self.db.execute('CREATE TABLE IF NOT EXISTS scans ('
+              'host TEXT NOT NULL, name TEXT NOT NULL, scanned REAL NOT NULL, '
+              'PRIMARY KEY (host, name))')
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise DeployerException('Unable to open inventory {0}: {1}'.format(filename, e))
+
+    def stale(self, targets):
+        """Return the names which have not been scanned for within the ttl
+           targets is a dict of {host: [name, ...]}, and so is the result, for
+           the hosts which have stale names
+        """
+
+        scanned = dict([((x, y), z) for x, y, z in self.db.execute('SELECT host, name, scanned FROM scans')])
+        oldest = time.time() - self.ttl
+        stale = {}
+
+        for host, names in targets.items():
+            names = [x for x in names if scanned.get((host, x), 0) < oldest]
+
+            if names:
+                stale[host] = names
+
+        return stale
+
+    def versions(self, hosts, names=None):
+        """Return the versions on hosts as a dict of {name: {host: version}}"""
+
+        hosts = set(hosts)
+        versions = {}
+
+        for host, name, version in self.db.execute('SELECT host, name, version FROM versions'):
+            if host in hosts and (names is None or name in names):
+                versions.setdefault(name, {})[host] = version
+
+        return versions
+
+    def update_host(self, host, names, versions):
+        """Replace the versions of names on a host after scanning for them
+           versions is a dict of {name: version}, names which are not in it
+           are not on the host
+        """
+
+        now = time.time()
+
+        try:
+            self.db.executemany('DELETE FROM versions WHERE host = ? AND name = ?', [(host, x) for x in names])
+            self.db.executemany('INSERT INTO versions VALUES (?, ?, ?, ?)',
+              [(host, name, version, now) for name, version in versions.items() if name in names])
+            self.db.executemany('INSERT OR REPLACE INTO scans VALUES (?, ?, ?)', [(host, x, now) for x in names])
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise DeployerException('Unable to write to inventory {0}: {1}'.format(self.filename, e))
+
+    def record(self, host, name, version):
+        """Record a version that has been deployed to a host"""
+
+        try:
+            self.db.execute('INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?)', (host, name, version, time.time()))
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise DeployerException('Unable to write to inventory {0}: {1}'.format(self.filename, e))
+
+    def close(self):
+        self.db.close()
@@ -7,10 +7,16 @@ May use ``multiprocessing.Process`` or ``threading.Thread`` objects as queue
 items, though within Fabric itself only ``Process`` objects are used/supported.
 """
 
+import os
 import time
+import errno
+import heapq
 import Queue
+import select
 import signal
 
+from collections import deque
+
 from fabric.state import env
 from fabric.network import ssh
 from fabric.context_managers import settings
@@ -37,26 +43,67 @@ class JobQueue(object):
         ___________________________
                                 End
     """
-    def __init__(self, remote_results, max_running, max_per_host=None, abort_on_error=True):
+    def __init__(self, remote_results, max_running, max_per_host=None, abort_on_error=True,
+      event_driven=False, event_timeout=5, on_finish=None, adaptive=None):
         """
         Setup the class to resonable defaults.
+
+        If event_driven is True the queue blocks until a running job exits
+        instead of sleep-polling, so the next job starts as soon as a slot
+        frees up. event_timeout limits how long a single wait may block.
+
+        on_finish is called as on_finish(job, success, start_time, end_time)
+        for each job that has finished.
+
+        If adaptive is set (see AdaptiveConcurrency), its limit replaces
+        max_running and is updated with the duration and result of each job
+        that has finished.
         """
 
         self.log = Log(self.__class__.__name__)
         self.remote_results = remote_results
         self.not_run = 'NOTRUN'
-        self._queued = []
+        self._queued = set()
         self._running = []
         self._completed = []
         self._aborted = []
         self._abort_flag = False
         self._num_of_jobs = 0
         self._max = max_running
+        self.adaptive = adaptive
+        self.clock = time.time
         self._max_per_host = max_per_host
         self._comms_queue = Queue.Queue()
         self._finished = False
         self._closed = False
         self.abort_on_error=abort_on_error
+        self.event_driven = event_driven
+        self.event_timeout = event_timeout
+        self._sentinels = {}
+        self._group_limits = {}
+        self._group_adaptive = {}
+        self.on_finish = on_finish
+        self._start_times = {}
+
+        if adaptive:
+            self._max = adaptive.limit
+
+        # Scheduling bookkeeping, kept up to date as jobs start and finish so
+        # that choosing the next job does not depend on the size of the queue
+        self._jobs = {}
+        self._order = {}
+        self._children = {}
+        self._dependents = {}
+        self._waiting = {}
+        self._ready = []
+        self._parked = {}
+        self._released_from = {}
+        self._host_running = {}
+        self._group_running = {}
+        self._group_host_running = {}
+        self._resource_limits = {}
+        self._resource_running = {}
+        self._prepared = False
 
     def _all_alive(self):
         """
@@ -102,13 +149,46 @@ class JobQueue(object):
             processlist = [processlist]
 
         for process in processlist:
-            self._queued.append(process)
+            if not hasattr(process, 'depends'):
+                process.depends = None
+
+            if not hasattr(process, 'after'):
+                process.after = []
+
+            self._queued.add(process)
+            self._jobs[process._name] = process
+            self._order[process] = self._num_of_jobs
             self._num_of_jobs += 1
             # prime with not_run string to differentiate failed jobs from jobs
             # which have not run
             self.remote_results[process.name] = self.not_run
             self.log.hidebug('{0} appended job {1}'.format(self.__class__.__name__, process.name))
 
+    def set_group_limits(self, group, max_running, max_per_host=None, adaptive=None):
+        """
+        Limit the number of running jobs that have _group set to group, in
+        addition to the limits of the queue itself. Used to enforce the
+        concurrency settings of each stage when stages share a queue.
+
+        If adaptive is set, its limit replaces max_running for the group.
+        """
+
+        if adaptive:
+            max_running = adaptive.limit
+            self._group_adaptive[group] = adaptive
+
+        self._group_limits[group] = (max_running, max_per_host)
+
+    def set_resource_limits(self, limits):
+        """
+        Limit the total weight of running jobs that use a named resource.
+        The resources of a job are a dict of resource names and weights in
+        its _resources attribute. A job that is heavier than the limit of a
+        resource can still run when nothing else is using the resource.
+        """
+
+        self._resource_limits.update(limits)
+
     def run(self):
         """
         This is the workhorse. It will take the intial jobs from the _queue,
@@ -124,178 +204,504 @@ class JobQueue(object):
 
         This function returns an iterable of all its children's exit codes.
         """
-        def _advance_the_queue():
-            """
-            Helper function to do the job of poping a new proc off the queue
-            start it, then add it to the running queue. This will eventually
-            depleate the _queue, which is a condition of stopping the running
-            while loop.
 
-            It also sets the env.host_string from the job.name, so that fabric
-            knows that this is the host to be making connections on.
+        signal.signal(signal.SIGINT, self._interrupt_handler)
 
-            Returns True if a job was started, False if not job was able to be
-            started.
-            """
+        # Prep return value so we can start filling it during main loop
+        results = {}
+        for job in self._queued:
+            results[job.name] = dict.fromkeys(('exit_code', 'results'))
 
-            if not self._queued:
-                self.log.debug('Job queue is empty')
-                return False
+        if not self._closed:
+            raise Exception("Need to close() before starting.")
 
-            for idx, job_candidate in enumerate(self._queued):
+        self.log.debug('Starting job queue')
 
-                # Check _max_per_host threshold before starting a job
-                if self._max_per_host:
-                    if len([x for x in self._running if x._host == job_candidate._host]) >= self._max_per_host:
-                        self.log.debug('Skipping job {0}, already {1} jobs running on {2}'.format(
-                          job_candidate, self._max_per_host, job_candidate._host))
-                        continue
+        self._prepare()
+        self._fill()
 
-                # Check for job dependencies
-                if job_candidate.depends:
-                    if not [x for x in self._completed if x._name == job_candidate.depends]:
-                        # Make sure the parent job exists
-                        if not [x for x in self._running + self._queued if x._name == job_candidate.depends]:
-                            self.log.error('Job {0} depends on non-existent job {1}'.format(job_candidate._name, job_candidate.depends))
-                            _abort_queue([job_candidate])
+        # Main loop!
+        while not self._finished:
+            self._fill()
 
-                        self.log.hidebug('Job {0} is waiting for job {1} to complete'.format(job_candidate._name, job_candidate.depends))
-                        continue
+            completed = []
 
-                job = self._queued.pop(idx)
-                self.log.debug('Starting job: {0}'.format(job._name))
+            if not self._all_alive():
+                # Check for completed jobs and remove them from the _running queue
+                completed = [x for x in self._running if not x.is_alive()]
+
+            # Pick up results sent by jobs since the last pass. This is done after
+            # looking for completed jobs, so that a job which exited after sending
+            # its result is never checked for failure before its result is merged
+            self._collect_results()
+            self._reap(completed)
+
+            if not (self._queued or self._running):
+                if self._abort_flag:
+                    self.log.debug('Aborted job queue')
+                else:
+                    self.log.debug('Finished job queue')
+
+                self._finished = True
 
-                with settings(clean_revert=True, host_string=job._host, host=job._host):
-                    job.start()
+            # Each loop pass, try pulling results off the queue to keep its
+            # size down. At this point, we don't actually care if any results
+            # have arrived yet; they will be picked up after the main loop.
+            self._fill_results(results)
+
+            if self._finished:
+                break
 
-                self._running.append(job)
+            if self.event_driven:
+                # Jobs which just completed may have made others eligible to start
+                if not completed:
+                    self._wait_for_jobs()
+            else:
+                time.sleep(ssh.io_sleep)
 
-                return True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        # Release any sentinels that are still open
+        for fd in self._sentinels.keys():
+            del self._sentinels[fd]
+            os.close(fd)
 
+        # Consume anything left in the results queue. Note that there is no
+        # need to block here, as the main loop ensures that all workers will
+        # already have finished.
+        self._fill_results(results)
+
+        # Attach exit codes now that we're all done & have joined all jobs
+        for job in self._completed:
+            results[job.name]['exit_code'] = job.exitcode
+
+        if self._abort_flag and self.abort_on_error:
+            return False
+        else:
+            return True
+
+    def _prepare(self):
+        """
+        Build the dependency maps. Jobs without unfinished dependencies go
+        into the ready set, the others wait until their last dependency has
+        finished.
+        """
+
+        if self._prepared:
+            return
+
+        self._prepared = True
+        missing = []
+
+        for job in sorted(self._queued, key=self._order.get):
+            names = set(job.after)
+
+            if job.depends:
+                names.add(job.depends)
+                self._children.setdefault(job.depends, []).append(job)
+
+            unknown = [x for x in names if not x in self._jobs]
+
+            if unknown:
+                self.log.error('Job {0} waits for non-existent jobs: {1}'.format(
+                  job._name, ', '.join(sorted(unknown))))
+                missing.append(job)
+                continue
+
+            for name in names:
+                self._dependents.setdefault(name, []).append(job)
+
+            if names:
+                self._waiting[job] = len(names)
+            else:
+                self._push_ready(job)
+
+        if missing:
+            self._abort_queue(missing)
+
+    def _fill(self):
+        """Start jobs until the queue is full or no more jobs can be started"""
+
+        while len(self._running) < self._max and self._queued:
+            if not self._advance_the_queue():
+                break
+
+    def _advance_the_queue(self):
+        """
+        Helper function to do the job of poping a new proc off the queue
+        start it, then add it to the running queue. This will eventually
+        depleate the _queue, which is a condition of stopping the running
+        while loop.
+
+        It also sets the env.host_string from the job.name, so that fabric
+        knows that this is the host to be making connections on.
+
+        Returns True if a job was started, False if not job was able to be
+        started.
+        """
+
+        if not self._queued:
+            self.log.debug('Job queue is empty')
+            return False
+
+        job = self._next_job()
+
+        if not job:
             self.log.debug('No jobs available to be started')
-            time.sleep(1)
+
+            # In event-driven mode the main loop blocks until a running job
+            # exits, which is the only thing that can make a job eligible
+            if not self.event_driven:
+                time.sleep(1)
 
             return False
 
-        def _abort_queue(jobs=[]):
-            """Helper function to abort the queue cleanly"""
+        self._queued.discard(job)
+        self.log.debug('Starting job: {0}'.format(job._name))
+
+        with settings(clean_revert=True, host_string=job._host, host=job._host):
+            self._start_job(job)
+
+        self._running.append(job)
+        self._start_times[job] = self.clock()
+        self._count_running(job, 1)
+
+        return True
+
+    def _next_job(self):
+        """
+        Pop the next job that can be started from the ready set. Jobs which
+        are held back by a host, group or resource limit are parked until a job
+        holding the same limit finishes.
+        """
+
+        while self._ready:
+            job = heapq.heappop(self._ready)[-1]
+            released_from = self._released_from.pop(job, None)
+
+            if not job in self._queued:
+                # Aborted while it was waiting, pass the freed slot on
+                if released_from:
+                    self._release(released_from)
+                continue
+
+            limit = self._limit_reached(job)
+
+            if not limit:
+                return job
+
+            self.log.hidebug('Parking job {0}, limit reached: {1}'.format(job._name, limit))
+
+            if limit == released_from:
+                self._parked.setdefault(limit, deque()).appendleft(job)
+                continue
+
+            self._parked.setdefault(limit, deque()).append(job)
 
-            self._abort_flag = True
+            # The slot this job was released into is still free
+            if released_from:
+                self._release(released_from)
 
-            if jobs:
-                self.log.critical('Aborting queue due to failed jobs: {0}'.format(', '.join([x._name for x in jobs])))
-                self._aborted += jobs
+        return None
 
-            # List of jobs that are dependencies of successfully-completed jobs
-            allowed_jobs = []
-            for job in [x for x in self._completed + self._running if x not in self._aborted]:
-                deps = [x for x in _get_dependencies(job) if x in self._queued]
+    def _limit_reached(self, job):
+        """Return the limit that prevents job from being started, or None"""
 
-                if deps:
-                    self.log.debug('Allowing {0} dependencies to continue for job: {0}'.format(len(deps), job._name))
-                    allowed_jobs += deps
+        if self._max_per_host and self._host_running.get(job._host, 0) >= self._max_per_host:
+            return ('host', job._host)
 
-            # Abort all other queued jobs
-            self._aborted += [x for x in self._queued if x not in allowed_jobs]
-            self._queued = [x for x in self._queued if x not in self._aborted]
+        group = getattr(job, '_group', None)
 
-            if len(self._aborted) > 0:
-                self.log.warning('Aborting {0} queued jobs'.format(len(self._aborted)))
-                self.log.debug('Aborted jobs: {0}'.format(', '.join([x._name for x in self._aborted])))
+        if group in self._group_limits:
+            group_max, group_max_per_host = self._group_limits[group]
 
-            if len(self._running) > 0:
-                self.log.warning('Allowing {0} running jobs to finish'.format(len(self._running)))
+            if self._group_running.get(group, 0) >= group_max:
+                return ('group', group)
 
-            self.log.warning('Allowing {0} queued jobs to continue'.format(len(self._queued)))
+            if group_max_per_host and self._group_host_running.get((group, job._host), 0) >= group_max_per_host:
+                return ('group', group, job._host)
 
+        for resource, weight in sorted(getattr(job, '_resources', {}).items()):
+            limit = self._resource_limits.get(resource)
+            used = self._resource_running.get(resource, 0)
+
+            if limit is not None and used and used + weight > limit:
+                return ('resource', resource)
+
+        return None
+
+    def _count_running(self, job, count):
+        """Update the running counters of the host, group and resources of a job"""
+
+        group = getattr(job, '_group', None)
+
+        for counter, key in ((self._host_running, job._host), (self._group_running, group),
+          (self._group_host_running, (group, job._host))):
+            counter[key] = counter.get(key, 0) + count
+
+            if not counter[key]:
+                del counter[key]
+
+        for resource, weight in getattr(job, '_resources', {}).items():
+            self._resource_running[resource] = self._resource_running.get(resource, 0) + weight * count
+
+            if not self._resource_running[resource]:
+                del self._resource_running[resource]
+
+    def _push_ready(self, job):
+        """Add a job whose dependencies have finished to the ready set
+
+           Ready jobs are started in order of their _priority attribute (lowest
+           first) if they have one, then in the order they were appended.
+        """
+
+        heapq.heappush(self._ready, (getattr(job, '_priority', 0), self._order[job], job))
+
+    def _release(self, limit):
+        """A slot has been freed, return the first job parked on it to the ready set"""
+
+        parked = self._parked.get(limit)
+
+        if not parked:
             return
 
-        def _get_dependencies(job):
-            """Helper function to get a list of queued dependencies for a job"""
+        if limit[0] == 'resource':
+            return self._release_resource(limit, parked)
 
-            deps = [x for x in self._queued + self._running if x.depends == job._name]
+        job = parked.popleft()
 
-            if not deps:
-                return deps
+        if not parked:
+            del self._parked[limit]
 
-            for dep in deps:
-                return deps + _get_dependencies(dep)
+        self._released_from[job] = limit
+        self._push_ready(job)
 
-        def _interrupt_handler(signum, frame):
-            """Handle keyboard interrupt"""
+    def _release_resource(self, limit, parked):
+        """Weight of a resource has been freed, return the jobs parked on it
+           that fit in the free weight to the ready set, in order. A lighter
+           job can start while a heavier one waits for more weight to be
+           freed, which keeps the resource in use when jobs weigh different
+           amounts, such as uploads weighted by their size.
+        """
 
-            self.log.warning('User interrupt: Aborting the queue cleanly, use Ctrl-C again to abort immediately')
-            signal.signal(signal.SIGINT, signal.default_int_handler)
-            _abort_queue()
+        resource = limit[1]
+        used = self._resource_running.get(resource, 0)
+        free = self._resource_limits.get(resource, 0) - used
 
-        signal.signal(signal.SIGINT, _interrupt_handler)
+        for job in list(parked):
+            weight = job._resources[resource]
 
-        # Prep return value so we can start filling it during main loop
-        results = {}
-        for job in self._queued:
-            results[job.name] = dict.fromkeys(('exit_code', 'results'))
+            # A job heavier than the limit starts when nothing else uses the resource
+            if weight > free and used:
+                continue
 
-        if not self._closed:
-            raise Exception("Need to close() before starting.")
+            parked.remove(job)
+            self._released_from[job] = limit
+            self._push_ready(job)
 
-        self.log.debug('Starting job queue')
+            free -= weight
+            used += weight
 
-        while len(self._running) < self._max and len(self._queued) > 0:
-            if not _advance_the_queue():
+            if free <= 0:
                 break
 
-        # Main loop!
-        while not self._finished:
-            while len(self._running) < self._max and self._queued:
-                if not _advance_the_queue():
-                    break
+        if not parked:
+            del self._parked[limit]
 
-            if not self._all_alive():
-                # Check for completed jobs and remove them from the _running queue
-                completed = [x for x in self._running if not x.is_alive()]
+    def _reap(self, completed):
+        """Move completed jobs out of _running, releasing the jobs that waited for them"""
 
-                self._running = [x for x in self._running if not x in completed]
-                self._completed += completed
+        if not completed:
+            return
 
-                # Jobs that do not return a result are considered failed
-                failed_jobs = [x for x in completed if not self.remote_results[x._name] or self.remote_results[x._name] == self.not_run]
+        self._running = [x for x in self._running if not x in completed]
+        self._completed += completed
 
-                if failed_jobs:
-                    _abort_queue(failed_jobs)
+        for job in completed:
+            self._count_running(job, -1)
+            self._close_sentinel(job)
+            group = getattr(job, '_group', None)
 
-                self.log.debug('{0} jobs running, {1} jobs queued, {2} jobs completed'.format(
-                  len(self._running), len(self._queued), len(self._completed)))
+            for limit in (('host', job._host), ('group', group), ('group', group, job._host)):
+                self._release(limit)
 
-            if not (self._queued or self._running):
-                if self._abort_flag:
-                    self.log.debug('Aborted job queue')
-                else:
-                    self.log.debug('Finished job queue')
+            for resource in getattr(job, '_resources', {}):
+                self._release(('resource', resource))
 
-                self._finished = True
+            for dependent in self._dependents.pop(job._name, []):
+                self._waiting[dependent] -= 1
 
-            # Each loop pass, try pulling results off the queue to keep its
-            # size down. At this point, we don't actually care if any results
-            # have arrived yet; they will be picked up after the main loop.
-            self._fill_results(results)
+                if not self._waiting[dependent]:
+                    del self._waiting[dependent]
+
+                    if dependent in self._queued:
+                        self._push_ready(dependent)
+
+        # Jobs that do not return a result are considered failed
+        failed_jobs = [x for x in completed if not self.remote_results[x._name] or self.remote_results[x._name] == self.not_run]
+        end_time = self.clock()
+
+        for job in completed:
+            start_time = self._start_times.pop(job, end_time)
+            self._adapt(job, end_time - start_time, not job in failed_jobs)
+
+            if self.on_finish:
+                self.on_finish(job, not job in failed_jobs, start_time, end_time)
+
+        if failed_jobs:
+            self._abort_queue(failed_jobs)
+
+        self.log.debug('{0} jobs running, {1} jobs queued, {2} jobs completed'.format(
+          len(self._running), len(self._queued), len(self._completed)))
+
+    def _adapt(self, job, duration, success):
+        """Update adaptive limits with a finished job"""
+
+        if self.adaptive:
+            self._max = self.adaptive.update(duration, success)
+
+        group = getattr(job, '_group', None)
+        adaptive = self._group_adaptive.get(group)
 
-            time.sleep(ssh.io_sleep)
+        if not adaptive:
+            return
+
+        group_max, group_max_per_host = self._group_limits[group]
+        limit = adaptive.update(duration, success)
+        self._group_limits[group] = (limit, group_max_per_host)
+
+        # Jobs parked on the group limit can use the extra slots
+        for i in range(limit - group_max):
+            self._release(('group', group))
+
+    def _abort_queue(self, jobs=[]):
+        """Helper function to abort the queue cleanly"""
+
+        self._abort_flag = True
+
+        if jobs:
+            self.log.critical('Aborting queue due to failed jobs: {0}'.format(', '.join([x._name for x in jobs])))
+            self._aborted += jobs
+            self._queued.difference_update(jobs)
+
+        aborted = set(self._aborted)
+
+        # Jobs that are dependencies of successfully-completed jobs
+        allowed_jobs = set()
+        for job in [x for x in self._completed + self._running if x not in aborted]:
+            deps = self._get_dependencies(job)
+
+            if deps:
+                self.log.debug('Allowing {0} dependencies to continue for job: {1}'.format(len(deps), job._name))
+                allowed_jobs.update(deps)
+
+        # Abort all other queued jobs
+        self._aborted += [x for x in self._queued if x not in allowed_jobs]
+        self._queued.intersection_update(allowed_jobs)
+
+        if len(self._aborted) > 0:
+            self.log.warning('Aborting {0} queued jobs'.format(len(self._aborted)))
+            self.log.debug('Aborted jobs: {0}'.format(', '.join([x._name for x in self._aborted])))
+
+        if len(self._running) > 0:
+            self.log.warning('Allowing {0} running jobs to finish'.format(len(self._running)))
 
+        self.log.warning('Allowing {0} queued jobs to continue'.format(len(self._queued)))
+
+    def _get_dependencies(self, job):
+        """Helper function to get a list of queued dependencies for a job"""
+
+        deps = []
+        pending = [job]
+
+        while pending:
+            for child in self._children.get(pending.pop()._name, []):
+                if child in self._queued:
+                    deps.append(child)
+                    pending.append(child)
+
+        return deps
+
+    def _interrupt_handler(self, signum, frame):
+        """Handle keyboard interrupt"""
+
+        self.log.warning('User interrupt: Aborting the queue cleanly, use Ctrl-C again to abort immediately')
         signal.signal(signal.SIGINT, signal.default_int_handler)
+        self._abort_queue()
 
-        # Consume anything left in the results queue. Note that there is no
-        # need to block here, as the main loop ensures that all workers will
-        # already have finished.
-        self._fill_results(results)
+    def _start_job(self, job):
+        """Start a job, registering a sentinel for it in event-driven mode
 
-        # Attach exit codes now that we're all done & have joined all jobs
-        for job in self._completed:
-            results[job.name]['exit_code'] = job.exitcode
+           Python 2 processes have no sentinel, so a pipe is created whose
+           write end is only held by the child. The read end becomes readable
+           (EOF) as soon as the child exits.
+        """
 
-        if self._abort_flag and self.abort_on_error:
-            return False
-        else:
-            return True
+        # Jobs that provide their own file descriptor to wait on (see WorkerPool)
+        if not self.event_driven or hasattr(job, 'fileno'):
+            job.start()
+            return
+
+        read_fd, write_fd = os.pipe()
+
+        try:
+            job.start()
+        finally:
+            os.close(write_fd)
+
+        self._sentinels[read_fd] = job
+        job._sentinel = read_fd
+
+    def _close_sentinel(self, job):
+        """Release the sentinel of a job that was reaped before its pipe was read"""
+
+        fd = getattr(job, '_sentinel', None)
+
+        # The descriptor may already have been closed and reused for another job
+        if fd is not None and self._sentinels.get(fd) is job:
+            del self._sentinels[fd]
+            os.close(fd)
+
+    def _collect_results(self):
+        """Merge results sent over a result channel, if one is in use"""
+
+        collect = getattr(self.remote_results, 'collect', None)
+
+        if collect:
+            collect()
+
+    def _wait_for_jobs(self):
+        """Block until at least one running job has exited, or event_timeout expires"""
+
+        waitable = self._sentinels.keys()
+
+        for job in self._running:
+            if hasattr(job, 'fileno') and job.fileno() is not None:
+                waitable.append(job.fileno())
+
+        if not waitable:
+            time.sleep(min(self.event_timeout, 1))
+            return []
+
+        try:
+            ready, _, _ = select.select(waitable, [], [], self.event_timeout)
+        except (select.error, OSError) as e:
+            # A signal (e.g. SIGINT) interrupted the wait; let the main loop re-evaluate
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+
+        exited = []
+
+        for fd in [x for x in ready if x in self._sentinels]:
+            job = self._sentinels.pop(fd)
+            os.close(fd)
+            # The child has closed its end of the pipe, reap it so is_alive() is accurate
+            job.join()
+            exited.append(job)
+
+        self.log.hidebug('{0} jobs exited'.format(len(exited)))
+        return exited
 
     def _fill_results(self, results):
         """
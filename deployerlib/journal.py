@@ -0,0 +1,75 @@
+import json
+import hashlib
+
+from deployerlib.log import Log
+from deployerlib.exceptions import DeployerException
+
+
+class Journal(object):
+    """Append-only record of executed tasks
+
+       Each line of the journal is a json object describing a task that has
+       finished. Tasks are identified by a hash of the stage name and the task
+       itself, so a journal can be matched against a regenerated tasklist.
+    """
+
+    def __init__(self, filename):
+        self.log = Log(self.__class__.__name__)
+        self.filename = filename
+
+    @staticmethod
+    def task_id(stage_name, task, occurrence=1):
+        """Return the identity of a task
+
+           occurrence distinguishes identical tasks within the same stage
+        """
+
+        data = json.dumps([stage_name, task, occurrence], sort_keys=True, default=str)
+
+        return hashlib.sha1(data).hexdigest()
+
+    def record(self, **entry):
+        """Append an entry to the journal"""
+
+        line = json.dumps(entry, sort_keys=True, default=str)
+
+        try:
+            with open(self.filename, 'a') as f:
+                f.write(line + '\n')
+        except IOError as e:
+            raise DeployerException('Unable to write to journal {0}: {1}'.format(self.filename, e))
+
+    def read(self):
+        """Return the entries in the journal"""
+
+        entries = []
+
+        try:
+            with open(self.filename, 'r') as f:
+                lines = f.readlines()
+        except IOError as e:
+            raise DeployerException('Unable to read journal {0}: {1}'.format(self.filename, e))
+
+        for number, line in enumerate(lines, 1):
+
+            if not line.strip():
+                continue
+
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A partly-written line, e.g. if the deployment was killed
+                self.log.warning('Ignoring invalid entry on line {0} of journal {1}'.format(number, self.filename))
+
+        return entries
+
+    def succeeded(self):
+        """Return the ids of tasks whose most recent execution was successful"""
+
+        status = {}
+
+        for entry in self.read():
+            if 'id' in entry:
+                status[entry['id']] = entry.get('success')
+
+        return set([x for x in status if status[x]])
@@ -17,6 +17,7 @@ class Package(object):
 
         self.fullpath = os.path.abspath(filename)
         self.filename = os.path.basename(self.fullpath)
+        self.size = os.path.getsize(self.fullpath)
         self.source_location = os.path.dirname(self.fullpath)
 
         self.packagename, self.filetype = self.split_file_extension(self.filename)
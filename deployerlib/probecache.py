@@ -0,0 +1,210 @@
+import os
+import re
+import threading
+
+from multiprocessing.managers import BaseManager
+
+from deployerlib.log import Log
+
+
+# Commands which do not change any files, except through redirection. Commands
+# which change other state, such as svc, are left out so they invalidate
+# everything
+readonly_commands = ['cat', 'echo', 'ls', 'md5sum', 'readlink', 'sha1sum', 'sha256sum', 'svstat', 'test', 'true']
+
+# Commands which only change the paths given as their arguments
+path_commands = ['chmod', 'cp', 'ln', 'mkdir', 'mv', 'rm', 'rmdir', 'tar', 'touch', 'unzip']
+
+
+class ProbeStore(object):
+    """The results of the probes of all hosts, held in the process of a
+       ProbeCacheManager so that each operation is a single call to it
+
+       The generation of a host is changed before and after each change to
+       it. A probe result is not stored if the generation changed while the
+       probe ran, and results stored during a change are removed when it ends,
+       so a probe racing a change from another process is not cached.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, hostname):
+        return self._generations.get(hostname, 0)
+
+    def get(self, hostname, key):
+        """Return the cached result of a probe, or None"""
+
+        entry = self._entries.get(hostname, {}).get(key)
+
+        if entry:
+            return entry[1]
+
+    def put(self, hostname, key, paths, value, generation):
+        """Store the result of a probe of paths, which started at generation"""
+
+        with self._lock:
+
+            if self._generations.get(hostname, 0) == generation:
+                self._entries.setdefault(hostname, {})[key] = (paths, value)
+
+    def begin_change(self, hostname):
+
+        with self._lock:
+            self._generations[hostname] = self._generations.get(hostname, 0) + 1
+
+    def end_change(self, hostname, changes=None):
+        """Remove the results of the probes of a host which are affected by
+           changes to paths (all of them if changes is None), return their keys
+        """
+
+        with self._lock:
+            self._generations[hostname] = self._generations.get(hostname, 0) + 1
+            entries = self._entries.get(hostname, {})
+
+            invalid = [x for x, (y, z) in entries.items() if changes is None or
+              [a for a in changes for b in y if affects(a, b)]]
+
+            for key in invalid:
+                del entries[key]
+
+        return invalid
+
+
+class ProbeCacheManager(BaseManager):
+    pass
+
+
+ProbeCacheManager.register('ProbeStore', ProbeStore)
+
+
+class ProbeCache(object):
+    """Results of probes of remote hosts, shared by the processes of a deployment
+
+       A probe is a command which only reads the state of some paths on a
+       host, such as checking whether a file exists or reading a symlink.
+       Its result is kept until a command which changes one of those paths
+       runs on the host (see command_changes), so a path is only probed again
+       after it may have changed.
+    """
+
+    def __init__(self):
+        self._manager = ProbeCacheManager()
+        self._manager.start()
+        self._store = self._manager.ProbeStore()
+
+    def host(self, hostname):
+        """Return the cache of a single host"""
+
+        return HostProbeCache(hostname, self._store)
+
+
+class HostProbeCache(object):
+    """The results of the probes of a host, see ProbeStore"""
+
+    def __init__(self, hostname, store):
+        self.log = Log(self.__class__.__name__)
+        self.hostname = hostname
+        self._store = store
+
+    def generation(self):
+        return self._store.generation(self.hostname)
+
+    def get(self, key):
+        return self._store.get(self.hostname, key)
+
+    def put(self, key, paths, value, generation):
+        self._store.put(self.hostname, key, paths, value, generation)
+
+    def begin_change(self):
+        self._store.begin_change(self.hostname)
+
+    def end_change(self, changes=None):
+        invalid = self._store.end_change(self.hostname, changes)
+
+        if invalid:
+            self.log.hidebug('Invalidated {0} on {1}'.format(', '.join([repr(x) for x in invalid]), self.hostname))
+
+
+def command_changes(command):
+    """Return the paths a shell command may change, or None if it may change
+       anything
+       Only commands made of readonly_commands and path_commands are
+       understood. The paths are their absolute path arguments, the targets of
+       redirections, the contents of tar's -C directory and, for mkdir, the
+       parents of its arguments
+    """
+
+    changes = []
+
+    for segment in re.split(r'&&|\|\||[;|\n]', command):
+        words = segment.split()
+
+        if not words:
+            continue
+
+        name = os.path.basename(words[0])
+
+        if not name in readonly_commands + path_commands:
+            return None
+
+        for index, word in enumerate(words[1:]):
+            redirected = word.startswith('>') or words[index] in ('>', '>>')
+            word = word.lstrip('>').strip('\'"')
+
+            if not word.startswith('/'):
+                continue
+
+            if name == 'tar' and words[index] == '-C':
+                # Extracting only changes the contents of the directory
+                changes.append(word.rstrip('/') + '/')
+            elif name in path_commands or redirected:
+                changes.append(word)
+
+            if name == 'mkdir':
+                changes.append(os.path.dirname(word.rstrip('/')))
+
+    return changes
+
+
+def affects(changed, probed):
+    """Check whether a change to the path changed affects a probe of the path
+       probed
+       A change affects the path itself and everything under it. A glob
+       pattern, or a path ending in /, stands for the contents of its
+       directory: changing them affects probes of the pattern, and of the
+       paths under the directory that it could match
+    """
+
+    changed, changed_contents = _split(changed)
+    probed, probed_contents = _split(probed)
+
+    if _under(probed, changed):
+        return True
+
+    if probed == changed:
+        return probed_contents or not changed_contents
+
+    return probed_contents and _under(changed, probed)
+
+
+def _split(path):
+    """Return the normalised path, or the directory of a glob pattern, and
+       whether it stands for the contents of that directory
+    """
+
+    base = re.split(r'[*?[]', path, 1)[0]
+    contents = base != path or path.endswith('/')
+
+    if base != path:
+        base = os.path.dirname(base)
+
+    return os.path.normpath(base or '/'), contents
+
+
+def _under(path, directory):
+    """Check whether path is strictly under directory"""
+
+    return path != directory and path.startswith(directory.rstrip('/') + '/')
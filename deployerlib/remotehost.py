@@ -1,35 +1,38 @@
+import time
+
 from deployerlib.exceptions import DeployerException
 from deployerlib.log import Log
-
-from multiprocessing import Manager
-
-from fabric.api import env
-from fabric.state import output
-from fabric.contrib import files
-from fabric.context_managers import settings
-from fabric.operations import run, sudo, put, get
+from deployerlib.transport import get_transport, CommandResult
+from deployerlib.probecache import command_changes
 
 
 class RemoteHost(object):
     """Handle execution of tasks on a remote host"""
 
-    def __init__(self, hostname, username='', pool_size=1, caller=None, ssh_private_key=None):
+    def __init__(self, hostname, username='', pool_size=1, caller=None, ssh_private_key=None, use_agent=False,
+      transport='ssh', transport_settings=None, probe_cache=None):
+        """If use_agent is True, commands and file checks are executed by an
+           agent started on the host (see AgentClient), rather than each over
+           a new SSH session
+           transport is the name of the Transport used to reach the host (see
+           get_transport), transport_settings are passed to it
+           If probe_cache is set, the results of file_exists and execute_probe
+           are kept in that ProbeCache until a change to the paths they probed
+        """
+
         self.log = Log(self.__class__.__name__)
 
         self.hostname = hostname
         self.username = username
+        self.use_agent = use_agent
+        self._agent = None
 
-        env.user = username
-        env.host_string = hostname
-
-        env.warn_only = True
-        env.abort_on_prompts = True
-        output.everything = False
-        env.parallel = False
-        env.serial = True
+        if probe_cache:
+            self.probe_cache = probe_cache.host(hostname)
+        else:
+            self.probe_cache = None
 
-        if ssh_private_key:
-            env.key_filename = ssh_private_key
+        self.transport = get_transport(transport, hostname, username, ssh_private_key, **(transport_settings or {}))
 
     def __str__(self):
         return self.hostname
@@ -39,43 +42,116 @@ class RemoteHost(object):
         return '{0}(hostname={1}, username={2})'.format(self.__class__.__name__,
           repr(self.hostname), repr(self.username))
 
+    def agent(self):
+        """Return the agent of this host, starting it on first use"""
+
+        if not self._agent:
+            self.log.debug('Starting agent on {0}'.format(self.hostname))
+            self._agent = self.transport.start_agent()
+
+        return self._agent
+
     def put_remote(self, local_file, remote_dir, **fabric_settings):
         """Upload a file to a remote host"""
 
         self.log.debug('Putting local file "{0}" to remote dir "{1}"'.format(local_file, remote_dir))
 
-        with settings(**fabric_settings):
-            return put(local_file, remote_dir)
+        self.begin_change()
+
+        try:
+            res = self.transport.put(local_file, remote_dir, **fabric_settings)
+        finally:
+            self.end_change([remote_dir.rstrip('/') + '/'])
+
+        return res
+
+    def sync_remote(self, local_file, remote_file, **fabric_settings):
+        """Transfer a file to the host, sending only what differs from remote_file"""
+
+        self.log.debug('Syncing local file "{0}" to remote file "{1}"'.format(local_file, remote_file))
+
+        self.begin_change()
+
+        try:
+            res = self.transport.sync(local_file, remote_file, **fabric_settings)
+        finally:
+            self.end_change([remote_file])
+
+        if res.failed:
+            self.log.debug('Failed to sync file: {0}'.format(res.failed))
+
+        return res
+
+    def stream_remote(self, local_file, command, **fabric_settings):
+        """Execute a command on the host with a local file as its input"""
+
+        self.log.debug('Streaming local file "{0}" to command: {1}'.format(local_file, command))
+
+        self.begin_change()
+
+        try:
+            res = self.transport.stream(local_file, command, **fabric_settings)
+        finally:
+            self.end_change(command_changes(command))
+
+        if res:
+            self.log.debug('Output: {0}'.format(res))
+
+        return res
 
     def get_remote(self, remote_server_path, destination_path, **fabric_settings):
         """Retrieve file from a remote host"""
 
         self.log.debug('Getting remote file "{1}:{0}" to local "{2}"'.format(remote_server_path, self.hostname, destination_path))
 
-        with settings(**fabric_settings):
-            return get(remote_path=remote_server_path, local_path=destination_path)
+        return self.transport.get(remote_server_path, destination_path, **fabric_settings)
 
     def file_exists(self, remote_file, **fabric_settings):
         """Check whether a file exists on a remote server"""
 
+        if fabric_settings:
+            return self._file_exists(remote_file, **fabric_settings)
+
+        return self.probe(('exists', remote_file), [remote_file], lambda: self._file_exists(remote_file))
+
+    def _file_exists(self, remote_file, **fabric_settings):
+
         self.log.debug('Checking existence of file {0}'.format(remote_file))
 
-        with settings(**fabric_settings):
-            return files.exists(remote_file)
+        if self.use_agent and not fabric_settings:
+            return self.call_agent('exists', changes=[], path=remote_file).succeeded
+
+        return self.transport.exists(remote_file, **fabric_settings)
+
+    def execute_remote(self, command, use_sudo=False, output_hidebug=False, changes=None, **fabric_settings):
+        """Execute a command on the host
+           changes is the list of paths the command changes, for the probe
+           cache. By default they are worked out from the command (see
+           command_changes), and if that is not possible the command is assumed
+           to change anything
+        """
 
-    def execute_remote(self, command, use_sudo=False, output_hidebug=False, **fabric_settings):
-        """Execute a command via fabric"""
+        if changes is None and self.probe_cache:
+            changes = command_changes(command)
 
         if use_sudo:
             self.log.debug('Executing command with sudo: {0}'.format(command))
         else:
             self.log.debug('Executing command: {0}'.format(command))
 
-        with settings(**fabric_settings):
-            if use_sudo:
-                res = sudo(command, shell=False)
+        if changes != []:
+            self.begin_change()
+
+        try:
+            if self.use_agent and not use_sudo and not fabric_settings:
+                res = self.agent().call('run', command=command)
+            elif use_sudo:
+                res = self.transport.sudo(command, **fabric_settings)
             else:
-                res = run(command)
+                res = self.transport.run(command, **fabric_settings)
+        finally:
+            if changes != []:
+                self.end_change(changes)
 
         if res:
             msg = 'Output: {0}'.format(res)
@@ -85,3 +161,104 @@ class RemoteHost(object):
                 self.log.debug(msg)
 
         return res
+
+    def call_agent(self, op, changes=None, **args):
+        """Execute an operation of the agent (see deployerlib.agent) on the host
+           changes is the list of paths the operation changes, for the probe
+           cache (None for any path)
+        """
+
+        if changes != []:
+            self.begin_change()
+
+        try:
+            return self.agent().call(op, **args)
+        finally:
+            if changes != []:
+                self.end_change(changes)
+
+    def execute_probe(self, command, paths=None, use_sudo=False):
+        """Execute a command which only reads the state of paths on the host
+           (by default its absolute path arguments). With a probe cache, the
+           result is reused until a change to any of the paths
+        """
+
+        if paths is None:
+            paths = [x for x in command.split()[1:] if x.startswith('/')]
+
+        def run():
+            res = self.execute_remote(command, use_sudo=use_sudo, changes=[])
+            return str(res), res.return_code
+
+        output, return_code = self.probe(('run', command, use_sudo), paths, run,
+          succeeded=lambda x: x[1] == 0)
+
+        return CommandResult(output, return_code)
+
+    def probe(self, key, paths, function, succeeded=bool):
+        """Return the result of function, a probe of paths identified by key,
+           from the probe cache if it is there
+           Only results for which succeeded(result) is true are cached, as a
+           failure may come from the connection or sudo rather than the paths
+        """
+
+        if not self.probe_cache:
+            return function()
+
+        value = self.probe_cache.get(key)
+
+        if value is not None:
+            self.log.hidebug('Cached result of {0}: {1}'.format(key, value))
+            return value
+
+        generation = self.probe_cache.generation()
+        value = function()
+
+        if succeeded(value):
+            self.probe_cache.put(key, paths, value, generation)
+
+        return value
+
+    def begin_change(self):
+        """Called before a change to the host, see ProbeCache. Must be
+           followed by end_change, also when the change fails
+        """
+
+        if self.probe_cache:
+            self.probe_cache.begin_change()
+
+    def end_change(self, changes):
+        """Called after a change to the paths in changes (None for any path)"""
+
+        if self.probe_cache:
+            self.probe_cache.end_change(changes)
+
+    def wait_for_state(self, command, want_state=0, timeout=60, interval=1, fail_above=None):
+        """Execute command until it exits with want_state or timeout expires
+           Stops early if the exit code is above fail_above. With an agent the
+           loop runs on the host. Returns the result of the last execution
+        """
+
+        self.log.debug('Waiting up to {0} seconds for exit code {1}: {2}'.format(timeout, want_state, command))
+
+        if self.use_agent:
+            return self.call_agent('wait', changes=command_changes(command), command=command,
+              want_state=want_state, timeout=timeout, interval=interval, fail_above=fail_above)
+
+        max_time = time.time() + timeout
+
+        while True:
+            res = self.execute_remote(command)
+
+            if res.return_code == want_state:
+                break
+
+            if fail_above is not None and res.return_code > fail_above:
+                break
+
+            if time.time() + interval > max_time:
+                break
+
+            time.sleep(interval)
+
+        return res
@@ -0,0 +1,63 @@
+from multiprocessing.queues import SimpleQueue
+
+from deployerlib.log import Log
+
+
+class ResultChannel(dict):
+    """Job results, collected from child processes into a plain dict
+
+       Jobs are given the writer attribute in place of a shared results dict.
+       Each assignment made by a job is sent to the parent over a single
+       pipe, and merged into this dict when collect() is called. Writes are
+       synchronous, so a job's results are available as soon as it has exited.
+       Jobs can also record details of their execution, which are kept in
+       details as {name: {key: value}}.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ResultChannel, self).__init__(*args, **kwargs)
+        self.log = Log(self.__class__.__name__)
+        self.details = {}
+        self._queue = SimpleQueue()
+        self.writer = ResultWriter(self._queue)
+
+    def clear(self):
+        super(ResultChannel, self).clear()
+        self.details.clear()
+
+    def collect(self):
+        """Merge results that have been sent by jobs, returns the number of results received"""
+
+        count = 0
+
+        while not self._queue.empty():
+            message = self._queue.get()
+
+            if len(message) == 3:
+                name, key, value = message
+                self.details.setdefault(name, {})[key] = value
+                continue
+
+            name, value = message
+            self[name] = value
+            count += 1
+
+        if count:
+            self.log.hidebug('Collected {0} results'.format(count))
+
+        return count
+
+
+class ResultWriter(object):
+    """Write end of a ResultChannel, used by jobs like a dict"""
+
+    def __init__(self, queue):
+        self._queue = queue
+
+    def __setitem__(self, name, value):
+        self._queue.put((name, value))
+
+    def record(self, name, key, value):
+        """Record a detail of the execution of a job"""
+
+        self._queue.put((name, key, value))
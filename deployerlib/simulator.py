@@ -0,0 +1,325 @@
+import heapq
+
+from deployerlib.log import Log
+from deployerlib.jobqueue import JobQueue
+from deployerlib.durations import DurationStore
+from deployerlib.exceptions import DeployerException
+
+
+class SimulatedJob(object):
+    """A job that takes a fixed amount of virtual time, scheduled by JobQueue like a Process"""
+
+    attributes = ['_host', '_remote_host', '_entry', '_task', '_stage', '_group', '_priority', '_resources', 'depends', 'after']
+
+    def __init__(self, simulator, job, duration):
+        self.simulator = simulator
+        self.name = job.name
+        self._name = job._name
+        self.duration = duration
+        self.start_time = None
+        self.end_time = None
+        self.exitcode = None
+
+        for attribute in self.attributes:
+            if hasattr(job, attribute):
+                setattr(self, attribute, getattr(job, attribute))
+
+    def __repr__(self):
+        return '{0}(name={1})'.format(self.__class__.__name__, repr(self.name))
+
+    def start(self):
+        self.simulator._job_started(self)
+
+    def is_alive(self):
+        return self.start_time is not None and self.exitcode is None
+
+    def join(self, timeout=None):
+        pass
+
+    def fileno(self):
+        """Simulated jobs have nothing to wait on"""
+        return None
+
+
+class Simulator(object):
+    """Predict how long a tasklist will take to execute
+
+       The jobs of an Executor are replaced by jobs which take their expected
+       duration in virtual time, and are scheduled by JobQueue as they would
+       be by Executor.run(), without connecting to any host.
+
+       The expected duration of a task is taken from assumed, a dict of
+       durations per command, then from a DurationStore, then default_duration.
+    """
+
+    def __init__(self, executor, durations=None, assumed={}, default_duration=10.0, longest_first=False):
+        self.log = Log(self.__class__.__name__)
+        self.executor = executor
+        self.durations = durations
+        self.assumed = assumed
+        self.default_duration = default_duration
+        self.longest_first = longest_first
+        self.clock = 0.0
+        self.results = {}
+        self._events = []
+        self._sequence = 0
+
+    def estimate(self, job):
+        """Return the expected duration of a job, or None if it is not known"""
+
+        command = job._task.get('command')
+
+        if command in self.assumed:
+            return self.assumed[command]
+
+        if self.durations:
+            return self.durations.estimate(DurationStore.task_key(job._task, job._host))
+
+        return None
+
+    def duration_of(self, job):
+        """Return the duration a job will take in the simulation"""
+
+        duration = self.estimate(job)
+
+        if duration is None:
+            return self.default_duration
+
+        return duration
+
+    def run(self):
+        """Simulate the execution of the tasklist and return a report"""
+
+        self.clock = 0.0
+        stages = self.executor.stages
+
+        if self.executor.dag:
+            self.executor.link_stages()
+
+            if self.longest_first:
+                self.executor.prioritize([x for stage in stages for x in self.executor.stage_jobs(stage)], self.estimate)
+
+            jobs = [self._simulated_stage(x) for x in stages]
+            max_running = sum([self._slots(x) for x in stages]) or 1
+            job_queue = JobQueue(self.results, max_running, event_driven=True)
+            job_queue.set_resource_limits(self.executor.resources)
+
+            for idx, stage in enumerate(stages):
+                self._check_concurrency(stage)
+                job_queue.set_group_limits(idx, stage['concurrency'], stage['concurrency_per_host'],
+                  adaptive=self.executor.adaptive_concurrency(stage))
+                job_queue.append(jobs[idx])
+
+            self._run_queue(job_queue)
+            capacity = max_running * self.clock
+
+        else:
+            jobs = []
+            capacity = 0.0
+
+            for stage in stages:
+
+                if self.longest_first:
+                    self.executor.prioritize(self.executor.stage_jobs(stage), self.estimate)
+
+                stage_jobs = self._simulated_stage(stage)
+                jobs.append(stage_jobs)
+
+                if not stage_jobs:
+                    continue
+
+                self._check_concurrency(stage)
+                start_time = self.clock
+                job_queue = JobQueue(self.results, stage['concurrency'], stage['concurrency_per_host'], event_driven=True,
+                  adaptive=self.executor.adaptive_concurrency(stage))
+                job_queue.set_resource_limits(self.executor.resources)
+                job_queue.append(stage_jobs)
+                self._run_queue(job_queue)
+                capacity += self._slots(stage) * (self.clock - start_time)
+
+        return self._report(stages, jobs, capacity)
+
+    def _simulated_stage(self, stage):
+        return [SimulatedJob(self, x, self.duration_of(x)) for x in self.executor.stage_jobs(stage)]
+
+    def _slots(self, stage):
+        """The highest number of jobs a stage may run at once"""
+
+        return max(stage['concurrency'], stage.get('max_concurrency'))
+
+    def _check_concurrency(self, stage):
+
+        if stage['tasks'] and stage['concurrency'] < 1:
+            raise DeployerException('Stage {0} has concurrency {1} and would never finish'.format(
+              stage['name'], stage['concurrency']))
+
+    def _job_started(self, job):
+        """Schedule the end of a job in virtual time"""
+
+        job.start_time = self.clock
+        self._sequence += 1
+        heapq.heappush(self._events, (self.clock + job.duration, self._sequence, job))
+
+    def _run_queue(self, job_queue):
+        """Run a queue, advancing the clock to the next job to finish whenever no job can be started"""
+
+        job_queue.clock = lambda: self.clock
+        job_queue.close()
+        job_queue._prepare()
+
+        while True:
+            job_queue._fill()
+
+            if not self._events:
+                break
+
+            self.clock = self._events[0][0]
+            finished = []
+
+            while self._events and self._events[0][0] == self.clock:
+                job = heapq.heappop(self._events)[-1]
+                job.end_time = self.clock
+                job.exitcode = 0
+                self.results[job.name] = True
+                finished.append(job)
+
+            job_queue._reap(finished)
+
+        if job_queue._queued or job_queue._abort_flag:
+            raise DeployerException('Simulation aborted with {0} jobs not run'.format(len(job_queue._queued)))
+
+    def _report(self, stages, jobs, capacity):
+        """Summarize the simulated execution"""
+
+        report = {'total': self.clock, 'stages': []}
+        busy_total = 0.0
+
+        for stage, stage_jobs in zip(stages, jobs):
+            busy = sum([x.duration for x in stage_jobs])
+            busy_total += busy
+
+            if stage_jobs:
+                start_time = min([x.start_time for x in stage_jobs])
+                duration = max([x.end_time for x in stage_jobs]) - start_time
+            else:
+                start_time = None
+                duration = 0.0
+
+            if duration:
+                utilisation = busy / (self._slots(stage) * duration)
+            else:
+                utilisation = None
+
+            report['stages'].append({
+              'name': stage['name'],
+              'tasks': len(stage_jobs),
+              'concurrency': stage['concurrency'],
+              'start': start_time,
+              'duration': duration,
+              'utilisation': utilisation,
+            })
+
+        if capacity:
+            report['utilisation'] = busy_total / capacity
+        else:
+            report['utilisation'] = None
+
+        report['critical_path'] = self.critical_path(jobs)
+
+        return report
+
+    def critical_path(self, jobs):
+        """Follow the chain of jobs that determined when the last job finished
+
+           Starting from the last job to finish, the predecessor of a job is
+           the job it waited for that finished last. When stages are run one
+           at a time, a job which is not part of a list of tasks also waits
+           for the last job of the previous stage.
+        """
+
+        by_name = {}
+        barriers = {}
+        last_job = None
+
+        for stage_jobs in jobs:
+
+            for job in stage_jobs:
+                by_name[job.name] = job
+
+                if not self.executor.dag and not job.depends:
+                    barriers[job.name] = last_job
+
+            if stage_jobs:
+                last_job = max(stage_jobs, key=lambda x: x.end_time)
+
+        if not by_name:
+            return []
+
+        path = []
+        job = max(by_name.values(), key=lambda x: x.end_time)
+
+        while job:
+            names = ([job.depends] if job.depends else []) + job.after
+            predecessors = [by_name[x] for x in names if x in by_name]
+
+            if barriers.get(job.name):
+                predecessors.append(barriers[job.name])
+
+            if predecessors:
+                previous = max(predecessors, key=lambda x: x.end_time)
+                ready_time = previous.end_time
+            else:
+                previous = None
+                ready_time = 0.0
+
+            path.append({
+              'name': job.name,
+              'stage': job._stage,
+              'host': job._host,
+              'start': job.start_time,
+              'duration': job.duration,
+              'waited': job.start_time - ready_time,
+            })
+
+            job = previous
+
+        path.reverse()
+
+        return path
+
+    @staticmethod
+    def format_report(report):
+        """Return a simulation report as a list of lines"""
+
+        def percent(value):
+            if value is None:
+                return '-'
+            return '{0:.0f}%'.format(value * 100)
+
+        lines = ['{0:<40} {1:>6} {2:>11} {3:>9} {4:>9} {5:>11}'.format(
+          'Stage', 'Tasks', 'Concurrency', 'Start', 'Duration', 'Utilisation')]
+
+        for stage in report['stages']:
+            if stage['start'] is None:
+                start = '-'
+            else:
+                start = '{0:.1f}'.format(stage['start'])
+
+            lines.append('{0:<40} {1:>6} {2:>11} {3:>9} {4:>9.1f} {5:>11}'.format(
+              stage['name'][:40], stage['tasks'], stage['concurrency'], start, stage['duration'],
+              percent(stage['utilisation'])))
+
+        lines.append('Predicted total duration: {0:.1f} seconds, utilisation {1}'.format(
+          report['total'], percent(report['utilisation'])))
+        lines.append('Critical path:')
+
+        for step in report['critical_path']:
+            line = '  {0:>9.1f} {1:>9.1f}  {2} [{3}] {4}'.format(step['start'], step['duration'],
+              step['stage'], step['host'], step['name'])
+
+            if step['waited'] > 0:
+                line += ' (waited {0:.1f} seconds for a free slot)'.format(step['waited'])
+
+            lines.append(line)
+
+        return lines
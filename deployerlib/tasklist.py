@@ -7,9 +7,14 @@ from deployerlib.exceptions import DeployerException
 class Tasklist(object):
     """Manage the building of a tasklist"""
 
-    def __init__(self, name='Deployment'):
+    def __init__(self, name='Deployment', resources=None):
+        """resources is a dict of resource names and the number of tasks that
+           may use each resource at once (see Executor.parse_resources)
+        """
+
         self.log = Log(self.__class__.__name__)
         self.name = name
+        self.resources = dict(resources or {})
         self._stages = {}
         self._stage_order = []
         self._pre_order = []
@@ -172,7 +177,12 @@ class Tasklist(object):
         # Reorder stages that have been tagged as pre or post
         stages = [self._stages[x] for x in pre + main + post if self._stages[x]['tasks']]
 
-        return { 'name': self.name, 'stages': stages }
+        tasklist = { 'name': self.name, 'stages': stages }
+
+        if self.resources:
+            tasklist['resources'] = self.resources
+
+        return tasklist
 
     def _exists_or_die(self, stage_name):
 
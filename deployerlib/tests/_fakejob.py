@@ -0,0 +1,26 @@
+class FakeJob(object):
+    """Stands in for a multiprocessing.Process in a JobQueue, and runs until
+       its exitcode is set by the caller
+    """
+
+    def __init__(self, name, host, group=None, depends=None, after=None, resources=None):
+        self.name = name
+        self._name = name
+        self._host = host
+        self._group = group
+        self._resources = resources or {}
+        self.depends = depends
+        self.after = after or []
+        self.exitcode = None
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def join(self, timeout=None):
+        pass
+
+    def fileno(self):
+        return None
@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from deployerlib.log import Log
+from deployerlib.agentclient import AgentClient
+from deployerlib.remotehost import RemoteHost
+from deployerlib.executor import Executor
+from deployerlib.exceptions import DeployerException
+from deployerlib.commands import checkservice, movefile, symlink, removefile
+
+
+class AgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+        self.tmpdir = tempfile.mkdtemp()
+        self.agent = AgentClient.local()
+
+    def tearDown(self):
+        self.agent.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testOperations(self):
+        self.log.info('Testing agent operations')
+
+        source = os.path.join(self.tmpdir, 'service-1')
+        destination = os.path.join(self.tmpdir, 'installed-1')
+        link = os.path.join(self.tmpdir, 'service')
+        os.mkdir(source)
+
+        res = self.agent.call('run', command='echo hello; exit 3')
+        self.assertEqual(res, 'hello')
+        self.assertEqual(res.return_code, 3)
+        self.assertTrue(res.failed)
+
+        # Non-ASCII commands and output, and output that is not UTF-8
+        res = self.agent.call('run', command='printf \'caf\303\251\'')
+        self.assertEqual(res, 'caf\xc3\xa9')
+        self.assertTrue(res.succeeded)
+        self.assertEqual(self.agent.call('run', command='printf \'\\377\''), '\xef\xbf\xbd')
+
+        self.assertTrue(self.agent.call('exists', path=os.path.join(self.tmpdir, 'serv*')).succeeded)
+        self.assertTrue(self.agent.call('move', source=source, destination=destination).succeeded)
+        self.assertTrue(self.agent.call('symlink', source=destination, destination=link).succeeded)
+        self.assertEqual(os.readlink(link), destination)
+        self.assertTrue(self.agent.call('remove', path=destination).succeeded)
+        self.assertFalse(os.path.exists(destination))
+        self.assertFalse(self.agent.call('no_such_operation').succeeded)
+
+    def testBatch(self):
+        self.log.info('Testing that a batch stops at the first failure')
+
+        operations = [
+          {'op': 'run', 'command': 'true'},
+          {'op': 'run', 'command': 'false'},
+          {'op': 'run', 'command': 'touch {0}/not_run'.format(self.tmpdir)},
+        ]
+
+        results = list(self.agent.batch(operations))
+        self.assertEqual([x['ok'] for x in results], [True, False])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'not_run')))
+
+        results = list(self.agent.batch(operations, stop_on_failure=False))
+        self.assertEqual([x['ok'] for x in results], [True, False, True])
+
+    def testWait(self):
+        self.log.info('Testing waiting for a state on the host')
+
+        counter = os.path.join(self.tmpdir, 'counter')
+        command = 'echo x >> {0}; test $(wc -l < {0}) -ge 3'.format(counter)
+
+        res = self.agent.call('wait', command=command, timeout=10, interval=0.1)
+        self.assertTrue(res.succeeded)
+
+        res = self.agent.call('wait', command='exit 5', timeout=10, fail_above=3)
+        self.assertEqual(res.return_code, 5)
+
+    def testRemoteHost(self):
+        self.log.info('Testing a RemoteHost that uses an agent')
+
+        remote_host = RemoteHost('localhost', use_agent=True)
+        remote_host._agent = self.agent
+
+        res = remote_host.execute_remote('echo hello')
+        self.assertEqual(res, 'hello')
+        self.assertTrue(res.succeeded)
+        self.assertTrue(remote_host.file_exists(self.tmpdir))
+        self.assertFalse(remote_host.file_exists(os.path.join(self.tmpdir, 'NO_SUCH_FILE')))
+
+        command = checkservice.CheckService(remote_host=remote_host, check_command='exit 1', timeout=1)
+        self.assertFalse(command.execute())
+
+        command = checkservice.CheckService(remote_host=remote_host, check_command='echo OK', timeout=1)
+        self.assertTrue(command.execute())
+
+    def testFileCommands(self):
+        self.log.info('Testing file commands executed by an agent')
+
+        remote_host = RemoteHost('localhost', use_agent=True)
+        remote_host._agent = self.agent
+
+        source = os.path.join(self.tmpdir, 'service-1')
+        destination = os.path.join(self.tmpdir, 'installed-1')
+        link = os.path.join(self.tmpdir, 'service')
+        os.mkdir(source)
+        os.mkdir(destination)
+
+        command = movefile.MoveFile(remote_host=remote_host, source=source, destination=destination, clobber=False)
+        self.assertFalse(command.execute())
+
+        command = movefile.MoveFile(remote_host=remote_host, source=source, destination=destination)
+        self.assertTrue(command.execute())
+        self.assertFalse(os.path.exists(source))
+
+        for attempt in range(2):
+            command = symlink.SymLink(remote_host=remote_host, source=destination, destination=link)
+            self.assertTrue(command.execute())
+            self.assertEqual(os.readlink(link), 'installed-1')
+
+        command = removefile.RemoveFile(remote_host=remote_host, source=destination)
+        self.assertTrue(command.execute())
+        self.assertFalse(os.path.exists(destination))
+
+    def testRequiresWorkers(self):
+        self.log.info('Testing that agents are only used by a worker pool')
+
+        tasklist = {'name': 'Agent', 'stages': []}
+
+        with self.assertRaises(DeployerException):
+            Executor(tasklist=tasklist, agent=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
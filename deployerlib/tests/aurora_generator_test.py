@@ -1,5 +1,8 @@
 #! /usr/bin/env python
 
+import os
+import shutil
+import tempfile
 import unittest
 import mock
 import collections
@@ -9,6 +12,8 @@ from deployerlib.commandline import CommandLine
 import deployerlib.generators
 from deployerlib.generators import *
 from deployerlib.config import Config
+from deployerlib.executor import Executor
+from deployerlib.inventory import Inventory
 
 from deployerlib.tests._fakepackage import FakePackage
 
@@ -113,6 +118,232 @@ class AuroraGeneratorTest(unittest.TestCase):
         self.log.info("%s" % tasklist)
         self.assertTrue(self.containsDeployMonitorNotify(tasklist))
 
+    @mock.patch('deployerlib.generators.aurora.AuroraGenerator.get_remote_versions')
+    def test_auroraGeneratorShouldRelayUploads(self, mock_get_remote_versions):
+        mock_get_remote_versions.return_value = {}
+
+        commandline = CommandLine(require_config=False)
+        config = Config(commandline)
+
+        for key, value in self.getConfig().items():
+            config[key] = value
+
+        config.hostgroup['frontend']['hosts'] = ['fe00{0}'.format(x) for x in range(1, 8)]
+        config.service['fe-frontend']['min_nodes_up'] = 0
+        config.platform = 'aurora'
+        config.skip_lb_control = True
+        config.upload_relay = {'seeds': 1, 'fanout': 2}
+        config.upload_window = {'megabytes': 100}
+        config.log = Log('TestConfig')
+
+        fakepackage = FakePackage(servicename='fe-frontend')
+        config.component.append(fakepackage.fullpath)
+        config.deployment_order = ['fe-frontend']
+
+        generator = aurora.AuroraGenerator(config)
+        tasklist = generator.generate()
+
+        stages = dict([(x['name'], x['tasks']) for x in tasklist['stages']])
+        names = [x['name'] for x in tasklist['stages']]
+
+        # The deployer uploads to one seed, which relays to two peers, which with the seed relay to the rest
+        self.assertEqual(names[names.index('Upload'):names.index('Upload') + 3], ['Upload', 'Upload relay 1', 'Upload relay 2'])
+        self.assertEqual([(x['remote_host'], x.get('source_host')) for x in stages['Upload']], [('fe001', None)])
+        self.assertEqual([(x['remote_host'], x['source_host']) for x in stages['Upload relay 1']],
+          [('fe002', 'fe001'), ('fe003', 'fe001')])
+        self.assertEqual([(x['remote_host'], x['source_host']) for x in stages['Upload relay 2']],
+          [('fe004', 'fe001'), ('fe005', 'fe001'), ('fe006', 'fe002'), ('fe007', 'fe002')])
+        self.assertEqual(set([x['command'] for x in stages['Upload'] + stages['Upload relay 2']]), set(['relay']))
+        self.assertEqual(set([(x['strict_host_keys'], x['forward_agent']) for x in stages['Upload relay 1']]),
+          set([(True, False)]))
+
+        # Relays from peers may fall back to uploading from the deployer, so they are limited like uploads
+        self.assertEqual([x['resources'] for x in stages['Upload'] + stages['Upload relay 1'] + stages['Upload relay 2']],
+          [{'upload_megabytes': 1}] * 7)
+
+        # Every upload task carries the checksum of the (empty) package
+        self.assertEqual(set([x['checksum'] for x in stages['Upload'] + stages['Upload relay 1']]),
+          set(['d41d8cd98f00b204e9800998ecf8427e']))
+
+        # In a dependency graph a relay waits for the upload to the host it copies from
+        executor = Executor(tasklist=tasklist, dag=True)
+        executor.link_stages()
+        jobs = dict([((x._stage, x._remote_host), x) for stage in executor.stages for x in executor.stage_jobs(stage)])
+
+        self.assertIn(jobs[('Upload', 'fe001')].name, jobs[('Upload relay 1', 'fe002')].after)
+        self.assertIn(jobs[('Upload relay 1', 'fe002')].name, jobs[('Upload relay 2', 'fe007')].after)
+        self.assertNotIn(jobs[('Upload relay 1', 'fe003')].name, jobs[('Upload relay 2', 'fe007')].after)
+
+    @mock.patch('deployerlib.generators.aurora.AuroraGenerator.get_remote_versions')
+    def test_auroraGeneratorShouldStreamUploadsIntoUnpack(self, mock_get_remote_versions):
+        mock_get_remote_versions.return_value = {}
+
+        commandline = CommandLine(require_config=False)
+        config = Config(commandline)
+
+        for key, value in self.getConfig().items():
+            config[key] = value
+
+        config.platform = 'aurora'
+        config.skip_lb_control = True
+        config.upload_unpack = True
+        config.upload_unpack_keep_copy = False
+        config.log = Log('TestConfig')
+
+        fakepackage = FakePackage(servicename='fe-frontend')
+        config.component.append(fakepackage.fullpath)
+        config.deployment_order = ['fe-frontend']
+
+        generator = aurora.AuroraGenerator(config)
+        tasklist = generator.generate()
+
+        stages = dict([(x['name'], x['tasks']) for x in tasklist['stages']])
+
+        # Each host has one task which uploads and unpacks, and no separate unpack
+        self.assertNotIn('Unpack', stages)
+        self.assertEqual(set([x['command'] for x in stages['Upload']]), set(['upload_unpack']))
+        self.assertEqual(set([x['keep_copy'] for x in stages['Upload']]), set([False]))
+        self.assertEqual(set([x['unpack_dir'] for x in stages['Upload']]), set(['/opt/webapps/_unpack']))
+
+    @mock.patch('deployerlib.generator.socket.gethostbyname')
+    @mock.patch('deployerlib.generators.aurora.AuroraGenerator.get_remote_versions')
+    def test_auroraGeneratorShouldWeighUploadsBySize(self, mock_get_remote_versions, mock_gethostbyname):
+        mock_get_remote_versions.return_value = {}
+        mock_gethostbyname.side_effect = lambda x: {'fe001': '10.0.1.10', 'fe002': '10.0.2.10'}[x]
+
+        commandline = CommandLine(require_config=False)
+        config = Config(commandline)
+
+        for key, value in self.getConfig().items():
+            config[key] = value
+
+        config.platform = 'aurora'
+        config.skip_lb_control = True
+        config.upload_window = {'megabytes': 100, 'subnet_megabytes': 10}
+        config.log = Log('TestConfig')
+
+        fakepackage = FakePackage(servicename='fe-frontend')
+
+        with open(fakepackage.fullpath, 'w') as f:
+            f.write('x' * 3 * 1048576)
+
+        config.component.append(fakepackage.fullpath)
+        config.deployment_order = ['fe-frontend']
+
+        generator = aurora.AuroraGenerator(config)
+        tasklist = generator.generate()
+
+        stages = dict([(x['name'], x['tasks']) for x in tasklist['stages']])
+
+        self.assertEqual(dict([(x['remote_host'], x['resources']) for x in stages['Upload']]), {
+          'fe001': {'upload_megabytes': 3, 'upload_subnet:10.0.1.0/24': 3},
+          'fe002': {'upload_megabytes': 3, 'upload_subnet:10.0.2.0/24': 3},
+        })
+        self.assertEqual(tasklist['resources'], {'upload_megabytes': 100, 'upload_subnet:10.0.1.0/24': 10,
+          'upload_subnet:10.0.2.0/24': 10})
+
+        # The tasklist is accepted by the executor
+        Executor(tasklist=tasklist)
+
+    @mock.patch('deployerlib.generator.Generator.gather_host_facts')
+    def test_auroraGeneratorShouldUseInventory(self, mock_gather_host_facts):
+        mock_gather_host_facts.return_value = {'fe002': {
+          'links': {'/opt/webapps/fe-frontend': '/opt/webapps/fe-frontend_OLD-VERSION'},
+          'properties': {},
+          'daemontools': {},
+          'free_kb': {},
+          'artifacts': {},
+        }}
+
+        commandline = CommandLine(require_config=False)
+        config = Config(commandline)
+
+        for key, value in self.getConfig().items():
+            config[key] = value
+
+        config.platform = 'aurora'
+        config.skip_lb_control = True
+        config.log = Log('TestConfig')
+
+        fakepackage = FakePackage(servicename='fe-frontend')
+        config.component.append(fakepackage.fullpath)
+        config.deployment_order = ['fe-frontend']
+
+        tmpdir = tempfile.mkdtemp()
+        config.inventory = os.path.join(tmpdir, 'inventory.sqlite')
+
+        try:
+            # fe001 was scanned recently and already has the version
+            Inventory(config.inventory).update_host('fe001', ['fe-frontend'],
+              {'fe-frontend': fakepackage.packagename.split('_', 1)[1]})
+
+            generator = aurora.AuroraGenerator(config)
+            tasklist = generator.generate()
+
+            # Only the hosts of the package being deployed are scanned
+            self.assertEqual(mock_gather_host_facts.call_args[0][0], {'fe002': ['fe-frontend']})
+
+            deployed = [x[-1]['inventory']['host'] for stage in tasklist['stages'] for x in stage['tasks']
+              if type(x) is list and 'inventory' in x[-1]]
+            self.assertEqual(deployed, ['fe002'])
+
+            self.assertEqual(Inventory(config.inventory).stale(generator.version_targets(['fe-frontend'])), {})
+
+            # All of them are scanned again on request
+            config.refresh_inventory = True
+            aurora.AuroraGenerator(config).generate()
+            self.assertEqual(mock_gather_host_facts.call_args[0][0], {'fe001': ['fe-frontend'], 'fe002': ['fe-frontend']})
+
+            # Hosts that could not be scanned keep their versions
+            mock_gather_host_facts.return_value = {}
+            aurora.AuroraGenerator(config).generate()
+            self.assertEqual(Inventory(config.inventory).versions(['fe001', 'fe002']), {'fe-frontend': {
+              'fe001': fakepackage.packagename.split('_', 1)[1], 'fe002': 'OLD-VERSION'}})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @mock.patch('deployerlib.generator.Generator.gather_host_facts')
+    def test_auroraGeneratorShouldUseHostFacts(self, mock_gather_host_facts):
+        commandline = CommandLine(require_config=False)
+        config = Config(commandline)
+
+        for key, value in self.getConfig().items():
+            config[key] = value
+
+        config.platform = 'aurora'
+        config.skip_lb_control = True
+        config.log = Log('TestConfig')
+
+        fakepackage = FakePackage(servicename='fe-frontend')
+        config.component.append(fakepackage.fullpath)
+        config.deployment_order = ['fe-frontend']
+
+        def facts(target, artifacts):
+            return {
+              'links': {'/opt/webapps/fe-frontend': '/opt/webapps/{0}'.format(target)},
+              'properties': {},
+              'daemontools': {},
+              'free_kb': {'/opt/tarballs': 1024 * 1024, '/opt/webapps': 1024 * 1024},
+              'artifacts': {'/opt/tarballs': artifacts},
+            }
+
+        mock_gather_host_facts.return_value = {
+          'fe001': facts(fakepackage.packagename, [fakepackage.filename]),
+          'fe002': facts('fe-frontend_OLD_VERSION', ['fe-frontend_OLD_VERSION.tar.gz']),
+        }
+
+        generator = aurora.AuroraGenerator(config)
+        tasklist = generator.generate()
+
+        # The facts of the hosts of the package are gathered once
+        mock_gather_host_facts.assert_called_once_with({'fe001': ['fe-frontend'], 'fe002': ['fe-frontend']})
+
+        # Only the host with another version is deployed to, and its upload knows what is in destination
+        uploads = [x for stage in tasklist['stages'] if stage['name'] == 'Upload' for x in stage['tasks']]
+        self.assertEqual([(x['remote_host'], x['artifacts']) for x in uploads], [('fe002', ['fe-frontend_OLD_VERSION.tar.gz'])])
+
+        Executor(tasklist=tasklist)
+
     def containsDeployMonitorNotify(self, tasklist):
         stages_exists = ('Pipeline notify deploying' in map(lambda i: i['name'], tasklist['stages'])
         and
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+
+import os
+import hashlib
+import tempfile
+import unittest
+
+from deployerlib.log import Log
+from deployerlib.checksum import ChecksumCache, checksums, command_algorithm
+from deployerlib.commands import upload
+from deployerlib.remotehost import RemoteHost
+from deployerlib.exceptions import DeployerException
+
+
+class ChecksumTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+        fd, self.filename = tempfile.mkstemp(suffix='.tar.gz')
+        os.write(fd, 'x' * 10000)
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def testCache(self):
+        self.log.info('Testing the checksum cache')
+
+        cache = ChecksumCache(chunk_size=1000)
+        computed = []
+        compute = cache.compute
+        cache.compute = lambda path, algorithm: computed.append(path) or compute(path, algorithm)
+
+        self.assertEqual(cache.get(self.filename), hashlib.md5('x' * 10000).hexdigest())
+        self.assertEqual(cache.get(self.filename), hashlib.md5('x' * 10000).hexdigest())
+        self.assertEqual(len(computed), 1)
+
+        self.assertEqual(cache.get(self.filename, 'sha1'), hashlib.sha1('x' * 10000).hexdigest())
+        self.assertEqual(len(computed), 2)
+
+        # A file that changes is checksummed again
+        with open(self.filename, 'a') as f:
+            f.write('y')
+
+        self.assertEqual(cache.get(self.filename), hashlib.md5('x' * 10000 + 'y').hexdigest())
+        self.assertEqual(len(computed), 3)
+
+        with self.assertRaises(DeployerException):
+            cache.get('/tmp/NO_SUCH_FILE')
+
+        with self.assertRaises(DeployerException):
+            cache.get(self.filename, 'NO_SUCH_ALGORITHM')
+
+    def testCommandAlgorithm(self):
+        self.log.info('Testing checksum command names')
+
+        self.assertEqual(command_algorithm('/usr/bin/md5sum'), 'md5')
+        self.assertEqual(command_algorithm('sha256sum'), 'sha256')
+        self.assertEqual(command_algorithm('/usr/bin/cksum'), None)
+        self.assertEqual(command_algorithm(None), None)
+
+    def testUpload(self):
+        self.log.info('Testing that uploads share the checksum of their source')
+
+        hosts = [RemoteHost('host{0}'.format(x), transport='simulated') for x in range(3)]
+        commands = [upload.Upload(remote_host=x, source=self.filename, destination='/tmp') for x in hosts]
+
+        # Nothing is read until the checksum is needed
+        self.assertEqual(len([x for x in checksums._checksums if x[0] == self.filename]), 0)
+        self.assertEqual(set([x.local_checksum() for x in commands]), set([hashlib.md5('x' * 10000).hexdigest()]))
+        self.assertEqual(len([x for x in checksums._checksums if x[0] == self.filename]), 1)
+
+        # The checksum can be given in the task
+        command = upload.Upload(remote_host=hosts[0], source=self.filename, destination='/tmp', checksum='abc')
+        self.assertEqual(command.checksum, 'abc')
+        self.assertFalse(command.match_checksum())
+
+        for command in commands:
+            self.assertFalse(command.match_checksum())
+            self.assertTrue(command.execute())
+            self.assertTrue(command.match_checksum())
+            self.assertEqual(command.transferred, 10000)
+
+        # Nothing is sent when the file is already in place
+        command = upload.Upload(remote_host=hosts[0], source=self.filename, destination='/tmp')
+        self.assertTrue(command.execute())
+        self.assertEqual(command.transferred, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
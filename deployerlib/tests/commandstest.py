@@ -1,6 +1,10 @@
 #! /usr/bin/env python
 
+import os
+import shutil
+import tempfile
 import unittest
+import subprocess
 
 import deployerlib.commands
 
@@ -8,11 +12,33 @@ from deployerlib.log import Log
 from deployerlib.remotehost import RemoteHost
 from deployerlib.command import Command
 from deployerlib.exceptions import DeployerException
+from deployerlib.transport import TransferResult
 
 import deployerlib.commands
 from deployerlib.commands import *
 
 
+class LocalShell(object):
+    """Runs remote commands in a local shell, returning output like fabric"""
+
+    hostname = 'localhost'
+
+    def execute_remote(self, command):
+        process = subprocess.Popen(['/bin/bash', '-c', command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+
+        res = ShellResult(output.rstrip('\n'))
+        res.return_code = process.returncode
+        res.succeeded = process.returncode == 0
+        res.failed = not res.succeeded
+
+        return res
+
+
+class ShellResult(str):
+    pass
+
+
 class CommandsTest(unittest.TestCase):
 
     def setUp(self):
@@ -46,6 +72,40 @@ class CommandsTest(unittest.TestCase):
         self.verifyCommand(command)
         command.execute()
 
+    def testCommand_batch(self):
+        command = batch.Batch(remote_host=self.remote_host, steps=[{'command': 'removefile', 'source': '/tmp/NO_SUCH_FILE'}])
+        self.verifyCommand(command)
+
+        with self.assertRaises(DeployerException):
+            batch.Batch(remote_host=self.remote_host, steps=[{'command': 'execute_command', 'command': '/bin/true'}])
+
+        tmpdir = tempfile.mkdtemp()
+        unpacked = os.path.join(tmpdir, 'unpack', 'service-1')
+        installed = os.path.join(tmpdir, 'service-1')
+        link = os.path.join(tmpdir, 'service')
+
+        steps = [
+          {'command': 'createdirectory', 'source': unpacked},
+          {'command': 'movefile', 'source': unpacked, 'destination': installed},
+          {'command': 'symlink', 'source': installed, 'destination': link},
+        ]
+
+        try:
+            command = batch.Batch(remote_host=LocalShell(), steps=steps)
+            self.assertTrue(command.execute())
+            self.assertEqual(os.readlink(link), 'service-1')
+            self.assertTrue(command.execute())
+
+            # A failed step stops the batch
+            command = batch.Batch(remote_host=LocalShell(), steps=[
+              {'command': 'movefile', 'source': os.path.join(tmpdir, 'NO_SUCH_FILE'), 'destination': installed},
+              {'command': 'removefile', 'source': link},
+            ])
+            self.assertFalse(command.execute())
+            self.assertTrue(os.path.islink(link))
+        finally:
+            shutil.rmtree(tmpdir)
+
     def testCommand_copyfile(self):
         command = copyfile.CopyFile(remote_host=self.remote_host, source=__file__, destination='/tmp/')
         self.verifyCommand(command)
@@ -167,6 +227,189 @@ class CommandsTest(unittest.TestCase):
         command = upload.Upload(remote_host=self.remote_host, source='/tmp/NO_SUCH_FILE', destination='/tmp/NO_SUCH_DIRECTORY')
         self.verifyCommand(command)
 
+    def testCommand_relay(self):
+        command = relay.Relay(remote_host=self.remote_host, source='/tmp/NO_SUCH_FILE', destination='/tmp/NO_SUCH_DIRECTORY',
+          source_host='NO_SUCH_HOST')
+        self.verifyCommand(command)
+
+        seed = RemoteHost('seed', transport='simulated')
+        peer = RemoteHost('peer', transport='simulated')
+        remote_file = os.path.join('/tmp', os.path.basename(__file__))
+
+        # The first hop is uploaded from the deployer
+        command = relay.Relay(remote_host=seed, source=__file__, destination='/tmp')
+        self.assertTrue(command.execute())
+        self.assertIn(remote_file, seed.transport.checksums)
+
+        # The next is copied from a peer and verified
+        command = relay.Relay(remote_host=peer, source=__file__, destination='/tmp', source_host='seed')
+        self.assertTrue(command.execute())
+        self.assertEqual(peer.transport.checksums[remote_file], seed.transport.checksums[remote_file])
+        self.assertTrue([x for x in peer.transport.commands if x.startswith('scp -B -o StrictHostKeyChecking=yes ')])
+
+        peer = RemoteHost('peer', transport='simulated')
+        command = relay.Relay(remote_host=peer, source=__file__, destination='/tmp', source_host='seed',
+          strict_host_keys=False)
+        self.assertTrue(command.execute())
+        self.assertTrue([x for x in peer.transport.commands if x.startswith('scp -B -o StrictHostKeyChecking=no ')])
+
+        # A copy that does not match is uploaded from the deployer instead
+        peer = RemoteHost('peer', transport='simulated')
+        seed.transport.checksums[remote_file] = 'NO_SUCH_CHECKSUM'
+
+        command = relay.Relay(remote_host=peer, source=__file__, destination='/tmp', source_host='seed')
+        self.assertTrue(command.execute())
+        self.assertTrue(command.match_checksum())
+
+        # A host that cannot be reached from its peer is uploaded from the deployer
+        peer = RemoteHost('peer', transport='simulated', transport_settings={'responses': {'^scp ': (1, 'Permission denied')}})
+        command = relay.Relay(remote_host=peer, source=__file__, destination='/tmp', source_host='seed')
+        self.assertTrue(command.execute())
+        self.assertTrue(command.match_checksum())
+
+    def testCommand_deltaupload(self):
+        command = deltaupload.DeltaUpload(remote_host=self.remote_host, source='/tmp/NO_SUCH_FILE',
+          destination='/tmp/NO_SUCH_DIRECTORY', basis_filespec='NO_SUCH_FILE_*')
+        self.verifyCommand(command)
+
+        remote_file = os.path.join('/tmp', os.path.basename(__file__))
+
+        # The newest previous version is copied and the file is synced over it
+        host = RemoteHost('delta', transport='simulated', transport_settings={
+          'responses': {'^/bin/ls -1Atd /tmp/commandstest_\*$': (0, '/tmp/commandstest_2\n/tmp/commandstest_1')}})
+        host.transport.paths['/tmp/commandstest_2'] = 'file'
+
+        command = deltaupload.DeltaUpload(remote_host=host, source=__file__, destination='/tmp',
+          basis_filespec='commandstest_*')
+        self.assertEqual(command.find_basis(), '/tmp/commandstest_2')
+        self.assertTrue(command.execute())
+        self.assertIn('/bin/cp -p /tmp/commandstest_2 {0}'.format(remote_file), host.transport.commands)
+        self.assertTrue(command.match_checksum())
+
+        # The previous versions are taken from the host's facts if given
+        host = RemoteHost('delta', transport='simulated')
+        host.transport.paths['/tmp/commandstest_2'] = 'file'
+
+        command = deltaupload.DeltaUpload(remote_host=host, source=__file__, destination='/tmp',
+          basis_filespec='commandstest_*', artifacts=['commandstest_2', 'commandstest_1'])
+        self.assertEqual(command.find_basis(), '/tmp/commandstest_2')
+        self.assertFalse(command.already_uploaded())
+        self.assertFalse(host.transport.commands)
+
+        # Without a previous version the whole file is uploaded
+        host = RemoteHost('delta', transport='simulated', transport_settings={
+          'responses': {'^/bin/ls ': (2, 'No such file or directory')}})
+        command = deltaupload.DeltaUpload(remote_host=host, source=__file__, destination='/tmp',
+          basis_filespec='commandstest_*')
+        self.assertEqual(command.find_basis(), None)
+        self.assertTrue(command.execute())
+        self.assertTrue(command.match_checksum())
+
+        # A delta that cannot be transferred falls back to a whole upload
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            with open(os.path.join(tempdir, 'commandstest_1'), 'w') as f:
+                f.write('previous version')
+
+            host = RemoteHost('localhost', transport='local')
+            host.transport.sync = lambda local_file, remote_file, **settings: TransferResult(failed=[local_file])
+
+            command = deltaupload.DeltaUpload(remote_host=host, source=__file__, destination=tempdir,
+              basis_filespec='commandstest_*')
+            self.assertTrue(command.execute())
+            self.assertTrue(command.match_checksum())
+            self.assertEqual(command.transferred, os.path.getsize(__file__))
+
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testCommand_gatherfacts(self):
+        command = gatherfacts.GatherFacts(remote_host=self.remote_host, host_facts={})
+        self.verifyCommand(command)
+
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            for directory in ('webapps/service_2', 'webapps/other_1', 'properties', 'packages', 'supervise/service'):
+                os.makedirs(os.path.join(tempdir, directory))
+
+            os.symlink(os.path.join(tempdir, 'webapps', 'service_2'), os.path.join(tempdir, 'webapps', 'service'))
+            os.symlink(os.path.join(tempdir, 'webapps', 'other_1'), os.path.join(tempdir, 'webapps', 'other'))
+
+            with open(os.path.join(tempdir, 'properties', 'properties_version'), 'w') as f:
+                f.write('3\n')
+
+            for filename in ('service_1.tar.gz', 'service_2.tar.gz', 'other_1.tar.gz'):
+                open(os.path.join(tempdir, 'packages', filename), 'w').close()
+
+            host_facts = {}
+            command = gatherfacts.GatherFacts(remote_host=RemoteHost('localhost', transport='local'), host_facts=host_facts,
+              install_locations={os.path.join(tempdir, 'webapps'): ['service']},
+              properties_defs=[('service-properties', os.path.join(tempdir, 'properties'))],
+              daemontools=['service'], disk_paths=[tempdir],
+              artifacts=[(os.path.join(tempdir, 'packages'), 'service_*')],
+              supervise_path=os.path.join(tempdir, 'supervise'))
+            self.assertTrue(command.execute())
+
+            facts = host_facts['localhost']
+            self.assertEqual(facts['links'], {os.path.join(tempdir, 'webapps', 'service'): os.path.join(tempdir, 'webapps', 'service_2')})
+            self.assertEqual(facts['properties'], {'service-properties': '3'})
+            self.assertEqual(facts['daemontools'], {'service': {'supervised': True, 'registered': False, 'status': None}})
+            self.assertEqual(sorted(facts['artifacts'][os.path.join(tempdir, 'packages')]), ['service_1.tar.gz', 'service_2.tar.gz'])
+            self.assertTrue(facts['free_kb'][tempdir] > 0)
+
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testCommand_uploadunpack(self):
+        command = uploadunpack.UploadUnpack(remote_host=self.remote_host, source='/tmp/NO_SUCH_FILE.tar.gz',
+          destination='/tmp/NO_SUCH_DIRECTORY', unpack_dir='/tmp/NO_SUCH_DIRECTORY')
+        self.verifyCommand(command)
+
+        tempdir = tempfile.mkdtemp()
+
+        try:
+            os.mkdir(os.path.join(tempdir, 'package'))
+
+            with open(os.path.join(tempdir, 'package', 'file'), 'w') as f:
+                f.write('contents')
+
+            source = os.path.join(tempdir, 'package.tar.gz')
+            subprocess.check_call(['/bin/tar', 'czf', source, '-C', tempdir, 'package'])
+
+            local = RemoteHost('localhost', transport='local')
+            destination = os.path.join(tempdir, 'destination')
+            unpack_dir = os.path.join(tempdir, 'unpack')
+
+            # The package is unpacked from the stream and a copy is kept
+            command = uploadunpack.UploadUnpack(remote_host=local, source=source, destination=destination,
+              unpack_dir=unpack_dir)
+            self.assertTrue(command.execute())
+            self.assertTrue(os.path.isfile(os.path.join(unpack_dir, 'package', 'file')))
+            self.assertTrue(command.match_checksum())
+
+            # A kept copy is unpacked without streaming it again
+            shutil.rmtree(unpack_dir)
+            self.assertTrue(command.execute())
+            self.assertTrue(os.path.isfile(os.path.join(unpack_dir, 'package', 'file')))
+
+            # A stream that does not match the checksum fails and is not kept
+            shutil.rmtree(destination)
+            command = uploadunpack.UploadUnpack(remote_host=local, source=source, destination=destination,
+              unpack_dir=unpack_dir, checksum='NO_SUCH_CHECKSUM')
+            self.assertFalse(command.execute())
+            self.assertFalse(os.path.exists(os.path.join(destination, 'package.tar.gz')))
+
+            # Without keep_copy nothing is written to destination
+            command = uploadunpack.UploadUnpack(remote_host=local, source=source, destination=destination,
+              unpack_dir=unpack_dir, keep_copy=False)
+            self.assertTrue(command.execute())
+            self.assertFalse(os.path.exists(os.path.join(destination, 'package.tar.gz')))
+
+        finally:
+            shutil.rmtree(tempdir)
+
     def testCommand_unpack(self):
         command = unpack.Unpack(remote_host=self.remote_host, source='/tmp/NO_SUCH_FILE.tar.gz',
           destination='/tmp/NO_SUCH_DIRECTORY')
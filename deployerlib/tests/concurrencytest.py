@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+
+import unittest
+
+from deployerlib.log import Log
+from deployerlib.concurrency import AdaptiveConcurrency
+
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+
+    def finish(self, adaptive, count, duration, success=True):
+        for i in range(count):
+            adaptive.update(duration, success)
+
+        return adaptive.limit
+
+    def testIncrease(self):
+        self.log.info('Testing that concurrency increases while jobs are healthy')
+        adaptive = AdaptiveConcurrency(3, 20)
+
+        self.assertEqual(adaptive.limit, 3)
+        self.assertEqual(self.finish(adaptive, 2, 10), 6)
+        self.assertEqual(self.finish(adaptive, 3, 10), 12)
+        self.assertEqual(self.finish(adaptive, 6, 10), 20)
+        self.assertEqual(self.finish(adaptive, 100, 10), 20)
+
+    def testBackoff(self):
+        self.log.info('Testing that concurrency decreases when jobs slow down or fail')
+        adaptive = AdaptiveConcurrency(3, 20)
+
+        self.assertEqual(self.finish(adaptive, 2, 10), 6)
+        self.assertEqual(self.finish(adaptive, 3, 10), 12)
+        self.assertEqual(self.finish(adaptive, 6, 20), 6)
+
+        # After backing off, increase one job at a time
+        self.assertEqual(self.finish(adaptive, 3, 10), 7)
+        self.assertEqual(self.finish(adaptive, 3, 10, success=False), 3)
+        self.assertEqual(self.finish(adaptive, 2, 10, success=False), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
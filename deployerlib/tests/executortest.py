@@ -1,11 +1,17 @@
 #! /usr/bin/env python
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from deployerlib.log import Log
 from deployerlib.config import Config
 from deployerlib.generatorhelper import GeneratorHelper
 from deployerlib.executor import Executor
+from deployerlib.journal import Journal
+from deployerlib.durations import DurationStore
+from deployerlib.inventory import Inventory
 from deployerlib.exceptions import DeployerException
 
 
@@ -31,6 +37,294 @@ class ExecutorTest(unittest.TestCase):
         executor = Executor(tasklist=self.builder.tasklist)
         self.assertTrue(executor.run())
 
+    def testRunDag(self):
+        self.log.info('Executing generated task list as a dependency graph')
+        executor = Executor(tasklist=self.builder.tasklist, dag=True)
+        self.assertTrue(executor.run())
+
+    def testRunWorkers(self):
+        self.log.info('Executing generated task list with a worker pool')
+        executor = Executor(tasklist=self.builder.tasklist, workers=2)
+        self.assertTrue(executor.run())
+        self.assertEqual(len(executor.pool), 0)
+
+    def testRunWorkersEventDriven(self):
+        self.log.info('Executing a task list with an event-driven worker pool')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x)} for x in range(5)]
+        tasklist = {
+          'name': 'Worker pool',
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 3, 'tasks': tasks},
+            {'name': 'Stage 2', 'concurrency': 1, 'tasks': [tasks]},
+          ],
+        }
+
+        executor = Executor(tasklist=tasklist, workers=2, event_driven=True)
+        self.assertTrue(executor.run())
+
+    def testRunAdaptive(self):
+        self.log.info('Executing a task list with adaptive concurrency')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x)} for x in range(8)]
+        tasklist = {
+          'name': 'Adaptive',
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 1, 'max_concurrency': 4, 'tasks': tasks},
+          ],
+        }
+
+        for dag in (False, True):
+            executor = Executor(tasklist=tasklist, dag=dag, event_driven=True)
+            self.assertEqual(executor.adaptive_concurrency(executor.stages[0]).maximum, 4)
+            self.assertTrue(executor.run())
+
+    def testResources(self):
+        self.log.info('Executing a task list with resource limits')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x), 'resources': ['database']} for x in range(3)]
+        tasks.append({'command': 'test_command', 'message': 'Task 3', 'resources': {'database': 2}})
+        tasklist = {
+          'name': 'Resources',
+          'resources': {'database': 1},
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 2, 'tasks': tasks[:2]},
+            {'name': 'Stage 2', 'concurrency': 2, 'tasks': tasks[2:]},
+          ],
+        }
+
+        for dag in (False, True):
+            executor = Executor(tasklist=tasklist, dag=dag, event_driven=True)
+            self.assertEqual(executor.resources, {'database': 1})
+            self.assertEqual(executor.stage_jobs(executor.stages[1])[1]._resources, {'database': 2})
+            self.assertTrue(executor.run())
+
+        with self.assertRaises(DeployerException):
+            Executor(tasklist=dict(tasklist, resources={'database': 0}))
+
+        with self.assertRaises(DeployerException):
+            Executor(tasklist={'name': 'Resources', 'stages': [
+              {'name': 'Stage 1', 'concurrency': 1, 'tasks': [dict(tasks[0], resources='database')]}]})
+
+    def testThroughput(self):
+        self.log.info('Recording the data transferred by the tasks of a stage')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x)} for x in range(4)]
+        tasklist = {
+          'name': 'Throughput',
+          'stages': [{'name': 'Stage 1', 'concurrency': 2, 'tasks': tasks}],
+        }
+
+        executor = Executor(tasklist=tasklist, event_driven=True)
+        jobs = executor.stage_jobs(executor.stages[0])
+
+        # The bytes each command reports it sent
+        for idx, job in enumerate(jobs[:3]):
+            executor.remote_results.writer.record(job.name, 'transferred', 1048576 * idx)
+
+        executor.remote_results.collect()
+
+        for idx, job in enumerate(jobs):
+            executor.job_finished(job, idx != 2, 10.0 + idx, 12.0 + idx)
+
+        # Failed tasks, and tasks which sent nothing, are not counted
+        self.assertEqual(executor._transfers, {'Stage 1': (1048576, 11.0, 13.0)})
+        self.assertEqual(executor.remote_results.details, {})
+
+        executor.log_throughput('Stage 1')
+        self.assertEqual(executor._transfers, {})
+
+        executor.stages[0]['jobs'] = None
+        self.assertTrue(executor.run())
+
+    def testLazyJobs(self):
+        self.log.info('Creating the jobs of a stage when it runs')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x)} for x in range(3)]
+        tasklist = {
+          'name': 'Lazy',
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 2, 'tasks': [tasks[0], tasks[1:]]},
+          ],
+        }
+
+        executor = Executor(tasklist=tasklist)
+        stage = executor.stages[0]
+        self.assertEqual([x['entry'] for x in stage['tasks']], [0, 1, 1])
+        self.assertEqual(stage.get('jobs'), None)
+
+        first, second, third = executor.stage_jobs(stage)
+        self.assertEqual(second.depends, None)
+        self.assertEqual(third.depends, second.name)
+        self.assertTrue(executor.stage_jobs(stage)[0] is first)
+
+        self.assertTrue(executor.run())
+        self.assertEqual(stage['jobs'], None)
+
+        for task in [{'command': 'test_command'}, {'command': 'test_command', 'message': 'Task', 'unknown': 1},
+          {'command': 'no_such_command'}]:
+
+            with self.assertRaises(DeployerException):
+                Executor(tasklist={'name': 'Invalid', 'stages': [{'name': 'Stage 1', 'concurrency': 1, 'tasks': [task]}]})
+
+    def testLinkStages(self):
+        self.log.info('Linking stages into a dependency graph')
+
+        def task(hostname, path):
+            return {'command': 'createdirectory', 'remote_host': hostname, 'source': path}
+
+        tasklist = {
+          'name': 'Link stages',
+          'stages': [
+            {'name': 'Upload', 'concurrency': 2, 'pipelined': True,
+              'tasks': [task('host1', '/tmp/upload'), task('host2', '/tmp/upload')]},
+            {'name': 'Deploy host1', 'concurrency': 1,
+              'tasks': [[task('host1', '/tmp/deploy1'), task('host1', '/tmp/deploy2')]]},
+            {'name': 'Deploy host2', 'concurrency': 1,
+              'tasks': [task('host2', '/tmp/deploy1')]},
+            {'name': 'Notify', 'concurrency': 1,
+              'tasks': [{'command': 'test_command', 'message': 'Done'}]},
+          ],
+        }
+
+        executor = Executor(tasklist=tasklist, dag=True)
+        executor.link_stages()
+
+        upload1, upload2 = executor.stage_jobs(executor.stages[0])
+        deploy1a, deploy1b = executor.stage_jobs(executor.stages[1])
+        deploy2 = executor.stage_jobs(executor.stages[2])[0]
+        notify = executor.stage_jobs(executor.stages[3])[0]
+
+        self.assertEqual(upload1.after, [])
+        self.assertEqual(deploy1a.after, [upload1.name])
+        self.assertEqual(deploy1b.after, [])
+        self.assertEqual(deploy1b.depends, deploy1a.name)
+        self.assertEqual(deploy2.after, sorted([deploy1a.name, deploy1b.name, upload2.name]))
+        self.assertEqual(notify.after, sorted([deploy1a.name, deploy1b.name, deploy2.name]))
+
+    def testResume(self):
+        self.log.info('Resuming a task list from a journal')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x)} for x in range(3)]
+        tasklist = {
+          'name': 'Resume',
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 2, 'tasks': tasks},
+            {'name': 'Stage 2', 'concurrency': 1, 'tasks': [tasks]},
+          ],
+        }
+
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, 'deploy.journal')
+
+        try:
+            executor = Executor(tasklist=tasklist, journal=filename)
+            self.assertTrue(executor.run())
+            self.assertEqual(len(Journal(filename).succeeded()), 6)
+
+            executor = Executor(tasklist=tasklist, journal=filename, resume=True)
+            self.assertEqual(executor.stages, [])
+
+            # The first task of the list in stage 2 failed, then succeeded on a retry
+            os.remove(filename)
+            journal = Journal(filename)
+            first, second, third = Executor(tasklist=tasklist).stages[1]['tasks']
+            journal.record(id=first['id'], success=False)
+            journal.record(id=first['id'], success=True)
+
+            executor = Executor(tasklist=tasklist, journal=filename, resume=True)
+            self.assertEqual(len(executor.stages), 2)
+            self.assertEqual(len(executor.stages[0]['tasks']), 3)
+
+            second, third = executor.stage_jobs(executor.stages[1])
+            self.assertEqual(second.depends, None)
+            self.assertEqual(third.depends, second.name)
+            self.assertTrue(executor.run())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def testInventory(self):
+        self.log.info('Recording deployed versions in the inventory')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x),
+          'inventory': {'host': 'host{0}'.format(x), 'name': 'service', 'version': '2'}} for x in range(2)]
+        tasklist = {
+          'name': 'Inventory',
+          'stages': [{'name': 'Stage 1', 'concurrency': 2, 'tasks': tasks}],
+        }
+
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, 'inventory.sqlite')
+
+        try:
+            inventory = Inventory(filename, ttl=60)
+            self.assertEqual(inventory.stale({'host0': ['service'], 'host1': ['service']}),
+              {'host0': ['service'], 'host1': ['service']})
+
+            inventory.update_host('host0', ['service', 'other'], {'service': '1', 'other': '1'})
+            inventory.update_host('host1', ['service'], {})
+            self.assertEqual(inventory.stale({'host0': ['service', 'other'], 'host1': ['service', 'other'], 'host2': ['service']}),
+              {'host1': ['other'], 'host2': ['service']})
+            self.assertEqual(inventory.versions(['host0', 'host1']), {'service': {'host0': '1'}, 'other': {'host0': '1'}})
+            self.assertEqual(inventory.versions(['host0', 'host1'], ['other']), {'other': {'host0': '1'}})
+
+            executor = Executor(tasklist=tasklist, inventory=filename)
+            self.assertTrue(executor.run())
+
+            self.assertEqual(inventory.versions(['host0', 'host1']), {'service': {'host0': '2', 'host1': '2'},
+              'other': {'host0': '1'}})
+
+            # A scan replaces only the versions it was for
+            inventory.update_host('host0', ['service'], {'service': '3'})
+            self.assertEqual(inventory.versions(['host0']), {'service': {'host0': '3'}, 'other': {'host0': '1'}})
+            inventory.update_host('host0', ['other'], {})
+            self.assertEqual(inventory.versions(['host0']), {'service': {'host0': '3'}})
+
+            inventory = Inventory(filename, ttl=0)
+            self.assertEqual(inventory.stale({'host0': ['service']}), {'host0': ['service']})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def testLongestFirst(self):
+        self.log.info('Ordering tasks by historical duration')
+
+        tasks = [{'command': 'test_command', 'message': 'Task {0}'.format(x), 'tag': 'service{0}'.format(x)} for x in range(3)]
+        tasklist = {
+          'name': 'Longest first',
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 1, 'tasks': [tasks[0], [tasks[1], tasks[2]]]},
+          ],
+        }
+
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, 'durations.sqlite')
+
+        try:
+            durations = DurationStore(filename)
+            durations.record(('test_command', 'service0', 'local'), 10)
+            durations.record(('test_command', 'service1', 'local'), 4)
+            durations.record(('test_command', 'service2', 'local'), 4)
+            durations.record(('test_command', 'service2', 'local'), 14)
+            self.assertEqual(durations.estimate(('test_command', 'service2', 'local')), 7)
+            self.assertEqual(durations.estimate(('test_command', 'service2', 'otherhost')), 7)
+            self.assertEqual(durations.estimate(('test_command', 'service3', 'local')), 7)
+            self.assertEqual(durations.estimate(('other_command', 'service0', 'local')), None)
+            durations.close()
+
+            executor = Executor(tasklist=tasklist, durations=filename, longest_first=True)
+            first, second, third = executor.stage_jobs(executor.stages[0])
+            ranks = executor.prioritize([first, second, third])
+
+            self.assertEqual(ranks[first.name], 10)
+            self.assertEqual(ranks[second.name], 11)
+            self.assertEqual(ranks[third.name], 7)
+            self.assertTrue(second._priority < first._priority)
+            self.assertTrue(executor.run())
+
+            self.assertEqual(len(DurationStore(filename)._durations), 3)
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
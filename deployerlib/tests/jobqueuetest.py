@@ -8,8 +8,10 @@ from deployerlib.log import Log
 from deployerlib.config import Config
 from deployerlib.generatorhelper import GeneratorHelper
 from deployerlib.jobqueue import JobQueue
+from deployerlib.resultchannel import ResultChannel
 from deployerlib.exceptions import DeployerException
 from deployerlib.commands import testcommand
+from deployerlib.tests._fakejob import FakeJob
 
 
 class JobQueueTest(unittest.TestCase):
@@ -49,6 +51,246 @@ class JobQueueTest(unittest.TestCase):
 
         self.assertTrue(job_queue.run())
 
+    def testEventDriven(self):
+        self.log.info('Testing event-driven execution')
+        self.results.clear()
+
+        job_queue = JobQueue(self.results, 2, 1, event_driven=True)
+        job_queue.append(self.job_list)
+        job_queue.close()
+
+        self.assertTrue(job_queue.run())
+        self.assertEqual(len(job_queue._completed), len(self.job_list))
+        self.assertFalse(job_queue._sentinels)
+
+    def testSentinels(self):
+        self.log.info('Testing that sentinels are released when jobs are reaped')
+        self.results.clear()
+
+        job_queue = JobQueue(self.results, 5, 5, event_driven=True)
+        job_queue.append(self.job_list)
+        job_queue.close()
+        job_queue._prepare()
+        job_queue._fill()
+
+        self.assertEqual(len(job_queue._sentinels), len(self.job_list))
+
+        # Jobs found to have exited by polling, before their pipe was read
+        for job in self.job_list:
+            job.join()
+
+        job_queue._reap(list(job_queue._running))
+        self.assertFalse(job_queue._sentinels)
+
+    def testResultChannel(self):
+        self.log.info('Testing execution with a result channel')
+        results = ResultChannel()
+
+        for event_driven in (False, True):
+            results.clear()
+            job_list = []
+
+            for message in ('test1', 'test2', 'test3'):
+                command = testcommand.TestCommand(message=message)
+                process = Process(target=command.thread_execute, name=repr(command), args=[repr(command), results.writer])
+                process._host = message
+                job_list.append(process)
+
+            job_queue = JobQueue(results, 2, 1, event_driven=event_driven)
+            job_queue.append(job_list)
+            job_queue.close()
+
+            self.assertTrue(job_queue.run())
+            self.assertEqual(sorted(results.keys()), sorted([x.name for x in job_list]))
+            self.assertTrue(all(results.values()))
+
+    def testResultChannelFailure(self):
+        self.log.info('Testing a job which exits without a result')
+        results = ResultChannel()
+
+        process = Process(target=results.writer.__setitem__, name='no result', args=['no result', None])
+        process._host = 'test1'
+
+        job_queue = JobQueue(results, 1, 1)
+        job_queue.append([process])
+        job_queue.close()
+
+        self.assertFalse(job_queue.run())
+        self.assertEqual(results['no result'], None)
+
+    def testScheduling(self):
+        self.log.info('Testing limits and dependencies')
+        results = {}
+
+        jobs = [
+          FakeJob('a1', 'host1', group=0),
+          FakeJob('a2', 'host1', group=0, depends='a1'),
+          FakeJob('b1', 'host2', group=0),
+          FakeJob('c1', 'host1', group=1),
+          FakeJob('d1', 'host3', group=1, after=['a2', 'b1']),
+        ]
+
+        job_queue = JobQueue(results, 3, 1, event_driven=True)
+        job_queue.set_group_limits(1, 1)
+        job_queue.append(jobs)
+        job_queue.close()
+        job_queue._prepare()
+
+        def finish(name, result=True):
+            job = [x for x in job_queue._running if x.name == name][0]
+            job.exitcode = 0
+            results[name] = result
+            job_queue._reap([job])
+
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['a1', 'b1'])
+
+        finish('a1')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['a2', 'b1'])
+
+        finish('b1')
+        finish('a2')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['c1'])
+
+        finish('c1')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['d1'])
+
+        finish('d1')
+        self.assertFalse(job_queue._queued)
+        self.assertFalse(job_queue._abort_flag)
+
+    def testPriority(self):
+        self.log.info('Testing that jobs with a lower priority value start first')
+        results = {}
+
+        jobs = [FakeJob('job{0}'.format(x), 'host{0}'.format(x)) for x in range(4)]
+        jobs[2]._priority = -10
+        jobs[3]._priority = -5
+
+        job_queue = JobQueue(results, 2, event_driven=True)
+        job_queue.append(jobs)
+        job_queue.close()
+        job_queue._prepare()
+        job_queue._fill()
+
+        self.assertEqual([x.name for x in job_queue._running], ['job2', 'job3'])
+
+    def testResources(self):
+        self.log.info('Testing resource limits across groups')
+        results = {}
+
+        jobs = [
+          FakeJob('lb1', 'host1', group=0, resources={'loadbalancer': 1}),
+          FakeJob('lb2', 'host2', group=1, resources={'loadbalancer': 1}),
+          FakeJob('up1', 'host3', group=0, resources={'upload': 2}),
+          FakeJob('up2', 'host4', group=1, resources={'upload': 1}),
+          FakeJob('up3', 'host5', group=1, resources={'upload': 3}),
+          FakeJob('other', 'host6', group=1),
+        ]
+
+        job_queue = JobQueue(results, 10, event_driven=True)
+        job_queue.set_resource_limits({'loadbalancer': 1, 'upload': 2})
+        job_queue.append(jobs)
+        job_queue.close()
+        job_queue._prepare()
+
+        def finish(name):
+            job = [x for x in job_queue._running if x.name == name][0]
+            job.exitcode = 0
+            results[name] = True
+            job_queue._reap([job])
+
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['lb1', 'other', 'up1'])
+
+        finish('lb1')
+        finish('up1')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['lb2', 'other', 'up2'])
+
+        # A job heavier than the limit runs once the resource is free
+        finish('up2')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['lb2', 'other', 'up3'])
+
+        finish('up3')
+        self.assertEqual(job_queue._resource_running, {'loadbalancer': 1})
+
+    def testResourcePacking(self):
+        self.log.info('Testing that lighter jobs use the weight a heavier job is waiting for')
+        results = {}
+
+        jobs = [
+          FakeJob('big1', 'host1', resources={'upload_megabytes': 500}),
+          FakeJob('big2', 'host2', resources={'upload_megabytes': 500}),
+          FakeJob('small1', 'host3', resources={'upload_megabytes': 2}),
+          FakeJob('small2', 'host4', resources={'upload_megabytes': 2}),
+          FakeJob('small3', 'host5', resources={'upload_megabytes': 2}),
+        ]
+
+        job_queue = JobQueue(results, 10, event_driven=True)
+        job_queue.set_resource_limits({'upload_megabytes': 600})
+        job_queue.append(jobs)
+        job_queue.close()
+        job_queue._prepare()
+
+        def finish(name):
+            job = [x for x in job_queue._running if x.name == name][0]
+            job.exitcode = 0
+            results[name] = True
+            job_queue._reap([job])
+
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['big1', 'small1', 'small2', 'small3'])
+
+        # Freed weight goes to the parked job that fits
+        finish('small1')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['big1', 'small2', 'small3'])
+
+        finish('big1')
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['big2', 'small2', 'small3'])
+        self.assertEqual(job_queue._resource_running, {'upload_megabytes': 504})
+
+    def testSchedulingAbort(self):
+        self.log.info('Testing that chains of running jobs continue after a failure')
+        results = {}
+
+        jobs = [
+          FakeJob('a1', 'host1'),
+          FakeJob('a2', 'host1', depends='a1'),
+          FakeJob('b1', 'host2'),
+          FakeJob('b2', 'host2', depends='b1'),
+          FakeJob('c1', 'host3', after=['a2']),
+          FakeJob('e1', 'host4', depends='missing'),
+        ]
+
+        job_queue = JobQueue(results, 2, event_driven=True)
+        job_queue.append(jobs)
+        job_queue.close()
+        job_queue._prepare()
+
+        self.assertTrue(job_queue._abort_flag)
+        self.assertEqual(job_queue._queued, set())
+
+        job_queue = JobQueue(results, 2, event_driven=True)
+        job_queue.append(jobs[:-1])
+        job_queue.close()
+        job_queue._prepare()
+        job_queue._fill()
+        self.assertEqual(sorted([x.name for x in job_queue._running]), ['a1', 'b1'])
+
+        jobs[0].exitcode = 0
+        results['a1'] = False
+        job_queue._reap([jobs[0]])
+
+        self.assertTrue(job_queue._abort_flag)
+        self.assertEqual([x.name for x in job_queue._queued], ['b2'])
+
 
 if __name__ == '__main__':
     unittest.main()
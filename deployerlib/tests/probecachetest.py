@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+
+import re
+import unittest
+
+from multiprocessing import Process
+
+from deployerlib.log import Log
+from deployerlib.probecache import ProbeCache, command_changes, affects
+from deployerlib.remotehost import RemoteHost
+from deployerlib.executor import Executor
+from deployerlib.commands import symlink, createdirectory
+
+
+class ProbeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+
+    def getHost(self, cache):
+        host = RemoteHost('host1', transport='simulated', probe_cache=cache)
+        host.checks = []
+        exists = host.transport.exists
+
+        def counted_exists(remote_file, **settings):
+            host.checks.append(remote_file)
+            return exists(remote_file, **settings)
+
+        host.transport.exists = counted_exists
+
+        return host
+
+    def testCommandChanges(self):
+        self.log.info('Testing the paths changed by commands')
+
+        self.assertEqual(command_changes('/bin/readlink /opt/webapps/service'), [])
+        self.assertEqual(command_changes('rm -rf /opt/webapps/_unpack'), ['/opt/webapps/_unpack'])
+        self.assertEqual(command_changes('mv /opt/webapps/_unpack/service_1 /opt/webapps/service_1'),
+          ['/opt/webapps/_unpack/service_1', '/opt/webapps/service_1'])
+        self.assertEqual(command_changes('mkdir -p /opt/webapps/_unpack'), ['/opt/webapps/_unpack', '/opt/webapps'])
+        self.assertEqual(command_changes('/bin/tar xzf /opt/tarballs/service_1.tar.gz -C /opt/webapps/_unpack'),
+          ['/opt/tarballs/service_1.tar.gz', '/opt/webapps/_unpack/'])
+        self.assertEqual(command_changes('echo "1" > /opt/properties/properties_version'), ['/opt/properties/properties_version'])
+
+        # Commands which could change anything
+        self.assertEqual(command_changes('/usr/local/bin/migrate /opt/webapps/service'), None)
+        self.assertEqual(command_changes('/usr/bin/svc -u /etc/service/service'), None)
+        self.assertEqual(command_changes('mkdir -p /tmp/x && /bin/bash -c "rm -rf /"'), None)
+
+    def testAffects(self):
+        self.log.info('Testing which probes are affected by a change')
+
+        self.assertTrue(affects('/opt/webapps/service', '/opt/webapps/service'))
+        self.assertTrue(affects('/opt/webapps', '/opt/webapps/service'))
+        self.assertFalse(affects('/opt/webapps/service', '/opt/webapps'))
+        self.assertFalse(affects('/opt/webapps/service', '/opt/webapps/service_1'))
+
+        # Changes to the contents of a directory
+        self.assertTrue(affects('/opt/webapps/_unpack/', '/opt/webapps/_unpack/service_1'))
+        self.assertFalse(affects('/opt/webapps/_unpack/', '/opt/webapps/_unpack'))
+        self.assertTrue(affects('/opt/tarballs/service_1.tar.gz', '/opt/tarballs/service_*'))
+        self.assertTrue(affects('/opt/tarballs/*', '/opt/tarballs/service_1.tar.gz'))
+        self.assertFalse(affects('/opt/tarballs/*', '/opt/tarballs'))
+
+    def testInvalidation(self):
+        self.log.info('Testing that probes are cached until their paths are changed')
+
+        host = self.getHost(ProbeCache())
+
+        self.assertTrue(host.file_exists('/opt/webapps/_unpack'))
+        self.assertTrue(host.file_exists('/opt/webapps/_unpack'))
+        self.assertEqual(host.checks, ['/opt/webapps/_unpack'])
+
+        # Unpacking into the directory does not change whether it exists
+        host.execute_remote('/bin/tar xzf /opt/tarballs/service_1.tar.gz -C /opt/webapps/_unpack')
+        self.assertTrue(host.file_exists('/opt/webapps/_unpack'))
+        self.assertEqual(len(host.checks), 1)
+
+        host.execute_remote('rm -rf /opt/webapps/_unpack')
+        self.assertFalse(host.file_exists('/opt/webapps/_unpack'))
+        self.assertEqual(len(host.checks), 2)
+
+        # Failed probes are not cached, they may not have reached the host
+        self.assertFalse(host.file_exists('/opt/webapps/_unpack'))
+        self.assertEqual(len(host.checks), 3)
+        host.transport.responses = [(re.compile('^/bin/ls '), (1, 'sudo: unable to resolve host'))]
+        self.assertTrue(host.execute_probe('/bin/ls -d /opt/webapps/service_1').failed)
+        host.transport.responses = []
+        self.assertTrue(host.execute_probe('/bin/ls -d /opt/webapps/service_1').succeeded)
+        self.assertTrue(host.execute_probe('/bin/ls -d /opt/webapps/service_1').succeeded)
+        self.assertEqual(host.transport.commands.count('/bin/ls -d /opt/webapps/service_1'), 2)
+
+        # A command the cache does not understand invalidates everything
+        host.execute_remote('/usr/local/bin/migrate')
+        self.assertFalse(host.file_exists('/opt/webapps/_unpack'))
+        self.assertEqual(len(host.checks), 4)
+
+        # A change that fails still invalidates the probes it may have affected
+        host.execute_remote('mkdir -p /opt/webapps/_unpack')
+        self.assertTrue(host.file_exists('/opt/webapps/_unpack'))
+
+        def failed_run(command, **settings):
+            raise IOError('Connection lost')
+
+        host.transport.run = failed_run
+
+        with self.assertRaises(IOError):
+            host.execute_remote('rm -rf /opt/webapps/_unpack')
+
+        self.assertEqual(host.probe_cache.get(('exists', '/opt/webapps/_unpack')), None)
+
+        # Without a cache every probe reaches the host
+        host = self.getHost(None)
+        host.file_exists('/opt/webapps/_unpack')
+        host.file_exists('/opt/webapps/_unpack')
+        self.assertEqual(len(host.checks), 2)
+
+    def testDeployChain(self):
+        self.log.info('Testing the probes of commands run twice on a host')
+
+        host = self.getHost(ProbeCache())
+
+        for attempt in range(2):
+            self.assertTrue(createdirectory.CreateDirectory(remote_host=host, source='/opt/webapps/_unpack').execute())
+            self.assertTrue(symlink.SymLink(remote_host=host, source='/opt/webapps/service_1',
+              destination='/opt/webapps/service').execute())
+
+        self.assertEqual(host.checks.count('/opt/webapps/_unpack'), 1)
+        self.assertEqual(host.transport.commands.count('/bin/ls -d /opt/webapps/service_1'), 1)
+
+        # The link was changed by the first attempt, so it is read again
+        self.assertEqual(host.transport.commands.count('/bin/readlink /opt/webapps/service'), 2)
+
+    def testSharedCache(self):
+        self.log.info('Testing that probes are shared between processes')
+
+        cache = ProbeCache()
+        host = self.getHost(cache)
+
+        process = Process(target=host.file_exists, args=['/opt/webapps/_unpack'])
+        process.start()
+        process.join()
+
+        self.assertTrue(host.file_exists('/opt/webapps/_unpack'))
+        self.assertEqual(host.checks, [])
+
+    def testConcurrentChange(self):
+        self.log.info('Testing that a probe racing a change is not cached')
+
+        cache = ProbeCache().host('host1')
+        key = ('exists', '/opt/webapps/_unpack')
+
+        generation = cache.generation()
+        cache.begin_change()
+        cache.put(key, ['/opt/webapps/_unpack'], True, generation)
+        self.assertEqual(cache.get(key), None)
+
+        # A result stored while the change runs is dropped when it ends
+        generation = cache.generation()
+        cache.put(key, ['/opt/webapps/_unpack'], True, generation)
+        self.assertTrue(cache.get(key))
+        cache.end_change(['/opt/webapps/_unpack'])
+        self.assertEqual(cache.get(key), None)
+
+    def testExecutor(self):
+        self.log.info('Testing that the tasks of an executor share a probe cache')
+
+        tasks = [{'command': 'createdirectory', 'remote_host': 'host1', 'source': '/opt/webapps/_unpack'}]
+        tasklist = {
+          'name': 'Probe cache',
+          'stages': [{'name': 'Stage {0}'.format(x), 'concurrency': 1, 'tasks': tasks} for x in range(2)],
+        }
+
+        executor = Executor(tasklist=tasklist, transport='simulated', probe_cache=True)
+        self.assertTrue(executor.run())
+        self.assertTrue(executor.probe_cache.host('host1').get(('exists', '/opt/webapps/_unpack')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+
+import unittest
+
+from deployerlib.log import Log
+from deployerlib.config import Config
+from deployerlib.executor import Executor
+from deployerlib.simulator import Simulator
+from deployerlib.exceptions import DeployerException
+
+
+class FakeDurations(object):
+    """Durations per task tag"""
+
+    def __init__(self, durations):
+        self.durations = durations
+
+    def estimate(self, key):
+        return self.durations.get(key[1])
+
+
+class SimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+
+    def tasklist(self, first_stage, second_stage=[]):
+
+        def task(tag):
+            return {'command': 'test_command', 'message': tag, 'tag': tag}
+
+        return {
+          'name': 'Simulation',
+          'stages': [
+            {'name': 'Stage 1', 'concurrency': 2, 'tasks': [task(x) for x in first_stage]},
+            {'name': 'Stage 2', 'concurrency': 1, 'tasks': [[task(x) for x in second_stage]]},
+          ],
+        }
+
+    def testStages(self):
+        self.log.info('Simulating stages one at a time')
+
+        durations = FakeDurations({'a': 4, 'b': 3, 'c': 2, 'd': 1, 'e': 1})
+        executor = Executor(tasklist=self.tasklist(['a', 'b', 'c', 'd'], ['e', 'f']))
+        report = Simulator(executor, durations=durations, default_duration=1).run()
+
+        self.assertEqual(report['total'], 7)
+        self.assertEqual([x['duration'] for x in report['stages']], [5, 2])
+        self.assertEqual(report['stages'][0]['utilisation'], 1.0)
+        self.assertEqual(report['utilisation'], 12.0 / 12)
+        self.assertEqual([x['stage'] for x in report['critical_path']], ['Stage 1', 'Stage 2', 'Stage 2'])
+        self.assertTrue(report['critical_path'][0]['waited'] > 0)
+        self.assertTrue(Simulator.format_report(report))
+
+    def testLongestFirst(self):
+        self.log.info('Simulating longest-first ordering')
+
+        durations = FakeDurations({'a': 1, 'b': 1, 'c': 4})
+        executor = Executor(tasklist=self.tasklist(['a', 'b', 'c']))
+
+        report = Simulator(executor, durations=durations).run()
+        self.assertEqual(report['stages'][0]['duration'], 5)
+
+        report = Simulator(executor, durations=durations, longest_first=True).run()
+        self.assertEqual(report['stages'][0]['duration'], 4)
+
+    def testAssumedDurations(self):
+        self.log.info('Simulating with assumed durations')
+
+        executor = Executor(tasklist=self.tasklist(['a', 'b', 'c'], ['d']), dag=True)
+        report = Simulator(executor, assumed={'test_command': 2}).run()
+
+        self.assertEqual(report['total'], 6)
+        self.assertEqual(report['critical_path'][-1]['stage'], 'Stage 2')
+
+    def testAdaptiveConcurrency(self):
+        self.log.info('Simulating a stage with adaptive concurrency')
+
+        tasklist = self.tasklist(['task{0}'.format(x) for x in range(40)])
+        executor = Executor(tasklist=tasklist)
+        fixed = Simulator(executor, assumed={'test_command': 1}).run()
+
+        tasklist['stages'][0]['max_concurrency'] = 10
+        executor = Executor(tasklist=tasklist)
+        adaptive = Simulator(executor, assumed={'test_command': 1}).run()
+
+        self.assertEqual(fixed['stages'][0]['duration'], 20)
+        self.assertTrue(adaptive['stages'][0]['duration'] < 10)
+
+    def testZeroConcurrency(self):
+        self.log.info('Simulating a stage that can never finish')
+
+        tasklist = self.tasklist(['a'])
+        tasklist['stages'][0]['concurrency'] = 0
+        executor = Executor(tasklist=tasklist)
+
+        with self.assertRaises(DeployerException):
+            Simulator(executor).run()
+
+    def testOverride(self):
+        self.log.info('Overriding config settings')
+
+        config = Config({'deploy_concurrency': 3, 'service_defaults': {'min_nodes_up': 1}})
+        config.override('deploy_concurrency=5')
+        config.override('service_defaults.min_nodes_up=2')
+
+        self.assertEqual(config.deploy_concurrency, 5)
+        self.assertEqual(config.service_defaults.min_nodes_up, 2)
+
+        with self.assertRaises(DeployerException):
+            config.override('missing.min_nodes_up=2')
+
+
+if __name__ == '__main__':
+    unittest.main()
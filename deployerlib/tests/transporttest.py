@@ -0,0 +1,190 @@
+#! /usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from deployerlib.log import Log
+from deployerlib.executor import Executor
+from deployerlib.remotehost import RemoteHost
+from deployerlib.transport import get_transport, rsync_bytes_sent
+from deployerlib.commands import movefile, symlink, upload, daemontools
+from deployerlib.exceptions import DeployerException
+
+
+class TransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def deploy(self, remote_host, path):
+        """Move a directory into place and link to it"""
+
+        unpacked = os.path.join(path, 'unpack', 'service-1')
+        installed = os.path.join(path, 'service-1')
+        link = os.path.join(path, 'service')
+
+        self.assertTrue(remote_host.execute_remote('mkdir -p {0}'.format(unpacked)).succeeded)
+        self.assertTrue(movefile.MoveFile(remote_host=remote_host, source=unpacked, destination=installed).execute())
+        self.assertTrue(symlink.SymLink(remote_host=remote_host, source=installed, destination=link).execute())
+        self.assertTrue(remote_host.file_exists(installed))
+        self.assertFalse(remote_host.file_exists(unpacked))
+
+        return link
+
+    def testLocal(self):
+        self.log.info('Testing the local transport')
+
+        remote_host = RemoteHost('localhost', transport='local')
+        link = self.deploy(remote_host, self.tmpdir)
+        self.assertEqual(os.readlink(link), 'service-1')
+
+        res = remote_host.execute_remote('echo hello; exit 2')
+        self.assertEqual((res, res.return_code, res.failed), ('hello', 2, True))
+
+        res = remote_host.put_remote(__file__, self.tmpdir)
+        self.assertTrue(res.succeeded)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmpdir, os.path.basename(__file__))))
+        self.assertTrue(remote_host.put_remote('/NO_SUCH_FILE', self.tmpdir).failed)
+
+    def testRsyncStats(self):
+        self.log.info('Testing the bytes sent according to rsync')
+
+        output = 'Number of files: 1\nTotal file size: 1,048,576 bytes\nTotal bytes sent: 12,345\nTotal bytes received: 35'
+        self.assertEqual(rsync_bytes_sent(output), 12345)
+        self.assertEqual(rsync_bytes_sent('Total bytes sent: 42'), 42)
+        self.assertEqual(rsync_bytes_sent(''), None)
+
+    def testFabricStream(self):
+        self.log.info('Testing streaming a file to a command over SSH')
+
+        class FakeChannel(object):
+            """An SSH channel to a command which writes a line of output for
+               every chunk it reads, and only reads when its output has been
+               received, or which exits after reading exit_after bytes
+            """
+
+            def __init__(self, exit_after=None):
+                self.exit_after = exit_after
+                self.received = 0
+                self.pending = []
+                self.exited = False
+
+            def set_combine_stderr(self, combine):
+                pass
+
+            def exec_command(self, command):
+                pass
+
+            def exit_status_ready(self):
+                return self.exited
+
+            def send_ready(self):
+                return not self.pending
+
+            def send(self, data):
+                self.received += len(data)
+                self.pending.append('read {0} bytes\n'.format(len(data)))
+
+                if self.exit_after is not None and self.received >= self.exit_after:
+                    self.pending.append('No space left on device\n')
+                    self.exited = True
+
+                return len(data)
+
+            def recv_ready(self):
+                return bool(self.pending)
+
+            def recv(self, size):
+                return self.pending.pop(0) if self.pending else ''
+
+            def shutdown_write(self):
+                self.exited = True
+
+            def recv_exit_status(self):
+                return 1 if self.exit_after is not None else 0
+
+            def close(self):
+                pass
+
+        from deployerlib.transports import fabricssh
+
+        transport = fabricssh.FabricTransport('host1')
+        transport.chunk_size = 1024
+        size = os.path.getsize(__file__)
+
+        for channel, succeeded in ((FakeChannel(), True), (FakeChannel(exit_after=2048), False)):
+            connection = mock.MagicMock()
+            connection.get_transport.return_value.open_session.return_value = channel
+
+            with mock.patch.object(fabricssh, 'connections', {'host1': connection}):
+                res = transport.stream(__file__, 'cat > /dev/null')
+
+            self.assertEqual(res.succeeded, succeeded)
+
+            if succeeded:
+                # The output was received while the file was sent
+                self.assertEqual(channel.received, size)
+                self.assertEqual(len(res.splitlines()), (size + 1023) / 1024)
+            else:
+                # A command which exits early fails the stream, with its output
+                self.assertEqual(channel.received, 2048)
+                self.assertIn('No space left on device', res)
+                self.assertEqual(res.return_code, 1)
+
+    def testSimulated(self):
+        self.log.info('Testing the simulated transport')
+
+        remote_host = RemoteHost('host1', transport='simulated', transport_settings={
+          'responses': {'^/bin/false$': (1, 'failed')}})
+        self.deploy(remote_host, '/opt')
+
+        transport = remote_host.transport
+        self.assertEqual(transport.paths['/opt/service'], ('link', 'service-1'))
+        self.assertTrue(remote_host.execute_remote('/bin/false').failed)
+        self.assertTrue(remote_host.execute_remote('/bin/true').succeeded)
+        self.assertTrue(remote_host.put_remote(__file__, '/tmp').succeeded)
+        self.assertTrue(remote_host.file_exists(os.path.join('/tmp', os.path.basename(__file__))))
+
+        # Files that have been uploaded can be checksummed
+        checksum = upload.Upload(remote_host=remote_host, source=__file__, destination='/tmp')
+        self.assertTrue(checksum.match_checksum())
+        self.assertTrue(remote_host.execute_remote('md5sum /tmp/not_uploaded').failed)
+
+        # Services are up until they are stopped
+        stop = daemontools.DaemonTools(remote_host=remote_host, action='stop', servicename='service', timeout=1)
+        self.assertTrue(stop.execute())
+        self.assertTrue('down' in remote_host.execute_remote('/usr/bin/svstat /etc/service/service'))
+
+        with self.assertRaises(DeployerException):
+            get_transport('no_such_transport', 'host1')
+
+    def testExecutor(self):
+        self.log.info('Executing a task list on simulated hosts')
+
+        def deploy(hostname):
+            return [
+              {'command': 'movefile', 'remote_host': hostname, 'source': '/opt/unpack/service-1', 'destination': '/opt/service-1'},
+              {'command': 'symlink', 'remote_host': hostname, 'source': '/opt/service-1', 'destination': '/opt/service'},
+            ]
+
+        tasklist = {
+          'name': 'Simulated hosts',
+          'stages': [
+            {'name': 'Deploy', 'concurrency': 10, 'tasks': [deploy('host{0}'.format(x)) for x in range(20)]},
+          ],
+        }
+
+        executor = Executor(tasklist=tasklist, event_driven=True, transport='simulated',
+          transport_settings={'latency': 0.01})
+        self.assertTrue(executor.run())
+
+
+if __name__ == '__main__':
+    unittest.main()
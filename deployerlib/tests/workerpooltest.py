@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+
+import time
+import unittest
+
+from deployerlib.log import Log
+from deployerlib.workerpool import WorkerPool, PoolJob
+
+
+def execute(name, descriptor):
+    return True
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = Log(self.__class__.__name__)
+        self.pool = WorkerPool(2, execute)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def run_jobs(self, hosts):
+        jobs = []
+
+        for host in hosts:
+            job = PoolJob(self.pool, 'job on {0} #{1}'.format(host, self.pool.dispatched + len(jobs)), {})
+            job._host = host
+            job.start()
+            jobs.append(job)
+
+        timeout = time.time() + 10
+
+        while [x for x in jobs if x.is_alive()] and time.time() < timeout:
+            time.sleep(0.01)
+
+        self.assertEqual([x.exitcode for x in jobs], [0] * len(jobs))
+
+    def testHostAffinity(self):
+        self.log.info('Testing that tasks go to a worker connected to their host')
+
+        self.run_jobs(['host1', 'host2'])
+        self.run_jobs(['host2', 'host1'])
+        self.run_jobs(['host1'])
+
+        self.assertEqual(sorted([sorted(x['hosts']) for x in self.pool._workers]), [['host1'], ['host2']])
+        self.assertEqual(self.pool.dispatched, 5)
+        self.assertEqual(self.pool.reused, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
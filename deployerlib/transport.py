@@ -0,0 +1,115 @@
+import re
+
+from deployerlib.log import Log
+from deployerlib.exceptions import DeployerException
+
+
+class CommandResult(str):
+    """The output of a command, with the attributes of a fabric result"""
+
+    def __new__(cls, output, return_code=0):
+        res = str.__new__(cls, output)
+        res.return_code = return_code
+        res.succeeded = return_code == 0
+        res.failed = not res.succeeded
+
+        return res
+
+
+class TransferResult(list):
+    """The files transferred by put or get, with the attributes of a fabric result
+       transferred is the number of bytes sent, if the transport knows it
+    """
+
+    def __init__(self, paths=[], failed=[], transferred=None):
+        list.__init__(self, paths)
+        self.failed = list(failed)
+        self.succeeded = not self.failed
+        self.transferred = transferred
+
+
+class Transport(object):
+    """How RemoteHost reaches a host
+
+       Transports should inherit this class and override its methods. The
+       results of run() and sudo() are expected to behave like a CommandResult,
+       and those of put() and get() like a TransferResult. Settings are
+       specific to a transport and are ignored by the others.
+    """
+
+    def __init__(self, hostname, username=None, ssh_private_key=None):
+        self.log = Log(self.__class__.__name__)
+        self.hostname = hostname
+        self.username = username
+        self.ssh_private_key = ssh_private_key
+
+    def __repr__(self):
+        return '{0}(hostname={1})'.format(self.__class__.__name__, repr(self.hostname))
+
+    def run(self, command, **settings):
+        """Run command on the host"""
+
+        raise DeployerException('{0} does not support running commands'.format(self.__class__.__name__))
+
+    def sudo(self, command, **settings):
+        """Run command on the host with sudo"""
+
+        raise DeployerException('{0} does not support sudo'.format(self.__class__.__name__))
+
+    def put(self, local_file, remote_dir, **settings):
+        """Upload local_file to remote_dir"""
+
+        raise DeployerException('{0} does not support uploads'.format(self.__class__.__name__))
+
+    def get(self, remote_path, local_path, **settings):
+        """Download remote_path to local_path"""
+
+        raise DeployerException('{0} does not support downloads'.format(self.__class__.__name__))
+
+    def sync(self, local_file, remote_file, **settings):
+        """Transfer local_file to remote_file, sending only the parts that
+           differ from what is already in remote_file, like rsync
+        """
+
+        raise DeployerException('{0} does not support syncing files'.format(self.__class__.__name__))
+
+    def stream(self, local_file, command, **settings):
+        """Run command with the contents of local_file as its standard input"""
+
+        raise DeployerException('{0} does not support streaming files'.format(self.__class__.__name__))
+
+    def exists(self, remote_file, **settings):
+        """Same test as fabric.contrib.files.exists, variables and wildcards are expanded"""
+
+        return self.run('test -e "$(echo {0})"'.format(remote_file), **settings).succeeded
+
+    def start_agent(self):
+        """Start an agent on the host and return its AgentClient"""
+
+        raise DeployerException('{0} does not support agents'.format(self.__class__.__name__))
+
+
+def rsync_bytes_sent(output):
+    """Return the bytes sent according to the output of rsync --stats, or None"""
+
+    match = re.search(r'^Total bytes sent: ([\d,.]+)', output, re.MULTILINE)
+
+    if match:
+        return int(re.sub(r'[,.]', '', match.group(1)))
+
+
+def get_transport(name, hostname, username=None, ssh_private_key=None, **transport_settings):
+    """Return a transport by name: ssh, local or simulated"""
+
+    from deployerlib.transports import fabricssh, local, simulated
+
+    transports = {
+      'ssh': fabricssh.FabricTransport,
+      'local': local.LocalTransport,
+      'simulated': simulated.SimulatedTransport,
+    }
+
+    if not name in transports:
+        raise DeployerException('Unknown transport: {0}'.format(name))
+
+    return transports[name](hostname, username, ssh_private_key, **transport_settings)
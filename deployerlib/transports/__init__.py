@@ -0,0 +1,8 @@
+import os
+
+__all__ = []
+
+for dirent in os.listdir(os.path.dirname(__file__)):
+
+    if dirent.endswith('.py') and not dirent.startswith('_'):
+        __all__.append(dirent[:-3])
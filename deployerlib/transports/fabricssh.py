@@ -0,0 +1,149 @@
+import select
+import socket
+
+from fabric.api import env
+from fabric.state import output, connections
+from fabric.contrib import files
+from fabric.contrib.project import rsync_project
+from fabric.context_managers import settings
+from fabric.operations import run, sudo, put, get
+
+from deployerlib.transport import Transport, CommandResult, TransferResult, rsync_bytes_sent
+from deployerlib.agentclient import AgentClient
+
+
+class FabricTransport(Transport):
+    """Reach a host over SSH with fabric"""
+
+    # Seconds between SSH keepalives, so connections kept open by worker
+    # processes are not dropped while they are idle
+    keepalive = 30
+
+    # Bytes sent at once by stream()
+    chunk_size = 256 * 1024
+
+    def __init__(self, hostname, username=None, ssh_private_key=None):
+        super(FabricTransport, self).__init__(hostname, username, ssh_private_key)
+
+        env.user = username
+        env.host_string = hostname
+
+        env.warn_only = True
+        env.abort_on_prompts = True
+        output.everything = False
+        env.parallel = False
+        env.serial = True
+        env.keepalive = self.keepalive
+
+        if ssh_private_key:
+            env.key_filename = ssh_private_key
+
+    def run(self, command, **fabric_settings):
+
+        with settings(**fabric_settings):
+            return run(command)
+
+    def sudo(self, command, **fabric_settings):
+
+        with settings(**fabric_settings):
+            return sudo(command, shell=False)
+
+    def put(self, local_file, remote_dir, **fabric_settings):
+
+        with settings(**fabric_settings):
+            return put(local_file, remote_dir)
+
+    def get(self, remote_path, local_path, **fabric_settings):
+
+        with settings(**fabric_settings):
+            return get(remote_path=remote_path, local_path=local_path)
+
+    def sync(self, local_file, remote_file, **fabric_settings):
+
+        with settings(host_string=self.hostname, **fabric_settings):
+            res = rsync_project(remote_file, local_file, default_opts='-t', extra_opts='--stats', capture=True)
+
+        self.log.hidebug('rsync: {0}'.format(res))
+
+        if res.failed:
+            self.log.debug('rsync of {0} failed: {1}'.format(local_file, res.stderr or res))
+            return TransferResult(failed=[local_file])
+
+        return TransferResult([remote_file], transferred=rsync_bytes_sent(res))
+
+    def stream(self, local_file, command, **fabric_settings):
+        """Send a local file to the standard input of a command over a new
+           channel of the host's SSH connection
+        """
+
+        with settings(host_string=self.hostname, **fabric_settings):
+            channel = connections[env.host_string].get_transport().open_session()
+
+        channel.set_combine_stderr(True)
+        channel.exec_command(command)
+
+        # The output is read while the file is sent, so a command writing a
+        # lot of it cannot stall the transfer by filling the channel window
+        output = []
+        interrupted = None
+
+        try:
+            with open(local_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), ''):
+
+                    while chunk:
+
+                        if channel.exit_status_ready():
+                            raise socket.error('Command exited before the whole file was sent')
+
+                        self._receive(channel, output)
+
+                        if channel.send_ready():
+                            sent = channel.send(chunk)
+
+                            if not sent:
+                                raise socket.error('Channel closed before the whole file was sent')
+
+                            chunk = chunk[sent:]
+                        else:
+                            # Wait for the window to open, or for output
+                            select.select([channel], [], [], 0.1)
+
+            channel.shutdown_write()
+        except (socket.error, IOError) as e:
+            interrupted = e
+
+        while True:
+            data = channel.recv(self.chunk_size)
+
+            if not data:
+                break
+
+            output.append(data)
+
+        return_code = channel.recv_exit_status()
+        channel.close()
+        output = ''.join(output).strip()
+
+        if interrupted:
+            self.log.debug('Failed to stream {0} to {1}: {2}'.format(local_file, command, interrupted))
+            output = '\n'.join([x for x in [output, str(interrupted)] if x])
+
+            if not return_code:
+                return_code = -1
+
+        return CommandResult(output, return_code)
+
+    def _receive(self, channel, output):
+        """Append the output which is waiting on a channel to output"""
+
+        while channel.recv_ready():
+            output.append(channel.recv(self.chunk_size))
+
+    def exists(self, remote_file, **fabric_settings):
+
+        with settings(**fabric_settings):
+            return files.exists(remote_file)
+
+    def start_agent(self):
+        return AgentClient.ssh(self.hostname)
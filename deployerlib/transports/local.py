@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+import subprocess
+
+from deployerlib.transport import Transport, CommandResult, TransferResult, rsync_bytes_sent
+from deployerlib.agentclient import AgentClient
+
+
+class LocalTransport(Transport):
+    """Run commands on the host the deployer runs on, in a local shell"""
+
+    shell = '/bin/bash'
+
+    def _execute(self, args):
+        self.log.hidebug('Executing locally: {0}'.format(args))
+
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        res = process.communicate()[0]
+
+        return CommandResult(res.strip(), process.returncode)
+
+    def run(self, command, **settings):
+        return self._execute([self.shell, '-c', command])
+
+    def sudo(self, command, **settings):
+        return self._execute(['sudo', '-n', self.shell, '-c', command])
+
+    def sync(self, local_file, remote_file, **settings):
+
+        try:
+            res = self._execute(['rsync', '-t', '--no-whole-file', '--stats', local_file, remote_file])
+        except OSError as e:
+            self.log.error('Failed to run rsync: {0}'.format(e))
+            return TransferResult(failed=[local_file])
+
+        if res.failed:
+            self.log.error('Failed to sync {0} to {1}: {2}'.format(local_file, remote_file, res))
+            return TransferResult(failed=[local_file])
+
+        return TransferResult([remote_file], transferred=rsync_bytes_sent(res))
+
+    def stream(self, local_file, command, **settings):
+
+        with open(local_file, 'rb') as f:
+            process = subprocess.Popen([self.shell, '-c', command], stdin=f, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            res = process.communicate()[0]
+
+        return CommandResult(res.strip(), process.returncode)
+
+    def _copy(self, source, destination):
+
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+
+        try:
+            shutil.copy(source, destination)
+        except (IOError, OSError) as e:
+            self.log.error('Failed to copy {0} to {1}: {2}'.format(source, destination, e))
+            return TransferResult(failed=[source])
+
+        return TransferResult([destination])
+
+    def put(self, local_file, remote_dir, **settings):
+        return self._copy(local_file, remote_dir)
+
+    def get(self, remote_path, local_path, **settings):
+        return self._copy(remote_path, local_path)
+
+    def start_agent(self):
+        return AgentClient.local(sys.executable)
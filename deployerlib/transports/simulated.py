@@ -0,0 +1,226 @@
+import os
+import re
+import time
+import hashlib
+
+from deployerlib.transport import Transport, CommandResult, TransferResult
+
+
+class SimulatedTransport(Transport):
+    """An in-memory host, for benchmarks and tests
+
+       Every operation takes latency seconds, and uploads also take their
+       size divided by bandwidth (in bytes per second) if it is set. A sync
+       to a file that already exists is assumed to send a small delta and
+       only takes latency seconds.
+
+       The files on the host are modelled well enough for the file commands:
+       mkdir -p, rm -rf, mv, cp, ln -s, readlink, ls -d, test -e and md5sum,
+       which gives the checksum of the local file that was uploaded. scp
+       copies files from other simulated hosts of the same process, with
+       their checksum; files copied from any other host have no checksum.
+       Daemontools services are started and stopped with svc and report
+       their state with svstat. Paths that have not been created or removed
+       are assumed to exist, and services that have not been controlled are
+       assumed to be up, as the state of a simulated host is lost when the
+       process of a task exits.
+       Other commands succeed without output, unless they match one of the
+       regular expressions in responses, which maps them to a tuple of
+       (return_code, output).
+    """
+
+    # Simulated hosts of this process by hostname, which scp can copy from
+    hosts = {}
+
+    def __init__(self, hostname, username=None, ssh_private_key=None, latency=0.0, bandwidth=None, responses={}):
+        super(SimulatedTransport, self).__init__(hostname, username, ssh_private_key)
+        SimulatedTransport.hosts[hostname] = self
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.responses = [(re.compile(x), y) for x, y in responses.items()]
+        self.paths = {}
+        self.checksums = {}
+        self.services = {}
+        self.commands = []
+
+        self._handlers = [
+          (re.compile(r'^(?:/bin/)?rm -rf? (\S+)$'), self._remove),
+          (re.compile(r'^(?:/bin/)?mkdir -p (\S+)$'), self._mkdir),
+          (re.compile(r'^(?:/bin/)?mv (\S+) (\S+)$'), self._move),
+          (re.compile(r'^(?:/bin/)?cp(?: -\S+)* (\S+) (\S+)$'), self._copy),
+          (re.compile(r'^(?:/bin/)?ln -s (\S+) (\S+)$'), self._link),
+          (re.compile(r'^(?:/bin/)?readlink (\S+)$'), self._readlink),
+          (re.compile(r'^(?:/bin/)?ls -d (\S+)$'), self._list),
+          (re.compile(r'^test -e "\$\(echo (\S+)\)"$'), self._test),
+          (re.compile(r'^(?:/usr/bin/)?md5sum (\S+)$'), self._checksum),
+          (re.compile(r'^(?:/usr/bin/)?scp (?:.* )?(?:[^\s@]+@)?([^\s@:]+):(\S+) (\S+)$'), self._copy_from),
+          (re.compile(r'^(?:/usr/bin/)?svc -([udk]) /etc/service/(\S+)$'), self._control),
+          (re.compile(r'^(?:/usr/bin/)?svstat /etc/service/(\S+)$'), self._service_state),
+        ]
+
+    def _wait(self, seconds=0.0):
+
+        if self.latency + seconds > 0:
+            time.sleep(self.latency + seconds)
+
+    def path_exists(self, path):
+        return self.paths.get(path.rstrip('/') or '/', True) is not None
+
+    def run(self, command, **settings):
+        self._wait()
+        self.commands.append(command)
+
+        for pattern, (return_code, output) in self.responses:
+            if pattern.search(command):
+                return CommandResult(output, return_code)
+
+        for pattern, handler in self._handlers:
+            match = pattern.match(command.strip())
+
+            if match:
+                return handler(*[x.rstrip('/') or '/' for x in match.groups()])
+
+        return CommandResult('')
+
+    def sudo(self, command, **settings):
+        return self.run(command, **settings)
+
+    def put(self, local_file, remote_dir, **settings):
+
+        if self.bandwidth and os.path.isfile(local_file):
+            self._wait(float(os.path.getsize(local_file)) / self.bandwidth)
+        else:
+            self._wait()
+
+        destination = os.path.join(remote_dir, os.path.basename(local_file))
+        self.paths[destination] = 'file'
+
+        with open(local_file, 'rb') as f:
+            self.checksums[destination] = hashlib.md5(f.read()).hexdigest()
+
+        return TransferResult([destination])
+
+    def sync(self, local_file, remote_file, **settings):
+
+        if self.paths.get(remote_file) == 'file':
+            self._wait()
+
+            with open(local_file, 'rb') as f:
+                self.checksums[remote_file] = hashlib.md5(f.read()).hexdigest()
+
+            return TransferResult([remote_file])
+
+        return self.put(local_file, os.path.dirname(remote_file), **settings)
+
+    def stream(self, local_file, command, **settings):
+
+        if self.bandwidth and os.path.isfile(local_file):
+            self._wait(float(os.path.getsize(local_file)) / self.bandwidth)
+
+        return self.run(command)
+
+    def get(self, remote_path, local_path, **settings):
+        self._wait()
+
+        if not self.path_exists(remote_path):
+            return TransferResult(failed=[remote_path])
+
+        return TransferResult([local_path])
+
+    def exists(self, remote_file, **settings):
+        self._wait()
+
+        return self.path_exists(remote_file)
+
+    def _remove(self, path):
+        self.paths[path] = None
+        return CommandResult('')
+
+    def _mkdir(self, path):
+        self.paths[path] = 'dir'
+        return CommandResult('')
+
+    def _move(self, source, destination):
+
+        if not self.path_exists(source):
+            return CommandResult("mv: cannot stat '{0}': No such file or directory".format(source), 1)
+
+        self.paths[destination] = self.paths.get(source, 'dir')
+        self.paths[source] = None
+
+        if source in self.checksums:
+            self.checksums[destination] = self.checksums.pop(source)
+
+        return CommandResult('')
+
+    def _copy(self, source, destination):
+
+        if not self.path_exists(source.rstrip('*').rstrip('/') or '/'):
+            return CommandResult("cp: cannot stat '{0}': No such file or directory".format(source), 1)
+
+        self.paths[destination] = self.paths.get(source, 'dir')
+        self.checksums.pop(destination, None)
+
+        if source in self.checksums:
+            self.checksums[destination] = self.checksums[source]
+
+        return CommandResult('')
+
+    def _copy_from(self, peer, source, destination):
+        host = self.hosts.get(peer)
+
+        if host and not host.path_exists(source):
+            return CommandResult('scp: {0}: No such file or directory'.format(source), 1)
+
+        self.paths[destination] = 'file'
+        self.checksums.pop(destination, None)
+
+        if host and source in host.checksums:
+            self.checksums[destination] = host.checksums[source]
+
+        return CommandResult('')
+
+    def _link(self, source, destination):
+
+        if type(self.paths.get(destination)) is tuple:
+            return CommandResult("ln: failed to create symbolic link '{0}': File exists".format(destination), 1)
+
+        self.paths[destination] = ('link', source)
+
+        return CommandResult('')
+
+    def _readlink(self, path):
+        state = self.paths.get(path)
+
+        if type(state) is tuple:
+            return CommandResult(state[1])
+
+        return CommandResult('', 1)
+
+    def _list(self, path):
+
+        if self.path_exists(path):
+            return CommandResult(path)
+
+        return CommandResult("ls: cannot access '{0}': No such file or directory".format(path), 2)
+
+    def _test(self, path):
+        return CommandResult('', 0 if self.path_exists(path) else 1)
+
+    def _checksum(self, path):
+
+        if self.paths.get(path) == 'file' and path in self.checksums:
+            return CommandResult('{0}  {1}'.format(self.checksums[path], path))
+
+        return CommandResult('md5sum: {0}: No such file or directory'.format(path), 1)
+
+    def _control(self, action, servicename):
+        self.services[servicename] = 'up' if action == 'u' else 'down'
+        return CommandResult('')
+
+    def _service_state(self, servicename):
+
+        if self.services.get(servicename, 'up') == 'up':
+            return CommandResult('/etc/service/{0}: up (pid 1000) 1 seconds'.format(servicename))
+
+        return CommandResult('/etc/service/{0}: down 1 seconds, normally up'.format(servicename))
@@ -0,0 +1,234 @@
+import signal
+
+from multiprocessing import Process, Pipe
+
+from fabric.network import disconnect_all
+from fabric.context_managers import settings
+
+from deployerlib.log import Log
+
+
+class WorkerPool(object):
+    """A fixed number of long-lived worker processes
+
+       Rather than forking a process for each task, task descriptors are sent
+       to idle workers over a pipe. Workers are not disconnected between tasks,
+       so fabric's connection cache keeps their SSH connections open for the
+       next task on the same host. Tasks are preferably handed to a worker that
+       is already connected to their host, so all tasks on a host share one
+       connection for the whole run unless they run at the same time.
+
+       execute is called inside the worker as execute(name, descriptor).
+    """
+
+    def __init__(self, size, execute):
+        self.log = Log(self.__class__.__name__)
+        self.size = size
+        self.execute = execute
+        self._workers = []
+        self._backlog = []
+        self._started = False
+        self.dispatched = 0
+        self.reused = 0
+
+    def __len__(self):
+        return len(self._workers)
+
+    def start(self):
+        """Fork the worker processes"""
+
+        if self._started:
+            return
+
+        for i in range(self.size):
+            self._spawn()
+
+        self._started = True
+        self.log.debug('Started {0} workers'.format(len(self._workers)))
+
+    def close(self):
+        """Ask the workers to exit, terminating any that do not"""
+
+        if self.dispatched:
+            self.log.debug('Reused a connection for {0} of {1} tasks'.format(self.reused, self.dispatched))
+
+        for worker in self._workers:
+            try:
+                worker['conn'].send(None)
+            except (IOError, OSError):
+                pass
+
+        for worker in self._workers:
+            worker['process'].join(5)
+
+            if worker['process'].is_alive():
+                self.log.warning('Terminating worker {0}'.format(worker['process'].name))
+                worker['process'].terminate()
+
+            worker['conn'].close()
+
+        self._workers = []
+        self._started = False
+
+    def submit(self, job):
+        """Queue a job to be executed by the next idle worker"""
+
+        self._backlog.append(job)
+        self._dispatch()
+
+    def poll(self):
+        """Collect results from workers and hand queued jobs to idle workers"""
+
+        for worker in list(self._workers):
+            job = worker['job']
+
+            if not job:
+                continue
+
+            if worker['conn'].poll():
+
+                try:
+                    worker['conn'].recv()
+                    job._finish(0)
+                    worker['job'] = None
+                    continue
+                except EOFError:
+                    pass
+
+            elif worker['process'].is_alive():
+                continue
+
+            # The worker exited while running a job
+            self.log.error('Worker {0} died while executing {1}'.format(worker['process'].name, job.name))
+            job._finish(1)
+            self._replace(worker)
+
+        self._dispatch()
+
+    def _spawn(self):
+        """Start a single worker process"""
+
+        parent_conn, child_conn = Pipe()
+        name = '{0}-{1}'.format(self.__class__.__name__, len(self._workers) + 1)
+
+        process = Process(target=self._serve, name=name, args=[child_conn])
+        process.daemon = True
+        process.start()
+        child_conn.close()
+
+        worker = {'process': process, 'conn': parent_conn, 'job': None, 'hosts': set()}
+        self._workers.append(worker)
+
+        return worker
+
+    def _replace(self, worker):
+        """Replace a dead worker with a new one"""
+
+        self._workers.remove(worker)
+        worker['conn'].close()
+        worker['process'].join(1)
+        self._spawn()
+
+    def _dispatch(self):
+        """Hand jobs from the backlog to idle workers"""
+
+        while self._backlog:
+            idle = [x for x in self._workers if not x['job']]
+
+            if not idle:
+                break
+
+            job = self._backlog.pop(0)
+            worker = self._pick_worker(idle, job._host)
+            worker['job'] = job
+            job._worker = worker
+
+            self.dispatched += 1
+
+            if job._host in worker['hosts']:
+                self.reused += 1
+            else:
+                worker['hosts'].add(job._host)
+
+            self.log.hidebug('Dispatching {0} to {1}'.format(job.name, worker['process'].name))
+            worker['conn'].send((job.name, job._host, job.descriptor))
+
+    def _pick_worker(self, idle, host):
+        """Choose an idle worker that is connected to host, or else the one connected to the fewest hosts"""
+
+        for worker in idle:
+            if host in worker['hosts']:
+                return worker
+
+        return min(idle, key=lambda x: len(x['hosts']))
+
+    def _serve(self, conn):
+        """Worker main loop: execute task descriptors until told to stop"""
+
+        # Let the parent handle keyboard interrupts and abort the queue cleanly
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        while True:
+
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+
+            if message is None:
+                break
+
+            name, host, descriptor = message
+
+            try:
+                with settings(clean_revert=True, host_string=host, host=host):
+                    self.execute(name, descriptor)
+            except Exception as e:
+                self.log.critical('Unhandled exception executing {0}: {1}'.format(name, e))
+
+            conn.send(name)
+
+        disconnect_all()
+        conn.close()
+
+
+class PoolJob(object):
+    """A job to be run by a WorkerPool, scheduled by JobQueue like a Process"""
+
+    def __init__(self, pool, name, descriptor):
+        self.pool = pool
+        self.name = name
+        self._name = name
+        self.descriptor = descriptor
+        self.exitcode = None
+        self._worker = None
+        self._started = False
+
+    def __repr__(self):
+        return '{0}(name={1})'.format(self.__class__.__name__, repr(self.name))
+
+    def start(self):
+        self._started = True
+        self.pool.submit(self)
+
+    def is_alive(self):
+
+        if not self._started or self.exitcode is not None:
+            return False
+
+        self.pool.poll()
+
+        return self.exitcode is None
+
+    def join(self, timeout=None):
+        pass
+
+    def fileno(self):
+        """The pipe on which the result will arrive, for use with select()"""
+
+        if self._worker and self.exitcode is None:
+            return self._worker['conn'].fileno()
+
+    def _finish(self, exitcode):
+        self.exitcode = exitcode
+        self._worker = None
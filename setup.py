@@ -20,7 +20,7 @@ setup(
     license="GPL",
     keywords="python software deployment",
     url="https://github.scm.corp.ebay.com/ecg-marktplaats/software-deployer",
-    packages=['deployerlib', 'deployerlib.commands', 'deployerlib.generators', 'deployerweb', 'deployerweb.migrations'],
+    packages=['deployerlib', 'deployerlib.commands', 'deployerlib.generators', 'deployerlib.transports', 'deployerweb', 'deployerweb.migrations'],
     include_package_data=True,
     zip_safe=False,
     long_description=read('README.md'),